@@ -2,9 +2,36 @@
 
 'Utility tests.'
 
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import contextlib
+from io import StringIO
 from util import LinkChecker, EmojiChecker, TocChecker, ImageFileChecker, Summary
-from util.check_links import get_section_link
-from util.summary import color
+from util.check_links import get_section_link, ExtractedLinks
+from util.check_emoji import extract_emoji
+from util.redirects import RedirectIndex
+from util.slugger import slug, get_file_sections
+from util.workspace import Workspace
+from util.server import CheckServer
+from util.results_db import ResultsStore
+from util.link_index import LinkIndex
+from util import baseline
+from util.optimize_images import ImageOptimizer, get_page_savings
+from util.image_fingerprints import BKTree, ImageFingerprintIndex
+from util.image_stats import ImageStats
+from util.html_report import write_html_report
+from util.metrics import format_metrics, format_sample
+from util.shards import assign_shards, result_order, get_shard_dir, ShardFilter
+from util.schedule import TimingHistory, get_toc_key
+from util.api import run_checks as run_api_checks
+from util.walk import get_relative_filename
+from util.cli import main as cli_main
+from util import versions
+from util.summary import color, StopChecks
 
 
 def assert_eq(what, result, expected):
@@ -72,6 +99,9 @@ def test_link_checker():
             'https://test.farm.bot/page',
         ],
     })
+    assert_eq('resolution cache',
+              summary.arbitrary_data['test'].get('resolution_cache'),
+              {'hits': 5, 'misses': 8})
 
 
 def test_check_links_extras():
@@ -80,6 +110,56 @@ def test_check_links_extras():
     assert_eq('section_link', section_link, 'header-12')
 
 
+SLUG_CORPUS = [
+    ('Hello World', 'hello-world'),
+    (' Header 1.2!\n', 'header-12'),
+    ('foo_bar-baz', 'foo_bar-baz'),
+    ('What is *this*?', 'what-is-this'),
+    ('Use `pip install` now', 'use-pip-install-now'),
+    ('Use `a.b()` here', 'use-ab-here'),
+    ('[FarmBot](https://farm.bot) setup', 'farmbot-setup'),
+    ('![icon](icon.png) Icons', '-icons'),
+    ('<b>Bold</b> text', 'bold-text'),
+    ('Step 1: Mount :smile:', 'step-1-mount-'),
+    ('Emoji \U0001F680 rocket', 'emoji--rocket'),
+    ('Caf\u00e9 & Cr\u00e8me', 'caf\u00e9--cr\u00e8me'),
+    ('C# basics', 'c-basics'),
+    ('Multiple   spaces', 'multiple---spaces'),
+    ('100%', '100'),
+]
+
+
+def test_slugger():
+    'test GitHub compatible section anchors'
+    for header, expected in SLUG_CORPUS:
+        assert_eq(f'slug of {header!r}', slug(header), expected)
+    lines = ['# A\n', '```\n', '# Not a header\n', '```\n', '## A\n',
+             '### A ###\n', '# A-1\n', '####### Seven\n', '#tag\n',
+             '###### Six\n']
+    assert_eq('file sections', get_file_sections(lines),
+              ['a', 'a-1', 'a-2', 'a-1-1', 'six'])
+
+
+def test_content_reuse():
+    'test reuse of extraction results for identical file content'
+    root = 'test_fixtures/farmbot-test/v1/docs'
+    with open(f'{root}/v1_docs.md') as md_file:
+        lines = md_file.readlines()
+    summary = Summary()
+    link_checker = LinkChecker(summary, 'test_fixtures')
+    emoji_checker = EmojiChecker(summary, 'test_fixtures')
+    for checker in [link_checker, emoji_checker]:
+        checker.start_hub('test')
+        checker.check_file(root, 'v1_docs.md', lines)
+        checker.check_file(root, 'v1_docs.md', list(lines))
+        assert_eq('reuse stats', checker.content_cache.stats,
+                  {'files': 2, 'reused': 1})
+    for results in [link_checker.links['test'], emoji_checker.emojis['test']]:
+        half = len(results) // 2
+        assert_eq('reused results', results[half:], results[:half])
+    assert_eq('reused link count', len(link_checker.links['test']), 46)
+
+
 def test_emoji_checker():
     'test EmojiChecker'
     summary = Summary()
@@ -111,6 +191,21 @@ def test_emoji_checker():
               summary.arbitrary_data['test'].get('lines_skipped'), 4)
 
 
+def test_emoji_scanner():
+    'test emoji shortcode extraction'
+    lines = [
+        'Note: :smile: after a colon\n',
+        'At 10:30:00 and 12:00:01 :clock1:\n',
+        'See https://example.com/:x:y: and `:not_emoji:` :heart:\n',
+        ':smile::+1: :11: :-----: :backups: word:wave:\n',
+        'single: colon\n',
+        'std::vector::size and a::b::c but not::ok: :tada:\n',
+    ]
+    assert_eq('scanned emoji', extract_emoji(lines)['emoji'], [
+        (0, 'smile'), (1, 'clock1'), (2, 'heart'),
+        (3, 'smile'), (3, '+1'), (3, 'wave'), (5, 'tada')])
+
+
 def test_toc_checker():
     'test TocChecker'
     summary = Summary()
@@ -157,6 +252,642 @@ def test_toc_checker():
     assert_eq('broken part image count', broken_part_path_count, 1)
 
 
+def test_redirect_index():
+    'test RedirectIndex'
+    index = RedirectIndex('test_fixtures/farmbot-test', 'v1')
+    assert_eq('missing', index.missing([
+        'test_fixtures/farmbot-test/v1/docs/v1_docs.md',
+        'test_fixtures/farmbot-test/v1/docs/other_page.md',
+    ]), ['test_fixtures/farmbot-test/v1/docs/other_page.md'])
+    assert_eq('taken by', index.taken_by(
+        'test_fixtures/farmbot-test/v1/bom/folder/page.md'),
+        'test_fixtures/farmbot-test/v1/docs/v1_docs.md')
+    assert_eq('lookup', index.lookup_table(), {
+        '/docs/missing': '/v1/docs/missing',
+        '/docs/page': '/v1/docs/v1_docs',
+    })
+
+    index.page_paths = {'a.md': '/x/b', 'b.md': '/y/c', 'c.md': '/z/a',
+                        'd.md': '/x/b', 'e.md': '/y/a'}
+    index.by_slug = {k: index.page_filepath(v)
+                     for k, v in index.page_paths.items()}
+    chains, cycles = index.chains_and_cycles()
+    assert_eq('chains', chains, [])
+    assert_eq('cycles', cycles, [['a', 'b', 'c', 'a']])
+    index.page_paths['c.md'] = '/z/f'
+    index.by_slug['c.md'] = index.page_filepath('/z/f')
+    chains, cycles = index.chains_and_cycles()
+    assert_eq('chains', chains, [['d', 'b', 'c'], ['e', 'a', 'b', 'c']])
+    assert_eq('cycles', cycles, [])
+
+
+def test_workspace():
+    'test Workspace'
+    workspace = Workspace('test_fixtures', ['test'])
+    workspace.load()
+    page = 'test_fixtures/farmbot-test/v1/docs/v1_docs.md'
+    assert_eq('issue count', len(workspace.issues(page)), 9)
+
+    with open(page, 'r') as md_file:
+        lines = md_file.readlines()
+    edited = [line.replace('v2-docs', 'v1-docs') for line in lines]
+    checked, _ = workspace.recheck(page, edited)
+    assert_eq('issue count', len(checked[page]), 8)
+
+    edited = [line.replace('# section_name', '# renamed') for line in edited]
+    checked, _ = workspace.recheck(page, edited)
+    assert_eq('checked files', list(checked), [page])
+    assert_eq('sections', workspace.link_checker.section_index['test'][
+        os.path.realpath(page)], ['v1-docs', 'renamed'])
+
+
+def test_check_server():
+    'test CheckServer'
+    server = CheckServer('test_fixtures', ['test'])
+    page = 'test_fixtures/farmbot-test/v1/docs/v1_docs.md'
+
+    def _request(method, params):
+        request = {'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params}
+        return json.loads(server.handle_line(json.dumps(request)))
+
+    anchors = _request('listAnchors', {'path': page, 'link': '../docs/v1_docs.md'})
+    assert_eq('anchors', anchors['result']['anchors'], ['v1-docs', 'section_name'])
+    checked = _request('checkFile', {'path': page, 'text': '# v1 Docs\n[a](#v2)\n'})
+    assert_eq('diagnostics', checked['result']['files'][page], [{
+        'line': 1, 'message': 'section missing in linked file',
+        'target': '#v2', 'issues': ['section_missing']}])
+    saved = server.workspace.normalize(page)
+    assert_eq('saved issues', len(server.workspace.issues(saved)), 9)
+    assert_eq('saved title', server.workspace.titles[saved], 'title: "v1 Docs"\n')
+    anchors = _request('listAnchors', {'path': page})
+    assert_eq('saved anchors', anchors['result']['anchors'], ['v1-docs', 'section_name'])
+    hub = _request('checkHub', {'hub': 'test'})
+    assert_eq('hub files', len(hub['result']['files'][page]), 9)
+    unknown = _request('unknown', {})
+    assert_eq('error code', unknown['error']['code'], -32601)
+
+
+def test_results_store():
+    'test ResultsStore'
+    results_db = ResultsStore(':memory:')
+    summary = Summary(results_db)
+    LinkChecker(summary, 'test_fixtures').check_all(['test'])
+    ImageFileChecker(summary, 'test_fixtures').check_all(['test'])
+
+    broken_images = results_db.select('links', issues_only=True,
+                                      hub='test', version=1, type='image')
+    assert_eq('broken images', [l['target'] for l in broken_images],
+              ['missing.jpg', 'broken image (odd).JPG'])
+    links_to = results_db.select('links', 'source', target_absolute='v1/docs/v1_docs.md')
+    assert_eq('links to page', len(links_to), 9)
+    assert_eq('issue counts', results_db.issue_counts(), [
+        {'result': 'links', 'hub': 'test', 'version': '1.0', 'issues': 7}])
+    assert_eq('images', len(results_db.select('images', hub='test')), 3)
+    assert_eq('issue counts by source', results_db.issue_counts(['source']), [
+        {'result': 'links', 'source': 'v1/docs/v1_docs.md', 'issues': 7}])
+    with contextlib.redirect_stderr(StringIO()):
+        try:
+            cli_main(['query', 'counts', '--by', 'hub,foo'])
+            usage_error = None
+        except SystemExit as error:
+            usage_error = error.code
+    assert_eq('invalid --by usage error', usage_error, 2)
+
+
+def test_issues_only():
+    'test issues-only result lists'
+    printed = []
+    for issues_only in [False, True]:
+        summary = Summary(issues_only=issues_only)
+        for Checker in [TocChecker, EmojiChecker, LinkChecker, ImageFileChecker]:
+            Checker(summary, 'test_fixtures').check_all(['test'])
+        output = StringIO()
+        with contextlib.redirect_stdout(output):
+            summary.print()
+        printed.append(output.getvalue())
+        if issues_only:
+            assert_eq('kept links', len(summary.results['links']['test']), 7)
+            assert_eq('kept emoji', len(summary.results['emoji']['test']), 2)
+    assert_eq('summary output', printed[1], printed[0])
+
+
+def test_version_policy():
+    'test VersionPolicy'
+    policy = versions.VersionPolicy(only_versions={1.0})
+    assert_eq('v1 level', policy.level('test', 'v1'), versions.FULL)
+    assert_eq('v2 level', policy.level('test', 'v2'), versions.SKIP)
+
+    versions.HUB_STABLE_VERSIONS[('.', 'genesis')] = [1.6]
+    policy = versions.VersionPolicy()
+    assert_eq('stable level', policy.level('genesis', 'v1.6'), versions.FULL)
+    assert_eq('unstable level', policy.level('genesis', 'v1.5'), versions.LIGHT)
+    policy = versions.VersionPolicy(unstable=versions.SKIP)
+    assert_eq('skipped level', policy.level('genesis', 'v1.5'), versions.SKIP)
+    del versions.HUB_STABLE_VERSIONS[('.', 'genesis')]
+
+    link_checker = LinkChecker(Summary(), 'test_fixtures')
+    link_checker.version_policy = versions.VersionPolicy(only_versions={2.0})
+    link_checker.check_all(['test'])
+    assert_eq('links in skipped versions', link_checker.links['test'], [])
+
+    with tempfile.TemporaryDirectory() as folder:
+        shutil.copytree('test_fixtures/farmbot-test', f'{folder}/farmbot-test')
+        os.makedirs(f'{folder}/farmbot-test/v2/docs')
+        with open(f'{folder}/farmbot-test/v2/docs/new.md', 'w') as page:
+            page.write('[ok](../../v1/docs/v1_docs.md#v1-docs)\n'
+                       '[broken](../../v1/docs/v1_docs.md#v2-docs)\n')
+        link_checker = LinkChecker(Summary(), folder)
+        link_checker.quiet = True
+        link_checker.version_policy = versions.VersionPolicy(
+            only_versions={2.0}, folder=folder)
+        link_checker.check_all(['test'])
+        assert_eq('sections in skipped versions',
+                  [link['issues'] for link in link_checker.links['test']],
+                  [[], ['section_missing']])
+
+
+def test_cli():
+    'test command line interface'
+    exit_code = cli_main(['links', '--hub', 'test', '--folder', 'test_fixtures'])
+    assert_eq('links exit code', exit_code, 1)
+    exit_code = cli_main(['emoji', '--hub', 'test', '--folder', 'test_fixtures',
+                          '--version', 'v2'])
+    assert_eq('emoji exit code', exit_code, 0)
+    with contextlib.redirect_stderr(StringIO()):
+        try:
+            cli_main(['links', '--version', 'latest'])
+            usage_error = None
+        except SystemExit as error:
+            usage_error = error.code
+    assert_eq('invalid version usage error', usage_error, 2)
+    with contextlib.redirect_stderr(StringIO()):
+        try:
+            cli_main(['images', '--optimize', '--max-size', '12'])
+            usage_error = None
+        except SystemExit as error:
+            usage_error = error.code
+    assert_eq('invalid max size usage error', usage_error, 2)
+
+    imported = subprocess.run(
+        [sys.executable, '-c', 'import sys, util.cli, util.check_links, util.summary;'
+         'print(sorted({"yaml", "imagesize", "urllib.request"} & set(sys.modules)))'],
+        capture_output=True, text=True, check=True)
+    assert_eq('heavy modules imported', imported.stdout.strip(), '[]')
+
+
+def get_link_summary(args):
+    'get the link summary counts printed by a command line run'
+    output = StringIO()
+    with contextlib.redirect_stdout(output):
+        cli_main(args)
+    text = output.getvalue()
+    return text[text.index('LINK SUMMARY'):text.index('BROKEN LINKS')]
+
+
+def test_shards():
+    'test sharded checks and merging'
+    assignments = assign_shards({'a': 9, 'b': 5, 'c': 4, 'd': 3, 'e': 1}, 2)
+    assert_eq('shard assignments', assignments,
+              {'a': 0, 'b': 1, 'c': 1, 'd': 0, 'e': 1})
+
+    options = ['--hub', 'test', '--folder', 'test_fixtures']
+    with contextlib.redirect_stdout(StringIO()):
+        exit_codes = [cli_main(['all', '--shard', f'{i}/3'] + options)
+                      for i in [1, 2, 3]]
+        merge_exit_code = cli_main(['merge'] + options)
+        merged = {key: summary_results(key) for key in ['toc', 'emoji', 'links']}
+        full_exit_code = cli_main(['all'] + options)
+        full = {key: summary_results(key) for key in ['toc', 'emoji', 'links']}
+    for i in [1, 2, 3]:
+        shutil.rmtree(get_relative_filename(get_shard_dir(i - 1, 3)))
+    assert_eq('some shard failed', max(exit_codes), 1)
+    assert_eq('merge exit code', merge_exit_code, full_exit_code)
+    for key, results in full.items():
+        assert_eq(f'merged {key} results', merged[key],
+                  {hub: sorted(r, key=result_order) for hub, r in results.items()})
+
+    redirects_filename = get_relative_filename('results/test_redirects.json')
+    os.remove(redirects_filename)
+    with contextlib.redirect_stdout(StringIO()):
+        for i in [1, 2]:
+            cli_main(['all', '--issues-only', '--shard', f'{i}/2'] + options)
+    merged_summary = get_link_summary(['merge'] + options)
+    for i in [1, 2]:
+        shutil.rmtree(get_relative_filename(get_shard_dir(i - 1, 2)))
+    assert_eq('issues-only merged link summary', merged_summary,
+              get_link_summary(['links'] + options))
+    assert_eq('merged redirects', os.path.exists(redirects_filename), True)
+
+
+def test_baseline():
+    'test issue fingerprints and baseline comparison'
+    summary = Summary()
+    for Checker in [TocChecker, EmojiChecker, LinkChecker, ImageFileChecker]:
+        Checker(summary, 'test_fixtures').check_all(['test'])
+    issues = baseline.collect_issues(summary)
+    assert_eq('issue count', len(issues), 16)
+    checks = sorted({issue['check'] for issue in issues.values()})
+    assert_eq('issue checks', checks, ['emoji', 'links', 'toc'])
+    hover_issue = baseline.get_fingerprint(
+        'toc', 'test', 'v1/docs/not_found.md', '', 'broken_hover_image')
+    assert_eq('hover image fingerprint', hover_issue in issues, True)
+    toc_issue = baseline.get_fingerprint(
+        'toc', 'test', 'v1/docs/missing_page.md', 'missing_page', 'page_missing')
+    assert_eq('toc fingerprint', toc_issue in issues, True)
+    section_issue = baseline.get_fingerprint(
+        'links', 'test', 'v1/docs/v1_docs.md', 'v1/docs/v1_docs.md#v2-docs',
+        'section_missing')
+    assert_eq('link fingerprint', section_issue in issues, True)
+
+    known = dict(issues)
+    del known[section_issue]
+    known['fixed'] = {'check': 'links', 'hub': 'test', 'source': 'v1/docs/a.md',
+                      'target': 'v1/docs/b.md', 'issue': 'not_found'}
+    new, fixed = baseline.compare(known, issues)
+    assert_eq('new issues', list(new), [section_issue])
+    assert_eq('fixed issues', list(fixed), ['fixed'])
+
+    options = ['--hub', 'test', '--folder', 'test_fixtures']
+    with tempfile.TemporaryDirectory() as baseline_dir:
+        baseline_filename = os.path.join(baseline_dir, 'baseline.json')
+        with contextlib.redirect_stdout(StringIO()):
+            cli_main(options + ['--baseline', baseline_filename, '--update-baseline'])
+            known_exit_code = cli_main(options + ['--baseline', baseline_filename])
+            known = baseline.load_baseline(baseline_filename)
+            del known[hover_issue]
+            baseline.save_baseline(baseline_filename, known)
+            new_exit_code = cli_main(options + ['--baseline', baseline_filename])
+    assert_eq('known issues exit code', known_exit_code, 0)
+    assert_eq('new hover image exit code', new_exit_code, 1)
+
+
+def test_image_optimizer():
+    'test ImageOptimizer'
+    from PIL import Image
+    with tempfile.TemporaryDirectory() as hub_dir:
+        os.makedirs(os.path.join(hub_dir, 'v1/_images'))
+        Image.effect_noise((800, 600), 60).convert('RGB').save(
+            os.path.join(hub_dir, 'v1/_images/big.jpg'), quality=98)
+        Image.new('RGB', (10, 10)).save(os.path.join(hub_dir, 'v1/_images/small.png'))
+        images = [['v1/_images/big.jpg', 0.1, 800, 600],
+                  ['v1/_images/small.png', 0.0001, 10, 10]]
+        settings = {'max_width': 400, 'max_height': 400, 'min_megabytes': 0.05}
+
+        def _optimize(write=False, jobs=1, cache='cache'):
+            optimizer = ImageOptimizer(settings, os.path.join(hub_dir, cache),
+                                       jobs=jobs, write=write)
+            return optimizer.optimize(hub_dir, images)
+        results = _optimize()
+        pool_results = _optimize(jobs=2, cache='pool_cache')
+        assert_eq('process pool results',
+                  [(r['path'], r['cached'], r['saved']) for r in pool_results],
+                  [(r['path'], r['cached'], r['saved']) for r in results])
+
+        def _out_of_time():
+            raise StopChecks('time budget used')
+        for jobs in [1, 2]:
+            try:
+                ImageOptimizer(settings, os.path.join(hub_dir, 'stopped_cache'),
+                               jobs=jobs).optimize(hub_dir, images, _out_of_time)
+                stopped = False
+            except StopChecks:
+                stopped = True
+            assert_eq(f'optimizer stopped (jobs={jobs})', stopped, True)
+        assert_eq('optimized images', [r['path'] for r in results],
+                  ['v1/_images/big.jpg'])
+        assert_eq('cached', results[0]['cached'], False)
+        assert_eq('saved bytes', results[0]['saved'] > 0, True)
+        with Image.open(results[0]['output']) as optimized:
+            assert_eq('optimized size', optimized.size, (400, 300))
+        assert_eq('page savings', get_page_savings(results, {
+            'v1/_images/big.jpg': ['v1/a.md', 'v1/b.md']}), {
+                'v1/a.md': results[0]['saved'], 'v1/b.md': results[0]['saved']})
+
+        results = _optimize(write=True)
+        assert_eq('cached', results[0]['cached'], True)
+        assert_eq('written size', os.path.getsize(
+            os.path.join(hub_dir, 'v1/_images/big.jpg')), results[0]['optimized_bytes'])
+        results = _optimize()
+        assert_eq('optimized again', [(r['cached'], r['saved']) for r in results],
+                  [(True, 0)])
+
+
+def draw_test_image(seed):
+    'draw a gradient with random ellipses'
+    import random
+    from PIL import Image, ImageDraw
+    image = Image.linear_gradient('L').resize((1200, 900)).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    rand = random.Random(seed)
+    for _ in range(12):
+        x, y = rand.randrange(1100), rand.randrange(800)
+        draw.ellipse([x, y, x + rand.randrange(50, 300), y + rand.randrange(50, 300)],
+                     fill=tuple(rand.randrange(256) for _ in range(3)))
+    return image
+
+
+def test_image_fingerprints():
+    'test duplicate image detection'
+    tree = BKTree()
+    for i, image_hash in enumerate([0b0000, 0b0001, 0b0011, 0b1111, 0b0001]):
+        tree.add(image_hash, i)
+    assert_eq('bk-tree query', tree.query(0b0000, 1), [(0, 0), (1, 1), (1, 4)])
+
+    with tempfile.TemporaryDirectory() as hub_dir:
+        image = draw_test_image(1)
+        image.save(os.path.join(hub_dir, 'a.jpg'), quality=95)
+        image.save(os.path.join(hub_dir, 'a.png'))
+        image.resize((400, 300)).save(os.path.join(hub_dir, 'a_small.jpg'), quality=60)
+        shutil.copyfile(os.path.join(hub_dir, 'a.jpg'), os.path.join(hub_dir, 'copy.jpg'))
+        draw_test_image(2).save(os.path.join(hub_dir, 'b.jpg'))
+        with open(os.path.join(hub_dir, 'notes.txt'), 'w') as text_file:
+            text_file.write('not an image')
+
+        index = ImageFingerprintIndex()
+        for filename in sorted(os.listdir(hub_dir)):
+            index.add(filename, os.path.join(hub_dir, filename))
+        assert_eq('exact duplicates', index.exact_clusters(), [['a.jpg', 'copy.jpg']])
+        assert_eq('near duplicates', index.near_clusters(),
+                  [['a.jpg', 'a.png', 'a_small.jpg']])
+        assert_eq('wasted bytes', index.wasted(['a.jpg', 'copy.jpg']),
+                  os.path.getsize(os.path.join(hub_dir, 'a.jpg')))
+
+
+def test_report_output():
+    'test capped summary listings, color control, and the HTML report'
+    summary = Summary()
+    for Checker in [TocChecker, EmojiChecker, LinkChecker]:
+        Checker(summary, 'test_fixtures').check_all(['test'])
+    versions.set_color(False)
+    output = StringIO()
+    with contextlib.redirect_stdout(output):
+        summary.print(max_issue_print_count=1, max_link_issue_print_count=2,
+                      max_image_issue_print_count=0)
+    versions.set_color(None)
+    printed = output.getvalue()
+    assert_eq('color codes', '\033[' in printed, False)
+    assert_eq('emoji not shown', '+ 1 emojis not shown' in printed, True)
+    assert_eq('links not shown', '+ 2 links and 2 images not shown' in printed, True)
+
+    with tempfile.TemporaryDirectory() as report_dir:
+        index_filepath = write_html_report(summary, report_dir, page_size=3)
+        with open(index_filepath) as index_file:
+            index_html = index_file.read()
+        assert_eq('link table', 'data-pages="3"' in index_html, True)
+        assert_eq('report pages', sorted(os.listdir(os.path.join(report_dir, 'data'))),
+                  ['test-emoji-0.js', 'test-links-0.js', 'test-links-1.js',
+                   'test-links-2.js', 'test-toc-0.js'])
+        with open(os.path.join(report_dir, 'data', 'test-links-2.js')) as page_file:
+            assert_eq('last page', page_file.read().startswith(
+                'reportPage("test-links", 2, [["uses an external link'), True)
+
+
+def test_metrics():
+    'test OpenMetrics export'
+    summary = Summary(issues_only=True)
+    for Checker in [EmojiChecker, LinkChecker, ImageFileChecker]:
+        Checker(summary, 'test_fixtures').check_all(['test'])
+    summary.add_timing('links', 0.25)
+    summary.add_timing('links', 0.5)
+    lines = format_metrics(summary).splitlines()
+    for expected in [
+            'docs_check_results{hub="test",version="1.0",check="links"} 23',
+            'docs_check_issues{hub="test",version="1.0",check="links",'
+            'issue="not_found"} 4',
+            'docs_emoji_lines_skipped{hub="test"} 4',
+            'docs_images{hub="test"} 3',
+            'docs_check_duration_seconds{phase="links"} 0.75',
+            'docs_check_exit_code 1']:
+        assert_eq(f'metric {expected}', expected in lines, True)
+    assert_eq('last line', lines[-1], '# EOF')
+    assert_eq('escaped label', format_sample('m', {'a': 'x"y\\'}, 1), 'm{a="x\\"y\\\\"} 1')
+
+    toc_metrics = []
+    for issues_only in [False, True]:
+        summary = Summary(issues_only=issues_only)
+        with contextlib.redirect_stdout(StringIO()):
+            TocChecker(summary, 'test_fixtures').check_all(['test'])
+        toc_metrics.append([line for line in format_metrics(summary).splitlines()
+                            if 'check="toc"' in line])
+    assert_eq('issues-only toc issue metrics', toc_metrics[1], toc_metrics[0])
+    assert_eq('toc redirect_missing metric',
+              'docs_check_issues{hub="test",version="1.0",check="toc",'
+              'issue="redirect_missing"} 3' in toc_metrics[1], True)
+
+
+def test_early_stop():
+    'test fail fast and time budget modes'
+    options = ['--hub', 'test', '--folder', 'test_fixtures']
+    output = StringIO()
+    with contextlib.redirect_stdout(output):
+        exit_code = cli_main(['all', '--fail-fast', '4'] + options)
+    assert_eq('fail fast exit code', exit_code, 1)
+    assert_eq('stopped', 'Stopped early (4 issues found, not checked: emoji, images)'
+              in output.getvalue(), True)
+    assert_eq('partial links', len(summary_results('links')['test']), 5)
+
+    output = StringIO()
+    with contextlib.redirect_stdout(output):
+        cli_main(['all', '--fail-fast', '2'] + options)
+    assert_eq('hub level issues counted',
+              'Stopped early (2 issues found, not checked: links, emoji, images)'
+              in output.getvalue(), True)
+
+    summary = Summary()
+    summary.set_limits(max_issues=1)
+    try:
+        EmojiChecker(summary, 'test_fixtures').check_all(['test'])
+    except StopChecks:
+        pass
+    assert_eq('stop reason', summary.stopped, '1 issues found')
+
+    with contextlib.redirect_stdout(StringIO()):
+        exit_code = cli_main(['all', '--time-budget', '0'] + options)
+        assert_eq('time budget exit code', exit_code, 3)
+        exit_code = cli_main(['links', '--time-budget', '60'] + options)
+        assert_eq('time budget with issues exit code', exit_code, 1)
+        exit_code = cli_main(['images', '--time-budget', '0'] + options)
+        assert_eq('images time budget exit code', exit_code, 3)
+
+    summary = Summary()
+    summary.set_limits(time_budget=0)
+    try:
+        ImageFileChecker(summary, 'test_fixtures').check_all(['test'])
+    except StopChecks:
+        pass
+    assert_eq('images stop reason', summary.stopped, 'time budget used')
+
+
+def test_schedule():
+    'test timing history and cost balanced local workers'
+    with tempfile.TemporaryDirectory() as history_dir:
+        history = TimingHistory(os.path.join(history_dir, 'timings.json'))
+        history.update({'a.md': 2.0, 'b.md': 1.0})
+        history.update({'a.md': 4.0})
+        assert_eq('smoothed cost', history.costs['a.md'], 3.0)
+        assert_eq('estimates', history.estimate({'a.md': 100, 'b.md': 100, 'c.md': 50}),
+                  {'a.md': 3.0, 'b.md': 1.0, 'c.md': 1.5})
+        history.save()
+        assert_eq('saved history', TimingHistory(history.filename).costs, history.costs)
+
+        slow_file = os.path.normpath('test_fixtures/farmbot-test/v1/docs/other_page.md')
+        for key in ShardFilter('test_fixtures', ['test'], 0, 2).costs:
+            history.update({key: 100.0 if key == slow_file else 1.0})
+        shard_filter = ShardFilter('test_fixtures', ['test'], 0, 2, history=history)
+        assert_eq('slow file alone', [key for key, shard
+                                      in shard_filter.assignments.items()
+                                      if shard == shard_filter.assignments[slow_file]],
+                  [slow_file])
+
+        options = ['--hub', 'test', '--folder', 'test_fixtures',
+                   '--timing-history', history.filename]
+        with contextlib.redirect_stdout(StringIO()):
+            workers_exit_code = cli_main(['all', '--workers', '2'] + options)
+            merged = {key: summary_results(key) for key in ['toc', 'emoji', 'links']}
+            full_exit_code = cli_main(['all'] + options)
+            full = {key: summary_results(key) for key in ['toc', 'emoji', 'links']}
+        assert_eq('recorded costs', slow_file in TimingHistory(history.filename).costs
+                  and get_toc_key('test') in TimingHistory(history.filename).costs, True)
+        workers_summary = get_link_summary(
+            ['links', '--workers', '2', '--issues-only'] + options)
+        assert_eq('issues-only workers link summary', workers_summary,
+                  get_link_summary(['links'] + options))
+    for i in [1, 2]:
+        shutil.rmtree(get_relative_filename(get_shard_dir(i - 1, 2)))
+    assert_eq('workers exit code', workers_exit_code, full_exit_code)
+    for key, results in full.items():
+        assert_eq(f'workers {key} results', merged[key],
+                  {hub: sorted(r, key=result_order) for hub, r in results.items()})
+
+
+def test_api():
+    'test in-process checks without output or result files'
+    results_dir = get_relative_filename('results')
+    saved = {name: os.path.getmtime(os.path.join(results_dir, name))
+             for name in os.listdir(results_dir)}
+    output = StringIO()
+    with contextlib.redirect_stdout(output):
+        report = run_api_checks(os.path.abspath('test_fixtures'), ['test'])
+    assert_eq('api output', output.getvalue(), '')
+    assert_eq('api result files', {
+        name: os.path.getmtime(os.path.join(results_dir, name))
+        for name in os.listdir(results_dir)}, saved)
+    counts = {}
+    for result in report:
+        counts.setdefault(result.check, [0, 0])[result.ok] += 1
+    assert_eq('api counts', counts,
+              {'toc': [1, 2], 'links': [7, 16], 'emoji': [2, 6]})
+    assert_eq('api exit code', report.exit_code, 1)
+    missing = [r for r in report.issues() if r.check == 'toc'][0]
+    assert_eq('api result', (missing.source, missing.target, missing.version),
+              ('v1/docs/missing_page.md', 'missing_page', 1.0))
+    assert_eq('api images', report.images('test')['unused'],
+              ['v1/bom/folder/_images/one.txt'])
+    emoji_only = run_api_checks('test_fixtures', ['test'], ['emoji'])
+    assert_eq('api checks', {result.check for result in emoji_only}, {'emoji'})
+
+
+SCALING_CASES = {
+    'links': lambda n: ['[a](b.md) ' * n + '\n'],
+    'nested parentheses': lambda n: ['[a](' + '(' * n + ')' * n + ')\n'],
+    'unclosed brackets': lambda n: ['[](' * n + '\n'],
+    'html attributes': lambda n: ['<img src="a.png" ' * n + '\n'],
+    'colons': lambda n: [':' * n + '\n'],
+    'emoji': lambda n: [':smile: ' * n + '\n'],
+    'digits': lambda n: ['1' * n + '::\n'],
+    'scheme': lambda n: ['a' * n + ':x: ://\n'],
+    'backticks': lambda n: [' ' + '`' * n + ':x: :y:\n'],
+    'file': lambda n: ['[a](b.md) :smile: `c` <a href="d">\n'] * n,
+}
+
+
+def get_parse_time(lines):
+    'get the time taken to parse lines for links and emoji'
+    import time
+    start = time.perf_counter()
+    extract_emoji(lines)
+    ExtractedLinks(lines)
+    return time.perf_counter() - start
+
+
+def get_time_growth(lines_for_size, min_seconds=0.005, repeats=5):
+    'get the best-of-N time growth of parsing input 10 times larger'
+    size = 1000
+    while get_parse_time(lines_for_size(size)) < min_seconds and size < 64000:
+        size *= 2
+    small, large = lines_for_size(size), lines_for_size(size * 10)
+    times = [[], []]
+    for _ in range(repeats):
+        times[0].append(get_parse_time(small))
+        times[1].append(get_parse_time(large))
+    return min(times[1]) / min(times[0]), size
+
+
+def get_parse_memory(lines):
+    'get the peak memory allocated while parsing lines'
+    import tracemalloc
+    tracemalloc.start()
+    extract_emoji(lines)
+    ExtractedLinks(lines)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def test_parser_scaling():
+    'test that link and emoji scanning grows linearly with input size'
+    for name, lines_for_size in SCALING_CASES.items():
+        memory_growth = (get_parse_memory(lines_for_size(3000))
+                         / get_parse_memory(lines_for_size(300)))
+        assert_eq(f'{name} memory growth ({memory_growth:.1f}x) is near linear',
+                  memory_growth < 30, True)
+        # linear work grows 10x and quadratic work 100x;
+        # 30x is between them on a log scale
+        time_growth, size = get_time_growth(lines_for_size)
+        assert_eq(f'{name} time growth {size} -> {size * 10} ({time_growth:.1f}x) '
+                  'is near linear', time_growth < 30, True)
+
+
+def benchmark_parser_scaling(sizes=(1000, 10000, 100000)):
+    'check that parse time grows linearly, not quadratically (python test.py --timing)'
+    import time
+    for name, lines_for_size in SCALING_CASES.items():
+        times = []
+        for size in sizes:
+            lines = lines_for_size(size)
+            best = None
+            for _ in range(3):
+                start = time.perf_counter()
+                extract_emoji(lines)
+                ExtractedLinks(lines)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            times.append(best)
+        for i in range(1, len(sizes)):
+            growth = times[i] / times[i - 1]
+            assert_eq(f'{name} time growth {sizes[i - 1]} -> {sizes[i]} '
+                      f'({growth:.1f}x) is near linear', growth < 30, True)
+
+
+def test_parser_fuzz():
+    'test that no line makes the link or emoji scanners fail'
+    import random
+    pieces = ['[', ']', '(', ')', '!', ':', '`', '<', '>', '"', ' ', 'a', '1', '/',
+              '#', '](', 'src="', 'href="', '<img ', '<a ', 'https://', '12:30',
+              ':smile:', '\n']
+    rng = random.Random(0)
+    for _ in range(5000):
+        line = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 24)))
+        extract_emoji([line])
+        ExtractedLinks([line])
+
+
+def summary_results(key):
+    'load saved summary results'
+    with open(get_relative_filename(f'results/{key}_results.json')) as results_file:
+        return json.load(results_file)
+
+
 def test_image_file_checker():
     'test ImageFileChecker'
     summary = Summary()
@@ -175,12 +906,174 @@ def test_image_file_checker():
                   'v1/docs/doc:page',
                   'v1/docs/missing.jpg',
               })
+    assert_eq('image pages', image_file_checker.references.pages['v1/docs/missing.jpg'],
+              {'v1/docs/v1_docs.md'})
+    assert_eq('gallery listings', list(image_file_checker.references.listings),
+              ['v1/bom/folder/_images'])
+
+
+def test_image_stats():
+    'test ImageStats'
+    import random
+    rng = random.Random(49)
+    paths = [os.path.join(f'v{1 + i % 3}', f'dir{i % 5}', f'{i}.jpg')
+             for i in range(500)]
+    sizes = [rng.choice([0, 1, 250000, 600000, 2500000]) + rng.randrange(3)
+             for _ in paths]
+    dimensions = [(rng.randrange(1, 50), rng.randrange(1, 50)) for _ in paths]
+    stats = ImageStats(paths, sizes, dimensions)
+
+    megabytes = [size / 1000000 for size in sizes]
+    assert_eq('count above', stats.count_above(),
+              [len([mb for mb in megabytes if mb > threshold])
+               for threshold in [4, 2, 1, 0.5]])
+    assert_eq('histogram total', sum(row[2] for row in stats.histogram()), 500)
+    assert_eq('median', stats.percentiles([50])[0], sorted(megabytes)[250])
+    assert_eq('largest files', stats.largest_files(7),
+              [tuple(item) for item in sorted(zip(megabytes, paths))[::-1][:7]])
+    pixels = sorted([width * height / 1000000, width, height, path]
+                    for (width, height), path in zip(dimensions, paths))
+    assert_eq('largest images', stats.largest_images(7),
+              [tuple(item) for item in pixels[::-1][:7]])
+    by_directory = stats.group_by('directory')
+    assert_eq('directory count', by_directory['v2/dir1']['count'],
+              len([p for p in paths if p.startswith('v2/dir1/')]))
+    assert_eq('directory bytes', by_directory['v2/dir1']['bytes'],
+              sum(size for size, p in zip(sizes, paths) if p.startswith('v2/dir1/')))
+
+    growth = ImageStats(['v10/a.png', 'v2/a.png', 'v2/b.png', 'docs/c.png'],
+                        [300, 100, 200, 50], [(1, 1)] * 4).version_growth()
+    assert_eq('growth order', [row['version'] for row in growth], ['v2', 'v10', 'docs'])
+    assert_eq('growth change', [(row['count_change'], row['bytes_change'])
+                                for row in growth], [(0, 0), (-1, 0), (0, -250)])
+    import time
+    tied = ImageStats([f'{i:06}.jpg' for i in range(300000)], [1000] * 300000,
+                      [(10, 10)] * 300000)
+    assert_eq('largest tied images', [item[3] for item in tied.largest_images(3)],
+              ['299999.jpg', '299998.jpg', '299997.jpg'])
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        tied.largest_images(3)
+        times.append(time.perf_counter() - start)
+    assert_eq(f'tied images top 3 time ({min(times):.3f} s) is short',
+              min(times) < 0.1, True)
+    empty = ImageStats([], [], [])
+    assert_eq('empty stats', (empty.count_above(), empty.largest_files(3),
+                              empty.version_growth()), ([0, 0, 0, 0], [], []))
+
+    summary = Summary()
+    checker = ImageFileChecker(summary, 'test_fixtures')
+    checker.check_all(['test'])
+    assert_eq('image versions', summary.arbitrary_data['test']['image_versions'],
+              {'v1': {'count': 3, 'bytes': sum(
+                  os.path.getsize(os.path.join('test_fixtures/farmbot-test', path))
+                  for path in ['v1/bom/folder/_images/one.txt',
+                               'v1/bom/folder/_images/found.txt',
+                               'v1/bom/folder/_images/page_two.txt'])}})
+
+
+def test_link_index():
+    'test LinkIndex'
+    with tempfile.TemporaryDirectory() as folder:
+        shutil.copytree('test_fixtures/farmbot-test', f'{folder}/farmbot-test')
+        index = LinkIndex(':memory:')
+        assert_eq('first update', index.update(folder, ['test']),
+                  {'files': 5, 'indexed': 5, 'removed': 0})
+        results_db = ResultsStore(':memory:')
+        LinkChecker(Summary(results_db), folder).check_all(['test'])
+        checked = results_db.select('links', 'source, line_number',
+                                    target_absolute='v1/docs/v1_docs.md')
+        assert_eq('links here', [(row['source'], row['line_number'])
+                                 for row in index.links_here('v1/docs/v1_docs.md')],
+                  sorted((row['source'], row['line_number']) for row in checked))
+        assert_eq('links to section', [row['target'] for row in index.links_here(
+            'v1/docs/v1_docs.md#v1-docs')], ['../docs/v1_docs.md#v1-docs', '#v1-docs'])
+        assert_eq('section exists', index.has_section('v1/docs/v1_docs.md#v1-docs'), True)
+        assert_eq('section missing', index.has_section('v1/docs/v1_docs.md#v2-docs'),
+                  False)
+
+        page = f'{folder}/farmbot-test/v1/docs/other_page.md'
+        os.utime(page, ns=(0, 0))
+        assert_eq('touched update', index.update(folder, ['test'])['indexed'], 0)
+        with open(page, 'a') as page_file:
+            page_file.write('\n[new](v1_docs.md#v1-docs)\n')
+        os.remove(f'{folder}/farmbot-test/v1/bom/folder/two.md')
+        assert_eq('changed update', index.update(folder, ['test']),
+                  {'files': 4, 'indexed': 1, 'removed': 1})
+        assert_eq('new link', [row['source'] for row in index.links_here(
+            'v1/docs/v1_docs.md#v1-docs')][0], 'v1/docs/other_page.md')
+        assert_eq('removed links', index.connection.execute(
+            "SELECT COUNT(*) FROM links WHERE source = 'v1/bom/folder/two.md'"
+        ).fetchone()[0], 0)
+
+        output = StringIO()
+        with contextlib.redirect_stdout(output):
+            cli_main(['query', 'links-here', 'v1/docs/v1_docs.md#v2-docs', '--hub',
+                      'test', '--folder', folder, '--index', f'{folder}/index.sqlite'])
+        assert_eq('links here output', output.getvalue().splitlines()[1:], [
+            'hub\tsource\tline_number\ttype\ttarget\ttext',
+            'test\tv1/docs/v1_docs.md\t10\tlink\t../docs/v1_docs.md#v2-docs'
+            '\tthis page and bad section'])
+
+        os.makedirs(f'{folder}/farmbot-other/v1/docs')
+        with open(f'{folder}/farmbot-other/v1/docs/v1_docs.md', 'w') as page_file:
+            page_file.write('# Other\n'
+                            '[test](https://test.farm.bot/v1/docs/v1_docs#v1-docs)\n'
+                            '[hub](https://test.farm.bot/docs/v1.0)\n')
+        index.close()
+        index = LinkIndex(f'{folder}/index.sqlite')
+        index.update(folder, ['test', 'other'])
+        assert_eq('cross hub link', index.links_here('v1/docs/v1_docs.md#v1-docs',
+                                                     'test')[0]['hub'], 'other')
+        assert_eq('other hub links', index.links_here('v1/docs/v1_docs.md', 'other'), [])
+        try:
+            index.links_here('v1/docs/v1_docs.md')
+            ambiguous = None
+        except ValueError as error:
+            ambiguous = str(error)
+        assert_eq('ambiguous target', ambiguous,
+                  'v1/docs/v1_docs.md is in more than one hub (other, test)')
+        with contextlib.redirect_stderr(StringIO()):
+            try:
+                cli_main(['query', 'links-here', 'v1/docs/v1_docs.md', '--folder',
+                          folder, '--index', f'{folder}/index.sqlite', '--no-update'])
+                usage_error = None
+            except SystemExit as error:
+                usage_error = error.code
+        assert_eq('ambiguous target usage error', usage_error, 2)
+        index.close()
 
 
 if __name__ == '__main__':
     test_link_checker()
     test_check_links_extras()
+    test_content_reuse()
+    test_slugger()
     test_emoji_checker()
+    test_emoji_scanner()
     test_toc_checker()
+    test_redirect_index()
+    test_workspace()
+    test_check_server()
     test_image_file_checker()
+    test_results_store()
+    test_issues_only()
+    test_version_policy()
+    test_cli()
+    test_shards()
+    test_baseline()
+    test_image_optimizer()
+    test_image_fingerprints()
+    test_report_output()
+    test_metrics()
+    test_early_stop()
+    test_schedule()
+    test_api()
+    test_parser_scaling()
+    if '--timing' in sys.argv:
+        benchmark_parser_scaling()
+    test_parser_fuzz()
+    test_image_stats()
+    test_link_index()
     print(color('\nTests complete. (OK / PASS)\n', 'green'))
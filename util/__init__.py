@@ -1,7 +1,20 @@
 'Documentation utilities.'
 
-from util.check_links import LinkChecker
-from util.check_emoji import EmojiChecker
-from util.check_tocs import TocChecker
-from util.check_image_files import ImageFileChecker
-from util.summary import Summary
+import importlib
+
+CHECKER_MODULES = {
+    'LinkChecker': 'util.check_links',
+    'EmojiChecker': 'util.check_emoji',
+    'TocChecker': 'util.check_tocs',
+    'ImageFileChecker': 'util.check_image_files',
+    'Summary': 'util.summary',
+}
+
+__all__ = list(CHECKER_MODULES)
+
+
+def __getattr__(name):
+    'import checkers when first used'
+    if name not in CHECKER_MODULES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return getattr(importlib.import_module(CHECKER_MODULES[name]), name)
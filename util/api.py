@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+'Run checks in-process, without console output or result files.'
+
+import os
+from util import baseline
+from util.cli import CHECKERS
+from util.summary import Summary
+from util.versions import HUBS, VersionPolicy, LIGHT, SKIP, get_version_from_root
+
+CHECK_ORDER = ['toc', 'links', 'emoji', 'images']
+
+
+class CheckResult():
+    'A checked link, emoji, or ToC page.'
+
+    __slots__ = ['check', 'hub', 'status', 'version', 'source', 'line_number',
+                 'target', 'issues', 'record']
+
+    def __init__(self, check, hub, record):
+        self.check = check
+        self.hub = hub
+        self.status = record['status']
+        self.version = record.get('version')
+        self.source = baseline.get_hub_path(hub, record.get('from') or record['page'])
+        self.line_number = record.get('line_number')
+        self.target = baseline.get_target(check, hub, record)
+        self.issues = list(record['issues'])
+        self.record = record
+
+    @property
+    def ok(self):
+        'check if the result has no issues'
+        return self.status == 'ok'
+
+    def fingerprints(self):
+        'get the baseline fingerprint of each issue'
+        return [baseline.get_fingerprint(self.check, self.hub, self.source,
+                                         self.target, issue)
+                for issue in self.issues]
+
+    def __repr__(self):
+        location = self.source
+        if self.line_number is not None:
+            location += f':{self.line_number}'
+        return f'<CheckResult {self.check} {self.status!r} {location} -> {self.target}>'
+
+
+class CheckReport():
+    'Results of an in-process check run.'
+
+    def __init__(self, summary, checks):
+        self.summary = summary
+        self.checks = checks
+
+    def __iter__(self):
+        for check in self.checks:
+            for hub, records in self.summary.results.get(check, {}).items():
+                for record in records:
+                    yield CheckResult(check, hub, record)
+
+    def issues(self):
+        'get results with issues'
+        return [result for result in self if not result.ok]
+
+    @property
+    def exit_code(self):
+        'get the exit code the command line would use'
+        return self.summary.exit_code
+
+    def images(self, hub):
+        'get image statistics, per-version totals, and unused and missing images of a hub'
+        data = self.summary.arbitrary_data.get(hub, {})
+        return {
+            'images': data.get('images'),
+            'versions': data.get('image_versions', {}),
+            'unused': sorted(data.get('unused_images', [])),
+            'missing': sorted(data.get('missing_images', [])),
+        }
+
+    def text(self, hub):
+        'get the plain text summary sections of a hub'
+        return self.summary.extra_summaries.get(hub, '')
+
+
+def run_checks(root='.', hubs=None, checks=None, versions=None,
+               stable_only=False, issues_only=False, results_dir=None):
+    'check hubs in a docs root and return a CheckReport'
+    import util
+    root = os.path.normpath(root)
+    checks = CHECK_ORDER if checks is None else checks
+    unknown = set(checks) - set(CHECK_ORDER)
+    if len(unknown) > 0:
+        raise ValueError(f'unknown checks: {", ".join(sorted(unknown))}')
+    only_versions = None
+    if versions is not None:
+        only_versions = {get_version_from_root(name, 0) for name in versions}
+    version_policy = VersionPolicy(SKIP if stable_only else LIGHT, only_versions,
+                                   root)
+    summary = Summary(issues_only=issues_only, results_dir=results_dir)
+    run = [name for name in CHECK_ORDER if name in checks]
+    for name in run:
+        checker = getattr(util, CHECKERS[name])(summary, root)
+        checker.version_policy = version_policy
+        checker.quiet = True
+        checker.check_all(hubs or HUBS)
+    return CheckReport(summary, run)
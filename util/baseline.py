@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+'Fingerprint known issues and report only issues that are new or fixed.'
+
+import os
+import json
+import hashlib
+from util.versions import color
+
+HUB_ISSUES = {
+    'broken_hover_images': 'broken_hover_image',
+    'broken_part_images': 'broken_part_image',
+}
+
+
+def get_hub_path(hub, path):
+    'remove the checkout folder from a path'
+    hub_folder = f'farmbot-{hub}/'
+    if hub_folder in path:
+        path = path.split(hub_folder, 1)[1]
+    return os.path.normpath(path)
+
+
+def get_target(results_key, hub, record):
+    'get the normalized target of a result record'
+    if results_key == 'emoji':
+        return record['emoji']
+    if results_key == 'toc':
+        return record['slug']
+    if 'syntax_error' in record['issues']:
+        return record['full'].strip()
+    if record['link'] == 'relative':
+        target = get_hub_path(hub, record['to_absolute'])
+        fragment = record['to'].partition('#')[2]
+        return f'{target}#{fragment}' if fragment else target
+    return record['to'].rstrip('/')
+
+
+def get_fingerprint(check, hub, source, target, issue):
+    'hash the parts of an issue that do not change when unrelated lines move'
+    text = '\0'.join([check, hub, source, target, issue])
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def add_issue(issues, check, hub, source, target, issue):
+    'add an issue to a fingerprint lookup'
+    fingerprint = get_fingerprint(check, hub, source, target, issue)
+    issues[fingerprint] = {
+        'check': check,
+        'hub': hub,
+        'source': source,
+        'target': target,
+        'issue': issue,
+    }
+
+
+def collect_issues(summary):
+    'get the issues of a summary by fingerprint'
+    issues = {}
+    for results_key, hub_results in summary.results.items():
+        for hub, results in hub_results.items():
+            for record in results:
+                if record['status'] == 'ok':
+                    continue
+                source = get_hub_path(hub, record.get('from') or record['page'])
+                target = get_target(results_key, hub, record)
+                for issue in record['issues']:
+                    add_issue(issues, results_key, hub, source, target, issue)
+    for hub, data in summary.arbitrary_data.items():
+        for key, issue in HUB_ISSUES.items():
+            for path in data.get(key, []):
+                add_issue(issues, 'toc', hub, get_hub_path(hub, path), '', issue)
+    return issues
+
+
+def load_baseline(filename):
+    'load baseline issues by fingerprint'
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'r') as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(filename, issues):
+    'save issues as the new baseline'
+    with open(filename, 'w') as baseline_file:
+        baseline_file.write(json.dumps(issues, indent=2, sort_keys=True))
+        baseline_file.write('\n')
+
+
+def compare(baseline, issues):
+    'get new and fixed issues by fingerprint'
+    new = {f: issues[f] for f in sorted(set(issues) - set(baseline))}
+    fixed = {f: baseline[f] for f in sorted(set(baseline) - set(issues))}
+    return new, fixed
+
+
+def format_baseline_issue(issue):
+    'format a fingerprinted issue on one line'
+    target = f' -> {issue["target"]}' if issue['target'] else ''
+    return (f'{issue["check"]:<6} {issue["hub"]}: {issue["source"]}{target} '
+            f'({issue["issue"]})')
+
+
+def print_baseline_report(new, fixed, known_count):
+    'print new and fixed issues'
+    print()
+    print(' baseline '.upper().center(50, '-'))
+    print(f'{len(new):>6} new')
+    print(f'{len(fixed):>6} fixed')
+    print(f'{known_count:>6} known')
+    if len(new) > 0:
+        print()
+        print(color(' new issues '.upper().center(50, '-'), 'bold'))
+        for issue in new.values():
+            print(f'  {color(format_baseline_issue(issue))}')
+    if len(fixed) > 0:
+        print()
+        print(color(' fixed issues '.upper().center(50, '-'), 'bold'))
+        for issue in fixed.values():
+            print(f'  {color(format_baseline_issue(issue), "green")}')
+    print()
+    if len(new) > 0:
+        print(color('New issues found.'))
+    else:
+        print(color('No new issues found.', 'green'))
+    print()
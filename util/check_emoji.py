@@ -3,9 +3,8 @@
 'Verify emoji in documentation markdown files.'
 
 import os
+import re
 import json
-import string
-from urllib.request import Request, urlopen
 from util import versions, walk
 
 
@@ -16,6 +15,7 @@ def load_valid_emoji_names():
         with open(emojis_filename, 'r') as emoji_f:
             valid_emoji_names = json.load(emoji_f)
     else:
+        from urllib.request import Request, urlopen
         url = 'https://raw.githubusercontent.com/github/gemoji/master/db/emoji.json'
         request = Request(url)
         request.add_header('Accept', 'application/json')
@@ -53,43 +53,91 @@ POSSIBLE_ISSUES = {
 }
 
 
+# empty names pair up the colons of `::` runs so they cannot start a shortcode
+SHORTCODE = re.compile(r':([A-Za-z0-9_+\-]*):')
+BACKTICKS = re.compile(r'`+')
+URL = re.compile(r'(?<![A-Za-z0-9+.\-])([0-9+.\-]*)[A-Za-z][A-Za-z0-9+.\-]*://\S*')
+TIME = re.compile(r'(?<!\d)\d+:\d+(?::\d+)+')
+SKIPPED_NAMES = {'backups'}
+NUMBER_NAMES = {'100', '1234'}
+
+
+def strip_inline_code(line):
+    'replace code spans (closed by the next run of as many backticks) with spaces'
+    runs = [match.span() for match in BACKTICKS.finditer(line)]
+    closing = [None] * len(runs)
+    last_by_length = {}
+    for i in range(len(runs) - 1, -1, -1):
+        length = runs[i][1] - runs[i][0]
+        closing[i] = last_by_length.get(length)
+        last_by_length[length] = i
+    parts = []
+    kept = 0
+    i = 0
+    while i < len(runs):
+        if closing[i] is None:
+            i += 1
+            continue
+        parts += [line[kept:runs[i][0]], ' ']
+        kept = runs[closing[i]][1]
+        i = closing[i] + 1
+    parts.append(line[kept:])
+    return ''.join(parts)
+
+
 def check_line(**kwargs):
-    'verify links in line'
+    'verify emoji shortcodes in line'
     line = kwargs['line']
-    colon_count = len(line.split(':')) - 1
-    if colon_count > 1:
-        visited = []
-        while len(visited) < colon_count:
-            start_index = visited[-1] if len(visited) > 0 else 0
-            start = line.index(':', start_index) + 1
-            visited.append(start)
-            next_colon = line.find(':', start)
-            if next_colon is None:
-                break
-            visited.append(next_colon + 1)
-            to_next = line[start:next_colon].lower()
-            if len(to_next) < 1:
-                continue
-            valid = True
-            for k in to_next:
-                if k not in string.ascii_lowercase + string.digits + '+-_':
-                    valid = False
-                    break
-            if not valid:
-                continue
-            end = next_colon
-            emoji = line[start:end]
-            if emoji.isdigit() and emoji not in ['100', '1234']:
-                continue
-            if emoji == 'backups':
-                continue
-            if set(emoji) == set('-'):
-                continue
-            kwargs['check_emoji'](
-                kwargs['root'],
-                kwargs['filename'],
-                emoji,
-                kwargs['line_number'])
+    if line.count(':') < 2:
+        return
+    if '`' in line:
+        line = strip_inline_code(line)
+    if '://' in line:
+        line = URL.sub(r'\1 ', line)
+    line = TIME.sub(' ', line)
+    for match in SHORTCODE.finditer(line):
+        emoji = match.group(1)
+        if emoji.isdigit() and emoji not in NUMBER_NAMES:
+            continue
+        if emoji in SKIPPED_NAMES or emoji.strip('-') == '':
+            continue
+        kwargs['check_emoji'](
+            kwargs['root'],
+            kwargs['filename'],
+            emoji,
+            kwargs['line_number'])
+
+
+def extract_emoji(lines):
+    'find emoji in the lines of a file, independent of the file path'
+    found = []
+    skipped = 0
+    code_block = False
+    for line_number, line in enumerate(lines):
+        if line.startswith('```'):
+            code_block = not code_block
+        if code_block:
+            skipped += 1
+            continue
+        check_line(
+            check_emoji=lambda _root, _filename, emoji, number: found.append(
+                (number, emoji)),
+            filename='',
+            root='',
+            line=line,
+            line_number=line_number,
+            code_block=code_block)
+    return {'emoji': found, 'lines': len(lines), 'skipped': skipped}
+
+
+def get_code_block_summary(metrics):
+    'get the code block line count summary string'
+    skipped = metrics['lines_skipped']
+    total = skipped + metrics['lines_checked']
+    metrics_string = '\n\n' + ' code blocks '.upper().center(50, '-')
+    metrics_string += f'\n    {skipped}/{total} lines'
+    metrics_string += f' ({round(100 * skipped / (total or 1), 2)}%)\n\n'
+    return metrics_string
 
 
 class EmojiChecker():
@@ -98,10 +146,14 @@ class EmojiChecker():
     def __init__(self, summary, folder=None):
         self.summary = summary
         self.verbose = False
+        self.quiet = False
         self.folder = folder or '.'
         self.current_hub = None
         self.current_hub_path = None
         self.emojis = {}
+        self.version_policy = versions.VersionPolicy(folder=self.folder)
+        self.shard = None
+        self.content_cache = walk.ContentCache()
         self.emoji_names = {
             'available': load_valid_emoji_names(),
             'used': set(),
@@ -140,53 +192,53 @@ class EmojiChecker():
             icon = 'X' if len(issues) > 0 else '|'
             print(f'{icon}{walk.get_indent(local_root) * 3}{emoji}')
 
+    def check_file(self, root, filename, lines):
+        'verify integrity of emojis in a markdown file'
+        metrics = self.summary.arbitrary_data[self.current_hub]
+        extracted = self.content_cache.get(lines, extract_emoji)
+        metrics['lines_checked'] += extracted['lines']
+        metrics['lines_skipped'] += extracted['skipped']
+        for line_number, emoji in extracted['emoji']:
+            self.check_emoji(root, filename, emoji, line_number)
+
     def check_emojis(self):
         'verify integrity of emojis in a directory'
-        def _parse_lines(root, filename, lines):
-            metrics = self.summary.arbitrary_data[self.current_hub]
-            code_block = False
-            for line_number, line in enumerate(lines):
-                metrics['lines_checked'] += 1
-                if line.startswith('```'):
-                    code_block = not code_block
-                if code_block:
-                    metrics['lines_skipped'] += 1
-                    continue
-                line_check_kwargs = {
-                    'check_emoji': self.check_emoji,
-                    'filename': filename,
-                    'root': root,
-                    'line': line,
-                    'line_number': line_number,
-                    'code_block': code_block,
-                }
-                check_line(**line_check_kwargs)
         path = self.current_hub_path
-        walk.walk_through_files(self.folder, path, _parse_lines, self.verbose)
+        include = self.version_policy.include(self.current_hub)
+        include_file = None if self.shard is None else self.shard.includes
+        walk.walk_through_files(self.folder, path, self.check_file, self.verbose,
+                                quiet=self.quiet, include_version=include,
+                                include_file=include_file,
+                                summary=self.summary)
+
+    def start_hub(self, hub):
+        'reset hub data and check if the hub directory exists'
+        self.current_hub = hub
+        self.emojis[hub] = self.summary.new_results()
+        self.summary.add_arbitrary_data(hub, 'lines_checked', 0)
+        self.summary.add_arbitrary_data(hub, 'lines_skipped', 0)
+        self.content_cache.reset_stats()
+        self.current_hub_path = f'{self.folder}/farmbot-{hub}'
+        return os.path.exists(self.current_hub_path)
 
     def check_all(self, hubs=None):
         'check emoji in all hubs'
         if hubs is None:
             hubs = versions.HUBS
         for hub in hubs:
-            self.current_hub = hub
-            self.emojis[hub] = []
-            self.summary.add_arbitrary_data(hub, 'lines_checked', 0)
-            self.summary.add_arbitrary_data(hub, 'lines_skipped', 0)
             hub_title = f'farmbot-{hub}'
-            self.current_hub_path = f'{self.folder}/{hub_title}'
-            if os.path.exists(self.current_hub_path):
+            if self.start_hub(hub):
                 if self.verbose:
                     walk.print_hub_title(hub)
-                else:
+                elif not self.quiet:
                     print(f'checking emoji in {hub_title}...', end='')
                 self.check_emojis()
                 metrics = self.summary.arbitrary_data[hub]
-                skipped = metrics['lines_skipped']
-                total = skipped + metrics['lines_checked']
-                metrics_string = '\n\n' + ' code blocks '.upper().center(50, '-')
-                metrics_string += f'\n    {skipped}/{total} lines'
-                metrics_string += f' ({round(100 * skipped / total, 2)}%)\n\n'
-                self.summary.add_extra_summary(hub, metrics_string)
+                self.summary.add_extra_summary(hub, get_code_block_summary(metrics))
+                self.summary.add_arbitrary_data(hub, 'emoji_content_reuse',
+                                                dict(self.content_cache.stats))
+                self.summary.add_extra_summary(
+                    hub, walk.get_reuse_summary(self.content_cache.stats))
         self.summary.add_results('emoji', self.emojis)
-        print()
+        if not self.quiet:
+            print()
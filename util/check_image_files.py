@@ -3,12 +3,47 @@
 '''Check image files in documentation.'''
 
 import os
-import json
 from collections import Counter
-import imagesize
+from util.check_links import ExtractedLinks, get_link_relation, get_target_path
 from util.check_tocs import verify_hover_images, verify_part_images
-from util.walk import is_content_dir, get_relative_filename
-from util.versions import HUBS, color
+from util.walk import ContentCache, is_content_dir
+from util.versions import HUBS, VersionPolicy, color, get_version_from_root
+
+
+class ImageReferences():
+    'Paths referenced by the markdown files of a hub, and gallery images.'
+
+    def __init__(self):
+        self.referenced = Counter()
+        self.pages = {}
+        self.listings = {}
+        self.content_cache = ContentCache()
+
+    def add_file(self, local_root, filename, lines):
+        'add the relative link targets of a markdown file'
+        page = os.sep.join([local_root, filename])
+        extracted = self.content_cache.get(lines, ExtractedLinks)
+        for _line_number, parsed, _full, _html_line in extracted.items:
+            if parsed is None:
+                path = 'unknown'
+            else:
+                target = parsed[1]
+                if get_link_relation(target) != 'relative':
+                    continue
+                path = get_target_path(local_root, target.partition('#')[0] or filename)
+            self.referenced[path] += 1
+            self.pages.setdefault(path, set()).add(page)
+
+    def gallery_images(self, hub_dir, relative_img_dir, slug):
+        'get the images of an _images directory that match a page slug'
+        listing = self.listings.get(relative_img_dir)
+        if listing is None:
+            img_dir = os.path.join(hub_dir, relative_img_dir)
+            names = sorted(os.listdir(img_dir)) if os.path.isdir(img_dir) else []
+            listing = [(name, name.replace('_', '-')) for name in names]
+            self.listings[relative_img_dir] = listing
+        return [os.path.join(relative_img_dir, name)
+                for name, normalized_name in listing if slug in normalized_name]
 
 
 class ImageFileChecker():
@@ -21,7 +56,10 @@ class ImageFileChecker():
         self.current_hub = None
         self.current_hub_path = None
         self.summary_string = ''
-        self.options = {'extras': False, 'top_count': 3}
+        self.options = {'extras': False, 'top_count': 3, 'duplicates': False}
+        self.version_policy = VersionPolicy(folder=self.folder)
+        self.optimizer = None
+        self.references = ImageReferences()
 
     def add_line(self, text='', indent=2):
         'add line to summary string'
@@ -40,31 +78,81 @@ class ImageFileChecker():
         total_string = f'{total:.2f} MB total ({surplus:.2f} MB less)'
         self.add_line(f'{size:10.2f} MB avg: {total_string}')
 
-    def above(self, image_file_sizes, size):
-        'print image count above size'
-        count = len([img for img in image_file_sizes if img[0] > size])
-        self.add_line(f'{count:10}    images > {size} MB')
+    def add_version_growth(self, hub, stats):
+        'add image totals of each version and the change from the previous version'
+        growth = stats.version_growth()
+        self.summary.add_arbitrary_data(hub, 'image_versions', {
+            row['version']: {'count': row['count'], 'bytes': row['bytes']}
+            for row in growth})
+        self.print_title('Images by version')
+        for row in growth:
+            megabytes = row['bytes'] / 1000000
+            change = row['bytes_change'] / 1000000
+            self.add_line(f'{row["version"]:>10} {row["count"]:5} images '
+                          f'{megabytes:8.2f} MB ({row["count_change"]:+} images, '
+                          f'{change:+.2f} MB)')
+
+    def add_optimization(self, hub, hub_dir, image_file_sizes, image_pixel_sizes):
+        'optimize large images and add the real savings to the summary'
+        from util.optimize_images import get_page_savings
+        images = [[pixels[3], size[0], pixels[1], pixels[2]]
+                  for size, pixels in zip(image_file_sizes, image_pixel_sizes)]
+        results = self.optimizer.optimize(hub_dir, images, self.summary.check_time)
+        before = sum(result['bytes'] for result in results)
+        saved = sum(result['saved'] for result in results)
+        cached = len([result for result in results if result['cached']])
+        self.summary.add_arbitrary_data(hub, 'image_optimization', {
+            'images': len(results), 'bytes': before, 'saved': saved})
+
+        self.print_title('Optimized images')
+        written = ' (written)' if self.optimizer.write and saved > 0 else ''
+        self.add_line(f'{len(results):10}    images ({cached} cached)')
+        self.add_line(f'{before / 1000000:10.2f} MB before')
+        self.add_line(f'{saved / 1000000:10.2f} MB saved{written}')
+
+        self.print_title('Largest savings by page')
+        page_savings = get_page_savings(results, self.references.pages)
+        top_pages = sorted(page_savings.items(), key=lambda item: -item[1])
+        for page, page_saved in top_pages[:self.options['top_count']]:
+            self.add_line(f'{page_saved / 1000000:6.2f} MB {page}')
+
+    def add_duplicates(self, hub, hub_dir, image_file_paths):
+        'find exact and near-duplicate images and add them to the summary'
+        from util.image_fingerprints import ImageFingerprintIndex
+        index = ImageFingerprintIndex()
+        for path in image_file_paths:
+            self.summary.check_time()
+            index.add(path, os.path.join(hub_dir, path))
+        duplicates = {
+            'exact': index.exact_clusters(),
+            'near': index.near_clusters(),
+        }
+        self.summary.add_arbitrary_data(hub, 'duplicate_images', duplicates)
+        for kind, clusters in duplicates.items():
+            wasted = sum(index.wasted(paths) for paths in clusters) / 1000000
+            self.print_title(f'{kind.capitalize()} duplicate images')
+            self.add_line(f'{len(clusters):10}    groups')
+            self.add_line(f'{wasted:10.2f} MB wasted')
+            for paths in clusters[:self.options['top_count']]:
+                self.add_line(f'{index.wasted(paths) / 1000000:6.2f} MB '
+                              + ', '.join(paths))
 
     def check_all(self, hubs=None):
         'check image files in all hubs'
+        import imagesize
+        from util.image_stats import ImageStats, PERCENTILES, SIZE_THRESHOLDS
         if hubs is None:
             hubs = HUBS
-        results_filepath = get_relative_filename('results/links_results.json')
-        with open(results_filepath, 'r') as results_f:
-            all_links = json.load(results_f)
+        results_db = self.summary.results_db
 
         for hub in hubs:
+            self.summary.check_time()
             self.summary_string = ''
             self.add_line(' image file summary '.upper().center(50, '-'), 0)
             hub_dir = os.path.join(self.folder, f'farmbot-{hub}')
             if not os.path.exists(hub_dir):
                 continue
-
-            used_image_paths = [link['to_absolute']
-                                for link in all_links[hub]
-                                if link['to_absolute'] is not None
-                                and not link['to_absolute'].endswith('.md')
-                                and not link['to_absolute'].endswith('.js')]
+            self.references = ImageReferences()
 
             _, hover_img_paths = verify_hover_images(hub_dir)
             _, part_img_paths = verify_part_images(hub_dir)
@@ -72,8 +160,9 @@ class ImageFileChecker():
 
             all_files = []
             version_count = 0
+            include = self.version_policy.include(hub)
             for folder in os.listdir(hub_dir):
-                if is_content_dir(folder):
+                if is_content_dir(folder) and include(folder):
                     version_count += 1
                     for root, _dirs, files in os.walk(os.path.join(hub_dir, folder)):
                         for filename in files:
@@ -84,15 +173,18 @@ class ImageFileChecker():
             md_file_paths = []
             gallery_imgs = []
             for path in all_files:
-                filepath = os.sep.join(path.split('/')[2:])
+                filepath = os.path.relpath(path, hub_dir)
                 if path.endswith('.md'):
                     md_file_paths.append(filepath)
                 else:
                     image_file_paths.append(filepath)
 
             for md_filepath in md_file_paths:
+                self.summary.check_time()
                 with open(os.path.join(hub_dir, md_filepath), 'r') as md_file:
                     md_file_lines = md_file.readlines()
+                self.references.add_file(os.path.dirname(md_filepath),
+                                         os.path.basename(md_filepath), md_file_lines)
                 front = 0
                 slug = ''
                 for line in md_file_lines:
@@ -104,38 +196,54 @@ class ImageFileChecker():
                     if line.startswith('specs:') and front == 1:
                         relative_img_dir = os.path.join(
                             os.path.dirname(md_filepath), '_images')
-                        img_dir = os.path.join(hub_dir, relative_img_dir)
-                        relative_img_names = os.listdir(img_dir)
-                        used = [os.path.join(relative_img_dir, img)
-                                for img in relative_img_names
-                                if slug in img.replace('_', '-')]
-                        gallery_imgs += used
+                        gallery_imgs += self.references.gallery_images(
+                            hub_dir, relative_img_dir, slug)
                     if front > 1:
                         break
 
-            image_file_sizes = []
-            for path in image_file_paths:
-                size = os.path.getsize(os.path.join(hub_dir, path)) / 1000000
-                image_file_sizes.append([size, path])
+            used_image_paths = Counter({
+                path: count for path, count in self.references.referenced.items()
+                if not path.endswith('.md') and not path.endswith('.js')})
 
-            image_pixel_sizes = []
+            image_bytes = []
+            image_dimensions = []
             for path in image_file_paths:
-                width, height = imagesize.get(os.path.join(hub_dir, path))
-                image_pixel_sizes.append(
-                    [width * height / 1000000, width, height, path])
+                self.summary.check_time()
+                image_bytes.append(os.path.getsize(os.path.join(hub_dir, path)))
+                image_dimensions.append(imagesize.get(os.path.join(hub_dir, path)))
+            stats = ImageStats(image_file_paths, image_bytes, image_dimensions)
+            image_file_sizes = [[size / 1000000, path]
+                                for size, path in zip(image_bytes, image_file_paths)]
+            image_pixel_sizes = [[width * height / 1000000, width, height, path]
+                                 for (width, height), path
+                                 in zip(image_dimensions, image_file_paths)]
+
+            if results_db is not None:
+                results_db.save_rows('images', hub, [{
+                    'version': get_version_from_root(path, 0),
+                    'path': path,
+                    'bytes': size,
+                    'width': width,
+                    'height': height,
+                } for path, size, (width, height)
+                    in zip(image_file_paths, image_bytes, image_dimensions)])
 
             self.print_title('Statistics')
             md_file_count = len(md_file_paths)
             self.add_line(f'{version_count:10}    versions')
             self.add_line(f'{md_file_count:10}    markdown files')
-            total_count = len(image_file_sizes)
-            total_size = sum([img[0] for img in image_file_sizes])
+            total_count = len(stats)
+            total_size = sum(image_bytes) / 1000000
+            self.summary.add_arbitrary_data(hub, 'images', {
+                'count': total_count, 'bytes': sum(image_bytes)})
             self.add_line(f'{total_count:10}    images')
-            for megabytes in [4, 2, 1, 0.5]:
-                self.above(image_file_sizes, megabytes)
+            for megabytes, count in zip(SIZE_THRESHOLDS, stats.count_above()):
+                self.add_line(f'{count:10}    images > {megabytes} MB')
             self.add_line(f'{total_size:10.2f} MB total size')
             average_size = total_size / (total_count or 1)
             self.add_line(f'{average_size:10.2f} MB average size')
+            for percent, size in zip(PERCENTILES, stats.percentiles()):
+                self.add_line(f'{size:10.2f} MB p{percent} size')
 
             if self.options['extras']:
                 self.print_title('Potential sizes')
@@ -143,21 +251,39 @@ class ImageFileChecker():
                     self.over(total_count, average_size, megabytes)
                 self.add_line()
 
+                self.print_title('File size distribution')
+                for low, high, count in stats.histogram():
+                    self.add_line(f'{count:10}    images {low}-{high} MB')
+
             top_count = self.options['top_count']
 
             if self.options['extras']:
                 self.print_title('Most referenced images')
-                for item in Counter(used_image_paths).most_common()[:top_count]:
+                for item in used_image_paths.most_common()[:top_count]:
                     self.add_line('{} {}'.format(*item[::-1]))
 
+            self.add_version_growth(hub, stats)
+
+            self.print_title('Largest image directories')
+            for directory, totals in stats.largest_groups('directory', top_count):
+                self.add_line(f'{totals["bytes"] / 1000000:6.2f} MB '
+                              f'{totals["count"]:5} images {directory}')
+
             self.print_title('Largest images by file size')
-            for item in sorted(image_file_sizes)[::-1][:top_count]:
+            for item in stats.largest_files(top_count):
                 self.add_line('{:6.2f} MB {}'.format(*item))
 
             self.print_title('Largest images by pixel count')
-            for item in sorted(image_pixel_sizes)[::-1][:top_count]:
+            for item in stats.largest_images(top_count):
                 self.add_line('{:6.2f} MP {:5} x {:5} {}'.format(*item))
 
+            if self.options['duplicates']:
+                self.add_duplicates(hub, hub_dir, image_file_paths)
+
+            if self.optimizer is not None:
+                self.add_optimization(hub, hub_dir, image_file_sizes,
+                                      image_pixel_sizes)
+
             unused = (set(image_file_paths) - set(used_image_paths)
                       - set(all_hover_image_paths) - set(gallery_imgs))
             missing = set(used_image_paths) - set(image_file_paths)
@@ -3,29 +3,66 @@
 'Verify links in documentation markdown files.'
 
 import os
-import string
+import re
+import bisect
 from util import versions, walk
+from util.slugger import slug, get_file_sections
 
 
-def extend_index(full, index):
+class CharPositions():
+    'Positions of characters in a line, to find the nearest ones without rescanning.'
+
+    def __init__(self, line, chars):
+        self.positions = {char: [match.start() for match
+                                 in re.finditer(re.escape(char), line)]
+                          for char in chars}
+
+    def find(self, char, index):
+        'get the first position of char at or after index, or -1'
+        positions = self.positions[char]
+        i = bisect.bisect_left(positions, index)
+        return positions[i] if i < len(positions) else -1
+
+    def rfind(self, char, index):
+        'get the last position of char before index, or -1'
+        positions = self.positions[char]
+        i = bisect.bisect_left(positions, index)
+        return positions[i - 1] if i > 0 else -1
+
+
+def extend_index(full, index, find=None):
     'extend the search index if more than one "(" is found before ")"'
-    if '(' in full[(index + 2):]:
-        index += 2
-        open_index = full.index('(', index)
-        try:
-            close_index = full.index(')', index)
-        except ValueError:
-            print('missing close in search length:')
-            print(repr(full))
-            print(f'{" " * index}{"^" * (len(full) - index)}')
-            return index
-        if open_index < close_index:
-            ignore_index = open_index + 1
-            if len(full[ignore_index:].split(')')) > 2:
-                index = full.index(')', ignore_index) + 1
+    find = find or full.find
+    open_index = find('(', index + 2)
+    if open_index == -1:
+        return index
+    index += 2
+    close_index = find(')', index)
+    if close_index == -1:
+        return index
+    if open_index < close_index:
+        first_close = find(')', open_index + 1)
+        if find(')', first_close + 1) != -1:
+            index = first_close + 1
     return index
 
 
+LINK_TYPES = {
+    '!': 'image',
+    'i': 'iframe',
+    's': 'source',
+    'x': 'script',
+}
+
+HTML_LINK_TYPES = {
+    'a': 'link',
+    'iframe': 'iframe',
+    'img': 'image',
+    'source': 'source',
+    'script': 'script',
+}
+
+
 def parse_link(full):
     '[text](link) -> text, link, "link" or ![text](link) -> text, link, "image"'
     text_start = full.index('[') + 1
@@ -38,13 +75,12 @@ def parse_link(full):
     link = full[link_start:link_end]
 
     identifier = full[full.index('[') - 1]
-    link_type = {
-        '!': 'image',
-        'i': 'iframe',
-        's': 'source',
-        'x': 'script',
-    }.get(identifier, 'link')
-    return {'text': text, 'link': link, 'type': link_type}
+    return text, link, LINK_TYPES.get(identifier, 'link')
+
+
+def get_target_path(local_root, path):
+    'get the hub relative path of a relative link target'
+    return os.path.normpath(os.path.join(local_root, path))
 
 
 def get_link_relation(link):
@@ -56,50 +92,60 @@ def get_link_relation(link):
     return 'relative'
 
 
-def get_sections(section_index, root, filename, link):
+class Link():
+    'A link occurrence, parsed once.'
+    __slots__ = ['root', 'filename', 'line_number', 'text', 'target', 'path',
+                 'fragment', 'relation', 'kind', 'resolved', 'full', 'html_line']
+
+    def __init__(self, root, filename, line_number, parsed, full, html_line=None):
+        self.root = root
+        self.filename = filename
+        self.line_number = line_number
+        self.text, self.target, self.kind = parsed
+        self.path, has_fragment, fragment = self.target.partition('#')
+        self.fragment = fragment if has_fragment else None
+        self.relation = get_link_relation(self.target)
+        self.resolved = os.sep.join([root, self.path])
+        self.full = full
+        self.html_line = html_line
+
+    def page_path(self):
+        'get the path of the linked page, which is the current page for #section'
+        return os.sep.join([self.root, self.path or self.filename])
+
+
+def get_sections(section_index, link):
     'get headers in markdown file from section index'
-    slug = link.split('#')[0] or filename
-    path = os.sep.join([root, slug])
-    return section_index.get(os.path.realpath(path), [])
+    return section_index.get(os.path.realpath(link.page_path()), [])
 
 
 def get_section_link(header_text):
     'get a section link string from section header text'
-    section = header_text.strip().lower().replace(' ', '-')
-    removed_punctuation = string.punctuation.replace('-', '').replace('_', '')
-    for character in removed_punctuation:
-        section = section.replace(character, '')
-    return section
+    return slug(header_text)
 
 
-def get_files(root, link):
+def get_files(link):
     'get available files at path'
-    path = os.sep.join([root, link.split('#')[0]])
-    dir_path = os.path.dirname(path)
+    dir_path = os.path.dirname(link.resolved)
     if not os.path.exists(dir_path):
         return f'DIR NOT FOUND (\'{dir_path}\')'
     return os.listdir(dir_path)
 
 
-def is_not_found(**kwargs):
+def is_not_found(link, _context):
     'check if a link path exists'
-    root = kwargs['root']
-    full_link = kwargs['link']
-    path = os.sep.join([root, full_link.split('#')[0]])
-    relative = get_link_relation(full_link) == 'relative'
-    return relative and not os.path.exists(path)
+    return link.relation == 'relative' and not os.path.exists(link.resolved)
 
 
-def is_doc_link(**kwargs):
+def is_doc_link(link, _context):
     'check if a link is a doc: link'
-    link = kwargs['link']
-    return link.startswith('doc:')
+    return link.target.startswith('doc:')
 
 
-def is_same_hub(**kwargs):
+def is_same_hub(link, context):
     'check if a link uses an external url for an internal documentation page'
-    link = kwargs['link'].lower()
-    current_hub = kwargs['current_hub']
+    current_hub = context.current_hub
+    link = link.target.lower()
     http = link.startswith('http')
     farmbot = 'farm.bot' in link
     has_hub = http and link.split('/')[2].startswith(current_hub[:3])
@@ -110,20 +156,11 @@ def is_same_hub(**kwargs):
     return http and farmbot and has_hub and not top_link and not version_link
 
 
-def is_section_missing(**kwargs):
+def is_section_missing(link, context):
     'check if linked section exists'
-    root = kwargs['root']
-    filename = kwargs['filename']
-    full_link = kwargs['link']
-    section_index = kwargs['section_index']
-    try:
-        section = full_link.split('#')[1]
-    except IndexError:
-        section = None
-    path = os.sep.join([root, full_link.split('#')[0]])
-    if os.path.exists(path) and section is not None:
-        indexed = get_sections(section_index, root, filename, full_link)
-        return not section in indexed
+    if link.fragment is not None and os.path.exists(link.resolved):
+        indexed = get_sections(context.section_index[context.current_hub], link)
+        return not link.fragment in indexed
     return False
 
 
@@ -144,70 +181,110 @@ POSSIBLE_ISSUES = {
         'label': 'section missing in linked file',
         'check': is_section_missing,
     },
-    'syntax_error': {'label': 'syntax error', 'check': lambda **_: False}
+    'syntax_error': {'label': 'syntax error', 'check': lambda *_: False}
 }
 
+PATH_ISSUES = ['not_found', 'section_missing']
+
 
-def check_line(**kwargs):
+def get_full_link(line, start, chars):
+    'get the markdown link starting at an index, or None'
+    if start == -1:
+        return None
+    if line[start - 1] == '!':
+        start -= 1
+    text_end = chars.find(']', start)
+    if text_end == -1:
+        return None
+    text_end = extend_index(line, text_end, chars.find)
+    end = chars.find(')', text_end)
+    if end == -1:
+        return None
+    return line[start:end + 1]
+
+
+def check_line(line, line_number, root, filename, checker):
     'verify links in line'
-    line = kwargs['line']
-    search_string = kwargs['search_string']
-    link_count = len(line.split(search_string)) - 1
-    visited = []
-    while len(visited) < link_count:
-        if search_string in line:
-            start_index = visited[-1] if len(visited) > 0 else 0
-            link_start = line.index(search_string, start_index) + 1
-            visited.append(link_start)
+    search_string = ']('
+    link_start = line.find(search_string)
+    if link_start == -1:
+        return
+    chars = CharPositions(line, '[]()')
+    parsed_start = None
+    while link_start != -1:
+        link_start += 1
+        start = chars.rfind('[', link_start)
+        if start != parsed_start:
+            parsed_start = start
+            full = get_full_link(line, start, chars)
             try:
-                start = line.rindex('[', 0, link_start)
+                parsed = None if full is None else parse_link(full)
             except ValueError:
-                print('invalid syntax: ', line)
-                kwargs['add_syntax_error'](**kwargs)
-                continue
-            if line[start - 1] == '!':
-                start -= 1
-            text_end = line.index(']', start)
-            text_end = extend_index(line, text_end)
-            end = line.index(')', text_end) + 1
-            kwargs['check_link'](
-                kwargs['root'],
-                kwargs['filename'],
-                line[start:end],
-                kwargs['line_number'])
-
-
-def check_line_html(**kwargs):
+                parsed = None
+        if parsed is None:
+            checker.add_syntax_error(root, filename, line, line_number)
+        else:
+            checker.check_link(Link(root, filename, line_number, parsed, full))
+        link_start = line.find(search_string, link_start)
+
+
+def check_line_html(line, line_number, root, filename, checker, search_string):
     'verify links in line'
-    line = kwargs['line']
-    search_string = kwargs['search_string']
-    link_count = len(line.split(search_string)) - 1
-    visited = []
-    while len(visited) < link_count:
-        if search_string in line:
-            start_index = visited[-1] if len(visited) > 0 else 0
-            start = line.index(search_string, start_index) + len(search_string)
-            visited.append(start)
-            tag_start = line.rindex('<', 0, start) + 1
-            tag_end = line.index(' ', tag_start)
+    start = line.find(search_string)
+    if start == -1:
+        return
+    html_line = line.strip('\n')
+    chars = CharPositions(line, '< "')
+    while start != -1:
+        start += len(search_string)
+        tag_start = chars.rfind('<', start) + 1
+        tag_end = chars.find(' ', tag_start)
+        end = chars.find('"', start)
+        if tag_start == 0 or not tag_start < tag_end < start or end == -1:
+            checker.add_syntax_error(root, filename, line, line_number)
+        else:
             tag = line[tag_start:tag_end]
-            identifier = {
-                'a': '',
-                'iframe': 'i',
-                'img': '!',
-                'source': 's',
-                'script': 'x',
-            }[tag]
-            end = line.index('"', start)
-            link = line[start:end]
-            if link.startswith('./dist'):
+            target = line[start:end]
+            if tag in HTML_LINK_TYPES and not target.startswith('./dist'):
+                checker.check_link(Link(
+                    root, filename, line_number, ('', target, HTML_LINK_TYPES[tag]),
+                    f'[]({target})', html_line=html_line))
+        start = line.find(search_string, start)
+
+
+class ExtractedLinks():
+    'Links found in the lines of a file, independent of the file path.'
+
+    def __init__(self, lines):
+        self.items = []
+        code_block = False
+        for line_number, line in enumerate(lines):
+            if line.startswith('```'):
+                code_block = not code_block
+            if code_block:
                 continue
-            kwargs['check_link'](
-                kwargs['root'],
-                kwargs['filename'],
-                f'{identifier}[]({link})',
-                kwargs['line_number'],
-                html_line=kwargs['line'].strip('\n'))
+            check_line(line, line_number, '', '', self)
+            for search_string in ['src="', 'href="']:
+                check_line_html(line, line_number, '', '', self, search_string)
+
+    def check_link(self, link):
+        'record a link'
+        self.items.append((link.line_number, (link.text, link.target, link.kind),
+                           link.full, link.html_line))
+
+    def add_syntax_error(self, _root, _filename, line, line_number):
+        'record a link syntax error'
+        self.items.append((line_number, None, line, None))
+
+
+def get_cache_summary(cache_stats):
+    'get the link target cache summary string'
+    hits = cache_stats['hits']
+    total = hits + cache_stats['misses']
+    metrics_string = '\n' + ' link target cache '.upper().center(50, '-')
+    metrics_string += f'\n    {hits}/{total} relative links resolved from cache'
+    metrics_string += f' ({round(100 * hits / (total or 1), 2)}%)\n\n'
+    return metrics_string
 
 
 class LinkChecker():
@@ -216,152 +293,218 @@ class LinkChecker():
     def __init__(self, summary, folder=None):
         self.summary = summary
         self.verbose = False
+        self.quiet = False
         self.folder = folder or '.'
         self.current_hub = None
         self.current_hub_path = None
         self.links = {}
         self.section_index = {}
-
-    def _allow_missing_sections(self, root, issues):
-        stable = versions.stable_version_lookup().get(self.current_hub)
-
-        def _allow(issue):
-            unstable_version = (stable is not None
-                                and versions.get_version_from_root(root) not in stable)
-            return unstable_version and issue == 'section_missing'
-        return [issue for issue in issues if not _allow(issue)]
+        self.indexed_targets = set()
+        self.resolution_cache = {}
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self.content_cache = walk.ContentCache()
+        self.current_file = None
+        self.version_policy = versions.VersionPolicy(folder=self.folder)
+        self.shard = None
 
     @staticmethod
-    def _get_local_path(local_root, filename, link):
-        if get_link_relation(link['link']) != 'relative':
+    def _get_local_path(local_root, link):
+        if link.relation != 'relative':
             return None
-        relative_path = link['link'].split('#')[0]
-        if relative_path == '':
-            relative_path = filename
-        local_path = os.path.realpath(os.sep.join([local_root, relative_path]))
-        return local_path.split(os.path.realpath('.'))[1].strip('/')
-
-    def check_link(self, root, filename, full, line_number, html_line=None):
-        'verify integrity of link'
+        return get_target_path(local_root, link.path or link.filename)
+
+    def resolve(self, link):
+        'get path dependent link check results, memoized by link target'
+        if link.relation != 'relative':
+            return {'to_absolute': None}
+        target = os.path.normpath(link.page_path())
+        key = (target, link.fragment)
+        resolution = self.resolution_cache.get(key)
+        if resolution is not None:
+            self.cache_stats['hits'] += 1
+            return resolution
+        self.cache_stats['misses'] += 1
+        to_absolute = self._get_local_path(self.current_file['local_root'], link)
+        if link.fragment is not None and not self.is_indexed(to_absolute):
+            self.index_target(link)
+        resolution = {
+            'not_found': is_not_found(link, self),
+            'section_missing': is_section_missing(link, self),
+            'to_absolute': to_absolute,
+        }
+        resolution['available-sections'] = get_sections(
+            self.section_index[self.current_hub], link
+        ) if resolution['section_missing'] else None
+        resolution['available-files'] = get_files(
+            link) if resolution['not_found'] else None
+        self.resolution_cache[key] = resolution
+        return resolution
+
+    def is_indexed(self, local_path):
+        'check if sections are indexed for a hub local path'
+        version_name = local_path.split('/')[0]
+        return (walk.is_version_name(version_name) and
+                self.version_policy.level(self.current_hub, version_name) == versions.FULL)
+
+    def index_target(self, link):
+        'index the sections of a linked file outside fully checked versions, once'
+        filepath = link.page_path()
+        file_key = os.path.realpath(filepath)
+        if file_key in self.indexed_targets or not os.path.isfile(filepath):
+            return
+        self.indexed_targets.add(file_key)
+        with open(filepath, 'r') as md_file:
+            sections = get_file_sections(md_file.readlines())
+        if len(sections) > 0:
+            self.section_index[self.current_hub][file_key] = sections
+
+    def clear_resolution_cache(self):
+        'forget memoized link targets'
+        self.resolution_cache = {}
+
+    def set_current_file(self, root, filename):
+        'compute per file link record values once'
         local_root = walk.get_local_root(self.folder, root)
-        link = parse_link(full)
-        link_check_kwargs = {
+        self.current_file = {
             'root': root,
-            'filename': filename,
-            'link': link['link'],
-            'current_hub': self.current_hub,
-            'section_index': self.section_index[self.current_hub],
+            'local_root': local_root,
+            'version': versions.get_version_from_root(local_root, index=0),
+            'from': os.sep.join([local_root, filename]),
+            'level': self.version_policy.level(self.current_hub,
+                                               local_root.split('/')[0]),
         }
+
+    def check_link(self, link):
+        'verify integrity of link'
+        current_file = self.current_file
+        resolution = self.resolve(link)
         issues = []
         for issue, issue_data in POSSIBLE_ISSUES.items():
-            if issue_data['check'](**link_check_kwargs):
+            if issue == 'section_missing' and current_file['level'] != versions.FULL:
+                continue
+            if issue in PATH_ISSUES:
+                if resolution.get(issue):
+                    issues.append(issue)
+            elif issue_data['check'](link, self):
                 issues.append(issue)
         status = 'ok'
-        problems = self._allow_missing_sections(root, issues)
-        if len(problems) > 0:
-            status = POSSIBLE_ISSUES[problems[0]]['label']
+        if len(issues) > 0:
+            status = POSSIBLE_ISSUES[issues[0]]['label']
         link_info = {
             'status': status,
-            'type': link['type'],
-            'link': get_link_relation(link['link']),
-            'version': versions.get_version_from_root(local_root, index=0),
-            'from': os.sep.join([local_root, filename]),
-            'line_number': line_number,
-            'to': link['link'],
-            'to_absolute': self._get_local_path(local_root, filename, link),
-            'text': link['text'],
-            'full': html_line or full,
+            'type': link.kind,
+            'link': link.relation,
+            'version': current_file['version'],
+            'from': current_file['from'],
+            'line_number': link.line_number,
+            'to': link.target,
+            'to_absolute': resolution['to_absolute'],
+            'text': link.text,
+            'full': link.html_line or link.full,
             'issues': issues,
-            'available-sections': get_sections(
-                link_check_kwargs['section_index'],
-                root, filename, link['link']
-            ) if 'section_missing' in issues else None,
-            'available-files': get_files(
-                root, link['link']
-            ) if 'not_found' in issues else None,
+            'available-sections': resolution.get('available-sections'),
+            'available-files': resolution.get('available-files'),
         }
         self.links[self.current_hub].append(link_info)
         if self.verbose:
             icon = 'X' if len(issues) > 0 else '|'
-            print(f'{icon}{walk.get_indent(local_root) * 3}{link["link"]}')
+            indent = walk.get_indent(current_file['local_root'])
+            print(f'{icon}{indent * 3}{link.target}')
+
+    def index_file(self, root, filename, lines):
+        'add the markdown headers of a file to the section index'
+        filepath = os.sep.join([root, filename])
+        file_key = os.path.realpath(filepath)
+        hub_index = self.section_index[self.current_hub]
+        hub_index.pop(file_key, None)
+        self.clear_resolution_cache()
+        sections = get_file_sections(lines)
+        if len(sections) > 0:
+            hub_index[file_key] = sections
 
     def index_sections(self):
         'generate an index of markdown headers in directory files'
-        def _parse_lines(root, filename, lines):
-            for line in lines:
-                for i in range(1, 4):
-                    section_prefix = '#' * i + ' '
-                    if line.startswith(section_prefix):
-                        filepath = os.sep.join([root, filename])
-                        file_key = os.path.realpath(filepath)
-                        header_text = line.split(section_prefix)[1].strip()
-                        section = get_section_link(header_text)
-                        hub = self.current_hub
-                        existing = self.section_index[hub].get(file_key, [])
-                        self.section_index[hub][file_key] = existing + [section]
         path = self.current_hub_path
-        walk.walk_through_files(self.folder, path, _parse_lines,
-                                self.verbose, quiet=True)
+        include = self.version_policy.include_full(self.current_hub)
+        walk.walk_through_files(self.folder, path, self.index_file,
+                                self.verbose, quiet=True, include_version=include)
 
-    def add_syntax_error(self, **kwargs):
+    def add_syntax_error(self, _root, _filename, line, line_number):
         'add link syntax error'
-        local_root = walk.get_local_root(self.folder, kwargs['root'])
+        if not self.quiet:
+            print('invalid syntax: ', line)
         self.links[self.current_hub].append({
             'status': 'syntax error',
             'type': 'unknown',
             'link': 'unknown',
-            'version': versions.get_version_from_root(local_root, index=0),
-            'from': os.sep.join([local_root, kwargs['filename']]),
-            'line_number': kwargs['line_number'],
+            'version': self.current_file['version'],
+            'from': self.current_file['from'],
+            'line_number': line_number,
             'to': 'unknown',
             'to_absolute': 'unknown',
             'text': 'unknown',
-            'full': kwargs['line'].strip('\n'),
+            'full': line.strip('\n'),
             'issues': ['syntax_error'],
-            'line': kwargs['line'],
+            'line': line,
         })
 
+    def check_file(self, root, filename, lines):
+        'verify integrity of links in a markdown file'
+        self.set_current_file(root, filename)
+        extracted = self.content_cache.get(lines, ExtractedLinks)
+        for line_number, parsed, full, html_line in extracted.items:
+            if parsed is None:
+                self.add_syntax_error(root, filename, full, line_number)
+                continue
+            self.check_link(
+                Link(root, filename, line_number, parsed, full, html_line))
+
     def check_links(self):
         'verify integrity of links in a directory'
-        def _parse_lines(root, filename, lines):
-            code_block = False
-            for line_number, line in enumerate(lines):
-                if line.startswith('```'):
-                    code_block = not code_block
-                if code_block:
-                    continue
-                line_check_kwargs = {
-                    'check_link': self.check_link,
-                    'filename': filename,
-                    'root': root,
-                    'line': line,
-                    'line_number': line_number,
-                    'search_string': '](',
-                    'add_syntax_error': self.add_syntax_error,
-                }
-                check_line(**line_check_kwargs)
-                for search_string in ['src="', 'href="']:
-                    line_check_kwargs['search_string'] = search_string
-                    check_line_html(**line_check_kwargs)
         path = self.current_hub_path
-        walk.walk_through_files(self.folder, path, _parse_lines, self.verbose)
+        include = self.version_policy.include(self.current_hub)
+        include_file = None if self.shard is None else self.shard.includes
+        walk.walk_through_files(self.folder, path, self.check_file, self.verbose,
+                                quiet=self.quiet, include_version=include,
+                                include_file=include_file,
+                                summary=self.summary)
+
+    def start_hub(self, hub):
+        'reset hub data and check if the hub directory exists'
+        self.current_hub = hub
+        self.section_index[hub] = {}
+        self.indexed_targets = set()
+        self.links[hub] = self.summary.new_results()
+        self.clear_resolution_cache()
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self.content_cache.reset_stats()
+        self.current_hub_path = f'{self.folder}/farmbot-{hub}'
+        return os.path.exists(self.current_hub_path)
+
+    def add_cache_summary(self, hub):
+        'add link target resolution cache statistics to summary'
+        self.summary.add_arbitrary_data(hub, 'resolution_cache',
+                                        dict(self.cache_stats))
+        self.summary.add_extra_summary(hub, get_cache_summary(self.cache_stats))
+        self.summary.add_arbitrary_data(hub, 'link_content_reuse',
+                                        dict(self.content_cache.stats))
+        self.summary.add_extra_summary(
+            hub, walk.get_reuse_summary(self.content_cache.stats))
 
     def check_all(self, hubs=None):
         'check links in all hubs'
         if hubs is None:
             hubs = versions.HUBS
         for hub in hubs:
-            self.current_hub = hub
-            self.section_index[hub] = {}
-            self.links[hub] = []
             hub_title = f'farmbot-{hub}'
-            self.current_hub_path = f'{self.folder}/{hub_title}'
-            if os.path.exists(self.current_hub_path):
+            if self.start_hub(hub):
                 if self.verbose:
                     walk.print_hub_title(hub)
-                else:
+                elif not self.quiet:
                     print(f'checking links in {hub_title}...', end='')
                 self.index_sections()
                 self.check_links()
+                self.add_cache_summary(hub)
         self.summary.add_results('links', self.links)
-        print()
+        if not self.quiet:
+            print()
@@ -3,8 +3,11 @@
 'Verify table of contents entries.'
 
 import os
-import yaml
-from util import versions, walk
+import sys
+import time
+from util import versions
+from util.redirects import RedirectIndex
+from util.schedule import get_toc_key
 
 
 def missing(**kwargs):
@@ -19,12 +22,13 @@ def title_mismatch(**kwargs):
 
 def redirect_missing(**kwargs):
     'Check if a ToC page has a redirect file.'
-    hub_dir = os.sep.join(kwargs['filename'].split('/')[:2])
+    folder, hub_dir_name, local_path = versions.split_hub_path(kwargs['filename'])
+    hub_dir = os.path.join(folder, hub_dir_name)
     hub = versions.get_hub_from_dir(hub_dir)
-    version = versions.get_version_from_root(kwargs['filename'])
-    if version not in versions.latest_stable_versions(hub):
+    version = versions.get_version_from_root(local_path, 0)
+    if version not in versions.latest_stable_versions(hub, folder):
         return False
-    if versions.get_hub_from_dir(hub_dir) == 'oer':
+    if hub == 'oer':
         return False
     redirects_dir = os.path.join(hub_dir, '_redirects')
     filename = kwargs['filename'].split('/')[-1]
@@ -59,8 +63,12 @@ class TocChecker():
     def __init__(self, summary, folder=None):
         self.summary = summary
         self.folder = folder or '.'
+        self.quiet = False
         self.current_hub = None
         self.pages = {}
+        self.redirect_indexes = {}
+        self.toc_paths = {}
+        self.version_policy = versions.VersionPolicy(folder=self.folder)
 
     def _descend(self, path, entry):
         if entry.get('pages') is None:
@@ -98,7 +106,8 @@ class TocChecker():
             status = POSSIBLE_ISSUES[problems[0]]['label']
         toc_page_info = {
             'status': status,
-            'version': versions.get_version_from_root(page_filename),
+            'version': versions.get_version_from_root(
+                versions.split_hub_path(page_filename)[2], 0),
             'page': page_filename,
             'slug': page_filename.split('/')[-1].split('.')[0],
             'toc_page_title': page_data['title'],
@@ -107,80 +116,85 @@ class TocChecker():
             'issues': issues,
         }
         self.pages[self.current_hub].append(toc_page_info)
+        self.toc_paths[self.current_hub].add(page_filename)
 
     def check_toc(self, hub_dir, toc_dir, toc_filename):
         'verify integrity of toc entries'
+        import yaml
         with open(os.path.join(toc_dir, toc_filename), 'r') as toc_file:
             toc_data = yaml.safe_load(toc_file)
         version_number = toc_data['version_number']
         hub = versions.get_hub_from_dir(hub_dir)
         version = versions.get_version_string(hub, version_number)
-        print(version, end=' ', flush=True)
+        if self.version_policy.level(hub, version) == versions.SKIP:
+            return
+        if not self.quiet:
+            print(version, end=' ', flush=sys.stdout.isatty())
         for section in toc_data['contents']:
             section_path = os.sep.join([hub_dir, version, section['url']])
             self._descend(section_path, section)
 
+    def check_hub(self, hub):
+        'check tocs, redirects, and hover images in a hub'
+        self.current_hub = hub
+        self.pages[hub] = self.summary.new_results()
+        self.toc_paths[hub] = set()
+        hub_dir = f'{self.folder}/farmbot-{hub}'
+        if not os.path.exists(hub_dir):
+            return False
+        if not self.quiet:
+            print(f'checking ToCs in {hub_dir}...', end='')
+        toc_dir = f'{hub_dir}/_data/toc'
+        toc_filenames = os.listdir(toc_dir)
+        for toc_filename in sorted(toc_filenames):
+            self.check_toc(hub_dir, toc_dir, toc_filename)
+        redirect_index = get_redirect_index(hub_dir)
+        self.redirect_indexes[hub] = redirect_index
+        broken_redirects = verify_redirects(hub_dir, self.toc_paths[hub],
+                                            redirect_index)
+        self.summary.add_extra_summary(hub, broken_redirects)
+        if '.md' in broken_redirects:
+            pass
+            # self.summary.exit_code = 1
+        for key, verify_images in [('broken_hover_images', verify_hover_images),
+                                   ('broken_part_images', verify_part_images)]:
+            broken_images, paths = verify_images(hub_dir)
+            self.summary.add_extra_summary(hub, broken_images)
+            broken_paths = sorted({path for path in paths if not os.path.exists(
+                os.sep.join([hub_dir, path]))})
+            self.summary.add_arbitrary_data(hub, key, broken_paths)
+            if len(broken_paths) > 0:
+                self.summary.exit_code = 1
+                self.summary.count_issues(len(broken_paths))
+        return True
+
     def check_all(self, hubs=None):
         'check tocs in all hubs'
         if hubs is None:
             hubs = versions.HUBS
         for hub in hubs:
-            self.current_hub = hub
-            self.pages[hub] = []
-            hub_dir = f'{self.folder}/farmbot-{hub}'
-            if os.path.exists(hub_dir):
-                print(f'checking ToCs in {hub_dir}...', end='')
-                toc_dir = f'{hub_dir}/_data/toc'
-                toc_filenames = os.listdir(toc_dir)
-                for toc_filename in sorted(toc_filenames):
-                    self.check_toc(hub_dir, toc_dir, toc_filename)
-                    self.summary.add_results('toc', self.pages)
-                broken_redirects = verify_redirects(hub_dir, self.pages)
-                self.summary.add_extra_summary(hub, broken_redirects)
-                if '.md' in broken_redirects:
-                    pass
-                    # self.summary.exit_code = 1
-                broken_hover_images, _ = verify_hover_images(hub_dir)
-                self.summary.add_extra_summary(hub, broken_hover_images)
-                if 'page: ' in broken_hover_images:
-                    self.summary.exit_code = 1
-                broken_part_images, _ = verify_part_images(hub_dir)
-                self.summary.add_extra_summary(hub, broken_part_images)
-                if 'path: ' in broken_part_images:
-                    self.summary.exit_code = 1
-                print()
-        print()
+            start = time.perf_counter()
+            checked = self.check_hub(hub)
+            self.summary.add_cost(get_toc_key(hub), time.perf_counter() - start)
+            if checked:
+                self.summary.add_results('toc', self.pages)
+                self.summary.save_json(f'{hub}_redirects.json',
+                                       self.redirect_indexes[hub].lookup_table(),
+                                       compact=True)
+                if not self.quiet:
+                    print()
+        if not self.quiet:
+            print()
 
 
-def verify_redirects(hub_dir, all_pages):
+def verify_redirects(hub_dir, toc_paths, redirect_index=None):
     'Verify redirect integrity.'
-    def _redirect_path(latest_version, redirect, redirect_dir):
-        redirect_filename = os.path.join(redirect_dir, redirect)
-        with open(redirect_filename, 'r') as redirect_file:
-            lines = redirect_file.readlines()
-        for line in lines:
-            if line.startswith('page_path:'):
-                page_path = line.split('page_path:')[1].strip()
-                filepath = os.sep.join([
-                    hub_dir, latest_version, page_path]) + '.md'
-                filepath = filepath.replace('//', '/')
-                return filepath
-
-    hub = versions.get_hub_from_dir(hub_dir)
-    latest_version_number = (versions.latest_stable_versions(hub) or [1])[-1]
-    latest_version = versions.get_version_string(hub, latest_version_number)
-    redirect_dir = os.path.join(hub_dir, '_redirects')
+    if redirect_index is None:
+        redirect_index = get_redirect_index(hub_dir)
+    latest_version = redirect_index.latest_version
     missing_files = ''
-    if os.path.exists(redirect_dir):
-        redirects = []
-        broken_redirect_info = []
-        for redirect in os.listdir(redirect_dir):
-            filepath = _redirect_path(latest_version, redirect, redirect_dir)
-            if filepath is not None:
-                if not os.path.exists(filepath):
-                    info = [filepath, os.path.join(redirect_dir, redirect)]
-                    broken_redirect_info.append(info)
-                redirects.append(filepath)
+    if os.path.exists(redirect_index.redirect_dir):
+        broken_redirect_info = redirect_index.broken
         if len(broken_redirect_info) > 0:
             missing_files += '\n' + ' broken redirects '.upper().center(50, '-') + '\n'
         for broken_redirect in broken_redirect_info:
@@ -188,21 +202,20 @@ def verify_redirects(hub_dir, all_pages):
             missing_files += f'  {versions.color(redirect_info, "yellow")}\n'
         missing_files += '\n\n'
     version_dir = os.path.join(hub_dir, latest_version)
-    if versions.get_version_from_root(version_dir) != 'docs':
+    if latest_version != 'docs':
         pages = []
         for root, _dirs, files in sorted(os.walk(version_dir)):
             files = [f for f in files if f.endswith('.md')]
             for filename in files:
                 page_filename = os.path.join(root, filename)
                 pages.append(page_filename)
-        missing_redirects = set(pages) - set(redirects)
+        missing_redirects = redirect_index.missing(pages)
         if len(missing_redirects) > 0:
             missing_files += '\n' + ' missing redirects '.upper().center(50, '-') + '\n'
         taken_redirects = []
         for missing_redirect in missing_redirects:
-            page = missing_redirect.split('/')[-1]
-            if page in os.listdir(redirect_dir):
-                path = _redirect_path(latest_version, page, redirect_dir)
+            if redirect_index.is_taken(missing_redirect):
+                path = redirect_index.taken_by(missing_redirect)
                 taken_redirects.append([missing_redirect, path])
             else:
                 missing_files += f'  {versions.color(missing_redirect, "yellow")}\n'
@@ -215,7 +228,7 @@ def verify_redirects(hub_dir, all_pages):
             missing_files += f'  missing:  {versions.color(taken_redirect[0], "yellow")}\n'
             missing_files += f'  taken by: {taken_redirect[1]}\n\n'
         missing_files += '\n\n'
-        not_in_toc = set(pages) - set([p['page'] for p in all_pages[hub]])
+        not_in_toc = set(pages) - set(toc_paths)
         not_in_toc = [p for p in not_in_toc
                       if 'bom' not in p.split('/') and 'bom.md' not in p.split('/')]
         if len(not_in_toc) > 0:
@@ -223,9 +236,40 @@ def verify_redirects(hub_dir, all_pages):
         for page in not_in_toc:
             missing_files += f'  {versions.color(page, "yellow")}\n'
         missing_files += '\n\n'
+    missing_files += redirect_graph_summary(redirect_index)
     return missing_files if '.md' in missing_files else ''
 
 
+def get_redirect_index(hub_dir):
+    'Build the redirect index for the latest hub version.'
+    hub = versions.get_hub_from_dir(hub_dir)
+    folder = os.path.dirname(os.path.normpath(hub_dir)) or '.'
+    latest_version_number = (versions.latest_stable_versions(hub, folder) or [1])[-1]
+    latest_version = versions.get_version_name(hub, latest_version_number, folder)
+    return RedirectIndex(hub_dir, latest_version)
+
+
+def redirect_graph_summary(redirect_index):
+    'Summarize redirect chains, cycles, and duplicate targets.'
+    summary = ''
+    chains, cycles = redirect_index.chains_and_cycles()
+    for title, paths in [('redirect chains', chains), ('redirect cycles', cycles)]:
+        if len(paths) > 0:
+            summary += '\n' + f' {title} '.upper().center(50, '-') + '\n'
+        for path in paths:
+            arrows = ' -> '.join(f'{slug}.md' for slug in path)
+            summary += f'  {versions.color(arrows, "yellow")}\n'
+        if len(paths) > 0:
+            summary += '\n\n'
+    duplicates = redirect_index.duplicate_targets()
+    if len(duplicates) > 0:
+        summary += '\n' + ' duplicate redirect targets '.upper().center(50, '-') + '\n'
+    for page, redirects in duplicates.items():
+        summary += f'  {versions.color(page, "yellow")}\n'
+        summary += f'  redirects: {", ".join(redirects)}\n\n'
+    return summary
+
+
 def verify_hover_images(hub_dir):
     'Verify hover image integrity.'
     broken = '\n' + ' broken hover image paths '.upper().center(50, '-') + '\n'
@@ -233,6 +277,7 @@ def verify_hover_images(hub_dir):
     hov_img_data_dir = f'{hub_dir}/_data/section_images'
     if not os.path.exists(hov_img_data_dir):
         return '', paths
+    import yaml
     data_filenames = os.listdir(hov_img_data_dir)
     for data_filename in sorted(data_filenames):
         data_filepath = os.path.join(hov_img_data_dir, data_filename)
@@ -260,6 +305,7 @@ def verify_part_images(hub_dir):
     part_img_data_dir = f'{hub_dir}/_data/part_hover_images'
     if not os.path.exists(part_img_data_dir):
         return '', paths
+    import yaml
     data_filenames = os.listdir(part_img_data_dir)
     for data_filename in sorted(data_filenames):
         data_filepath = os.path.join(part_img_data_dir, data_filename)
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+
+'Documentation check command line interface.'
+
+import os
+import sys
+import time
+import argparse
+
+CHECKERS = {
+    'toc': 'TocChecker',
+    'emoji': 'EmojiChecker',
+    'links': 'LinkChecker',
+    'images': 'ImageFileChecker',
+}
+
+COMMANDS = list(CHECKERS) + ['all', 'merge', 'watch', 'serve', 'query']
+
+PRIORITY_ORDER = ['toc', 'links', 'emoji', 'images']
+PARTIAL_RESULTS = {'toc': 'pages', 'emoji': 'emojis', 'links': 'links'}
+INCOMPLETE_EXIT_CODE = 3
+
+
+def shard_option(text):
+    'parse a --shard value'
+    from util.shards import parse_shard
+    try:
+        return parse_shard(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from error
+
+
+def size_option(text):
+    'parse a --max-size value'
+    width, _, height = text.lower().partition('x')
+    if not (width.isdigit() and height.isdigit() and int(width) > 0 and int(height) > 0):
+        raise argparse.ArgumentTypeError(
+            f'invalid size {text!r} (expected WIDTHxHEIGHT, like 1600x1600)')
+    return int(width), int(height)
+
+
+def version_option(text):
+    'check a --version value'
+    from util.walk import is_version_name
+    if not is_version_name(text):
+        raise argparse.ArgumentTypeError(
+            f'invalid version {text!r} (expected a number like v1.6, or docs)')
+    return text
+
+
+def get_parser():
+    'build the argument parser'
+    parser = argparse.ArgumentParser(
+        description='Check FarmBot documentation files. (default command: all)')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    scope = argparse.ArgumentParser(add_help=False)
+    scope.add_argument('--hub', action='append', dest='hubs', metavar='HUB',
+                       help='only check this hub (repeatable)')
+    scope.add_argument('--folder', default='.',
+                       help='directory containing hub checkouts (default: current)')
+    policy = argparse.ArgumentParser(add_help=False)
+    policy.add_argument('--version', action='append', dest='versions',
+                        type=version_option, metavar='VERSION',
+                        help='only check this version, e.g. v1.6 (repeatable)')
+    policy.add_argument('--stable-only', action='store_true',
+                        help='skip unstable (archived or upcoming) versions')
+    store = argparse.ArgumentParser(add_help=False)
+    store.add_argument('--results-db', action='store_true',
+                       help='also store results in results/results.sqlite')
+    store.add_argument('--baseline', metavar='FILE',
+                       help='only report issues that are not in FILE, '
+                       'and set the exit code from new issues')
+    store.add_argument('--update-baseline', action='store_true',
+                       help='save current issues to the --baseline file')
+    store.add_argument('--color', choices=['auto', 'always', 'never'],
+                       default='auto', help='color output (default: auto, '
+                       'when writing to a terminal)')
+    store.add_argument('--max-listed', type=int, metavar='N',
+                       help='list at most N issues per category in the summary')
+    store.add_argument('--metrics', metavar='FILE',
+                       help='write OpenMetrics statistics and timings to FILE')
+    store.add_argument('--html-report', action='store_true',
+                       help='also write a paged HTML report to results/report/')
+    store.add_argument('--timing-history', metavar='FILE',
+                       help='per-file check times, updated by each run and used '
+                       'to balance shards (default: results/timings.json)')
+    check = argparse.ArgumentParser(add_help=False)
+    check.add_argument('--issues-only', action='store_true',
+                       help='keep only problem results in memory and in results/')
+    check.add_argument('--fail-fast', type=int, metavar='N',
+                       help='stop after N issues')
+    check.add_argument('--time-budget', type=float, metavar='SECONDS',
+                       help='run the most useful checks first and stop after '
+                       f'SECONDS (exit code {INCOMPLETE_EXIT_CODE} if no issues '
+                       'were found before stopping)')
+    check.add_argument('--shard', type=shard_option, metavar='I/N',
+                       help='only check shard I of N, saving partial results '
+                       'to results/shard-I-of-N/ (see merge)')
+    check.add_argument('--workers', type=int, metavar='N',
+                       help='run checks in N local processes, most costly files '
+                       'first, and merge the results')
+
+    optimize = argparse.ArgumentParser(add_help=False)
+    optimize.add_argument('--duplicates', action='store_true',
+                          help='report exact and near-duplicate images '
+                          '(requires Pillow and NumPy)')
+    optimize.add_argument('--optimize', action='store_true',
+                          help='resize and re-encode large images (requires Pillow)')
+    optimize.add_argument('--max-size', default='1600x1600', type=size_option,
+                          metavar='WxH',
+                          help='maximum optimized image size (default: 1600x1600)')
+    optimize.add_argument('--quality', type=int, default=85,
+                          help='JPEG and WebP quality (default: 85)')
+    optimize.add_argument('--min-size', type=float, default=0.5, metavar='MB',
+                          help='optimize images of at least this size (default: 0.5)')
+    optimize.add_argument('--jobs', type=int,
+                          help='optimization processes (default: CPU count)')
+    optimize.add_argument('--write', action='store_true',
+                          help='replace images with smaller optimized versions')
+
+    for name in CHECKERS:
+        parents = [scope, policy, store, check]
+        if name == 'images':
+            parents.append(optimize)
+        commands.add_parser(name, parents=parents, help=f'check {name}')
+    commands.add_parser('all', parents=[scope, policy, store, check, optimize],
+                        help='run all checks')
+    commands.add_parser('merge', parents=[scope, policy, store],
+                        help='combine shard results and run deferred checks')
+    commands.add_parser('watch', parents=[scope],
+                        help='re-check files when they are saved')
+    serve = commands.add_parser('serve', parents=[scope],
+                                help='serve JSON-RPC check requests')
+    serve.add_argument('--socket', help='Unix socket path (default: stdio)')
+    commands.add_parser('query', add_help=False,
+                        help='query stored results (see query --help)')
+    return parser
+
+
+def get_version_policy(options):
+    'get version check levels from options'
+    from util.versions import VersionPolicy, get_version_from_root, LIGHT, SKIP
+    only_versions = None
+    if options.versions:
+        only_versions = {get_version_from_root(name, 0) for name in options.versions}
+    unstable = SKIP if options.stable_only else LIGHT
+    return VersionPolicy(unstable, only_versions, options.folder)
+
+
+def get_image_optimizer(options):
+    'get an image optimizer from options'
+    from util.optimize_images import ImageOptimizer
+    max_width, max_height = options.max_size
+    return ImageOptimizer({
+        'max_width': max_width,
+        'max_height': max_height,
+        'quality': options.quality,
+        'min_megabytes': options.min_size,
+    }, jobs=options.jobs, write=options.write)
+
+
+def set_color_option(options):
+    'apply the --color option'
+    from util.versions import set_color
+    set_color({'auto': None, 'always': True, 'never': False}[options.color])
+
+
+def get_checker(options, name, summary, version_policy):
+    'create a checker from options'
+    import util
+    checker = getattr(util, CHECKERS[name])(summary, options.folder)
+    checker.version_policy = version_policy
+    if name == 'images' and getattr(options, 'optimize', False):
+        checker.optimizer = get_image_optimizer(options)
+    if name == 'images' and getattr(options, 'duplicates', False):
+        checker.options['duplicates'] = True
+    return checker
+
+
+def run_checks(options, checker_names):
+    'run checkers and print a summary'
+    import util
+    set_color_option(options)
+    from util.versions import HUBS, print_stable_versions
+    hubs = options.hubs or HUBS
+    print_stable_versions(hubs, options.folder)
+    results_db = None
+    if options.results_db:
+        from util.results_db import ResultsStore
+        results_db = ResultsStore()
+    version_policy = get_version_policy(options)
+    shard_filter = None
+    results_dir = 'results'
+    deferred = []
+    if options.shard is not None:
+        from util.shards import ShardFilter, get_shard_dir, DEFERRED_CHECKS
+        from util.schedule import TimingHistory
+        shard_filter = ShardFilter(options.folder, hubs, *options.shard,
+                                   version_policy,
+                                   TimingHistory(options.timing_history))
+        results_dir = get_shard_dir(*options.shard)
+        deferred = [name for name in checker_names if name in DEFERRED_CHECKS]
+        checker_names = [name for name in checker_names if name not in deferred]
+    from util.summary import StopChecks
+    summary = util.Summary(results_db, options.issues_only, results_dir)
+    summary.set_limits(options.fail_fast, options.time_budget)
+    if options.fail_fast is not None or options.time_budget is not None:
+        checker_names = [name for name in PRIORITY_ORDER if name in checker_names]
+    extra_summaries = {}
+    for i, name in enumerate(checker_names):
+        if summary.out_of_time():
+            summary.stopped = 'time budget used'
+        if summary.stopped is not None:
+            summary.stopped += f', not checked: {", ".join(checker_names[i:])}'
+            break
+        checker = get_checker(options, name, summary, version_policy)
+        checker_hubs = hubs
+        if shard_filter is not None:
+            from util.shards import HUB_CHECKS
+            if name in HUB_CHECKS:
+                checker_hubs = [hub for hub in hubs if shard_filter.includes_hub(hub)]
+            else:
+                checker.shard = shard_filter
+        lengths = {hub: len(string)
+                   for hub, string in summary.extra_summaries.items()}
+        start = time.perf_counter()
+        try:
+            checker.check_all(checker_hubs)
+        except StopChecks:
+            print()
+            if name in PARTIAL_RESULTS:
+                summary.add_results(name, getattr(checker, PARTIAL_RESULTS[name]))
+        summary.add_timing(name, time.perf_counter() - start)
+        if shard_filter is not None:
+            from util.shards import get_new_extra_summaries
+            extra_summaries[name] = get_new_extra_summaries(summary, lengths)
+    if shard_filter is not None:
+        from util.shards import save_shard_info
+        save_shard_info(summary, shard_filter, checker_names, deferred,
+                        extra_summaries)
+    else:
+        from util.schedule import save_costs
+        save_costs(summary, options.timing_history)
+    return report(options, summary)
+
+
+def report(options, summary):
+    'print a summary, or only baseline changes, and return the exit code'
+    if options.metrics:
+        from util.metrics import write_metrics
+        write_metrics(summary, options.metrics)
+    if options.html_report:
+        from util.html_report import write_html_report
+        print(f'wrote {write_html_report(summary)}')
+    if options.baseline is None:
+        max_count = options.max_listed
+        summary.print(max_link_issue_print_count=max_count,
+                      max_image_issue_print_count=max_count,
+                      max_issue_print_count=max_count)
+        if summary.stopped is not None and summary.exit_code == 0:
+            return INCOMPLETE_EXIT_CODE
+        return summary.exit_code
+    from util import baseline
+    known = baseline.load_baseline(options.baseline)
+    issues = baseline.collect_issues(summary)
+    if options.update_baseline:
+        baseline.save_baseline(options.baseline, issues)
+        print(f'saved {len(issues)} issues to {options.baseline}')
+        return 0
+    new, fixed = baseline.compare(known, issues)
+    baseline.print_baseline_report(new, fixed, len(issues) - len(new))
+    return 1 if len(new) > 0 else 0
+
+
+def merge_shards(options):
+    'combine shard results, run deferred checks, and print a summary'
+    import util
+    set_color_option(options)
+    from util.shards import merge
+    results_db = None
+    if options.results_db:
+        from util.results_db import ResultsStore
+        results_db = ResultsStore()
+    summary = util.Summary(results_db)
+    try:
+        deferred, shard_hubs = merge(summary)
+    except ValueError as error:
+        print(f'merge: {error}', file=sys.stderr)
+        return 2
+    version_policy = get_version_policy(options)
+    for name in deferred:
+        checker = get_checker(options, name, summary, version_policy)
+        start = time.perf_counter()
+        checker.check_all(options.hubs or shard_hubs)
+        summary.add_timing(name, time.perf_counter() - start)
+    from util.schedule import save_costs
+    save_costs(summary, options.timing_history)
+    return report(options, summary)
+
+
+def get_worker_args(options):
+    'get the command line of a local worker'
+    args = [options.command, '--folder', options.folder, '--color', 'never']
+    for hub in options.hubs or []:
+        args += ['--hub', hub]
+    for version in options.versions or []:
+        args += ['--version', version]
+    if options.stable_only:
+        args.append('--stable-only')
+    if options.issues_only:
+        args.append('--issues-only')
+    return args
+
+
+def run_workers(options):
+    'run checks in local shard processes and merge their results'
+    from util.shards import remove_shard_dirs
+    from util.schedule import DEFAULT_HISTORY_FILENAME, run_workers as run
+    from util.walk import get_relative_filename
+    history_filename = (options.timing_history
+                        or get_relative_filename(DEFAULT_HISTORY_FILENAME))
+    remove_shard_dirs()
+    exit_codes = run(get_worker_args(options), options.workers, history_filename)
+    if max(exit_codes) > 1:
+        print('some workers failed', file=sys.stderr)
+        return max(exit_codes)
+    return merge_shards(options)
+
+
+def main(args=None):
+    'run the command line interface'
+    args = sys.argv[1:] if args is None else list(args)
+    if args[:1] == ['query']:
+        from util.results_db import main as query_main
+        query_main(args[1:])
+        return 0
+    if len(args) == 0 or args[0] not in COMMANDS + ['-h', '--help']:
+        args = ['all'] + args
+    parser = get_parser()
+    options = parser.parse_args(args)
+    options.folder = os.path.normpath(options.folder)
+    limited = (getattr(options, 'fail_fast', None) is not None
+               or getattr(options, 'time_budget', None) is not None)
+    if getattr(options, 'workers', None) is not None:
+        if options.workers < 1:
+            parser.error('--workers must be at least 1')
+        if options.shard is not None or limited:
+            parser.error('--workers is not supported with --shard, '
+                         '--fail-fast or --time-budget')
+    if getattr(options, 'shard', None) is not None:
+        if options.results_db or options.baseline:
+            parser.error('--results-db and --baseline are not supported with '
+                         '--shard (use them with merge)')
+    if limited and getattr(options, 'baseline', None) is not None:
+        parser.error('--baseline is not supported with --fail-fast or --time-budget')
+    if getattr(options, 'update_baseline', False) and options.baseline is None:
+        parser.error('--update-baseline requires --baseline FILE')
+    if options.command == 'watch':
+        from util.watch import watch
+        try:
+            watch(options.folder, options.hubs)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if options.command == 'serve':
+        from util.server import serve
+        serve(options.folder, options.hubs, options.socket)
+        return 0
+    if options.command == 'merge':
+        return merge_shards(options)
+    if getattr(options, 'workers', None) is not None:
+        return run_workers(options)
+    if options.command == 'all':
+        return run_checks(options, list(CHECKERS))
+    return run_checks(options, [options.command])
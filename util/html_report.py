@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+'Write an HTML report with issue tables that load in pages.'
+
+import os
+import re
+import json
+import html
+from util.summary import get_stats
+from util.walk import get_relative_filename
+
+DEFAULT_REPORT_DIR = 'results/report'
+ANSI_CODES = re.compile(r'\033\[[0-9;]*m')
+ISSUE_COLUMNS = {
+    'links': ['status', 'type', 'from', 'line_number', 'to', 'issues'],
+    'emoji': ['status', 'from', 'line_number', 'emoji', 'issues'],
+    'toc': ['status', 'page', 'slug', 'toc_page_title', 'md_page_title', 'issues'],
+}
+
+PAGE_SCRIPT = '''
+var pages = {};
+function reportPage(id, number, rows) {
+  pages[id + '/' + number] = rows;
+  showPage(id, number);
+}
+function showPage(id, number) {
+  var rows = pages[id + '/' + number];
+  var section = document.getElementById(id);
+  if (rows === undefined) {
+    var script = document.createElement('script');
+    script.src = 'data/' + id + '-' + number + '.js';
+    document.body.appendChild(script);
+    return;
+  }
+  var body = section.querySelector('tbody');
+  body.textContent = '';
+  rows.forEach(function (row) {
+    var tr = document.createElement('tr');
+    row.forEach(function (value) {
+      var td = document.createElement('td');
+      td.textContent = value;
+      tr.appendChild(td);
+    });
+    body.appendChild(tr);
+  });
+  section.querySelector('.page').textContent = number + 1;
+  section.dataset.page = number;
+}
+function turnPage(id, step) {
+  var section = document.getElementById(id);
+  var number = Number(section.dataset.page) + step;
+  if (number >= 0 && number < Number(section.dataset.pages)) {
+    showPage(id, number);
+  }
+}
+'''
+
+STYLE = '''
+body { font-family: sans-serif; margin: 2em; }
+table { border-collapse: collapse; margin: 0.5em 0; }
+td, th { border: 1px solid #ccc; padding: 0.2em 0.5em; text-align: left; }
+pre { background: #f6f6f6; padding: 0.5em; }
+'''
+
+
+def get_rows(records, columns):
+    'get table rows of problem records'
+    rows = []
+    for record in records:
+        if record['status'] == 'ok':
+            continue
+        row = []
+        for column in columns:
+            value = record.get(column)
+            if isinstance(value, list):
+                value = ', '.join(value)
+            row.append('' if value is None else str(value))
+        rows.append(row)
+    return rows
+
+
+def write_page(data_dir, table_id, number, rows):
+    'write one page of table rows as a script'
+    filepath = os.path.join(data_dir, f'{table_id}-{number}.js')
+    with open(filepath, 'w') as page_file:
+        page_file.write(f'reportPage({json.dumps(table_id)}, {number}, '
+                        f'{json.dumps(rows, separators=(",", ":"))});\n')
+
+
+def get_table(table_id, columns, page_count):
+    'get the html of a paged table'
+    header = ''.join(f'<th>{html.escape(column)}</th>' for column in columns)
+    return (f'<div id="{table_id}" data-page="0" data-pages="{page_count}">'
+            f'<button onclick="turnPage(\'{table_id}\', -1)">previous</button> '
+            f'page <span class="page">1</span> of {page_count} '
+            f'<button onclick="turnPage(\'{table_id}\', 1)">next</button>'
+            f'<table><thead><tr>{header}</tr></thead><tbody></tbody></table></div>')
+
+
+def write_html_report(summary, report_dir=None, page_size=100):
+    'write the report and return the index file path'
+    report_dir = report_dir or get_relative_filename(DEFAULT_REPORT_DIR)
+    data_dir = os.path.join(report_dir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    for filename in os.listdir(data_dir):
+        os.remove(os.path.join(data_dir, filename))
+    status = 'Issues found.' if summary.exit_code else 'No issues found.'
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8">',
+             '<title>FarmBot documentation check report</title>',
+             f'<style>{STYLE}</style><script>{PAGE_SCRIPT}</script></head><body>',
+             '<h1>FarmBot documentation check report</h1>',
+             f'<p>{status}</p>']
+    first_pages = []
+    for hub in summary.get_hubs():
+        parts.append(f'<h2>farmbot-{html.escape(hub)}</h2>')
+        extra = ANSI_CODES.sub('', summary.extra_summaries.get(hub) or '')
+        if extra.strip():
+            parts.append(f'<details><summary>details</summary>'
+                         f'<pre>{html.escape(extra)}</pre></details>')
+        for results_key, hub_results in summary.results.items():
+            records = hub_results.get(hub, [])
+            group = get_stats(records).group()
+            columns = ISSUE_COLUMNS[results_key]
+            rows = get_rows(records, columns)
+            parts.append(f'<h3>{results_key}</h3><p>{group["total"]} total, '
+                         f'{group["ok"]} ok, {len(rows)} with issues</p>')
+            if len(rows) == 0:
+                continue
+            table_id = f'{hub}-{results_key}'
+            page_count = (len(rows) + page_size - 1) // page_size
+            for number in range(page_count):
+                write_page(data_dir, table_id, number,
+                           rows[number * page_size:(number + 1) * page_size])
+            parts.append(get_table(table_id, columns, page_count))
+            first_pages.append(table_id)
+    load_first = ''.join(f'showPage({json.dumps(table_id)}, 0);'
+                         for table_id in first_pages)
+    parts.append(f'<script>{load_first}</script></body></html>')
+    filepath = os.path.join(report_dir, 'index.html')
+    with open(filepath, 'w') as report_file:
+        report_file.write('\n'.join(parts))
+    return os.path.normpath(filepath)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+'Find exact and near-duplicate images. (requires Pillow and NumPy)'
+
+import os
+from util.optimize_images import get_content_hash
+
+HASHED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+
+def get_dhash(filepath, size=8):
+    'get a difference hash of downscaled grayscale pixels'
+    import numpy as np
+    from PIL import Image
+    with Image.open(filepath) as image:
+        image.draft('L', (size * 8, size * 8))
+        small = image.convert('L').resize((size + 1, size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(hash_a, hash_b):
+    'count differing bits'
+    return bin(hash_a ^ hash_b).count('1')
+
+
+class BKTree():
+    'Metric tree of hashes for Hamming distance queries.'
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, image_hash, item):
+        'add a hash'
+        node = [image_hash, [item], {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming_distance(image_hash, current[0])
+            if distance == 0:
+                current[1].append(item)
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def query(self, image_hash, max_distance):
+        'get (distance, item) pairs within a distance of a hash'
+        found = []
+        candidates = [] if self.root is None else [self.root]
+        while len(candidates) > 0:
+            node_hash, items, children = candidates.pop()
+            distance = hamming_distance(image_hash, node_hash)
+            if distance <= max_distance:
+                found += [(distance, item) for item in items]
+            for child_distance, child in children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    candidates.append(child)
+        return sorted(found)
+
+
+class ImageFingerprintIndex():
+    'Content and perceptual hashes of image files.'
+
+    def __init__(self, max_distance=4):
+        self.max_distance = max_distance
+        self.sizes = {}
+        self.by_content = {}
+        self.perceptual = {}
+        self.tree = BKTree()
+
+    def add(self, path, filepath):
+        'hash an image file'
+        self.sizes[path] = os.path.getsize(filepath)
+        content_hash = get_content_hash(filepath)
+        paths = self.by_content.setdefault(content_hash, [])
+        paths.append(path)
+        if len(paths) > 1 or not path.lower().endswith(HASHED_EXTENSIONS):
+            return
+        try:
+            image_hash = get_dhash(filepath)
+        except (OSError, ValueError):
+            return
+        self.perceptual[content_hash] = image_hash
+        self.tree.add(image_hash, content_hash)
+
+    def wasted(self, paths):
+        'get the bytes of all but the largest file in a cluster'
+        sizes = [self.sizes[path] for path in paths]
+        return sum(sizes) - max(sizes)
+
+    def exact_clusters(self):
+        'get groups of identical files, most wasted bytes first'
+        clusters = [sorted(paths) for paths in self.by_content.values()
+                    if len(paths) > 1]
+        return sorted(clusters, key=lambda paths: (-self.wasted(paths), paths))
+
+    def near_clusters(self):
+        'get groups of visually similar images with different content, one path each'
+        parents = {content_hash: content_hash for content_hash in self.perceptual}
+
+        def _find(content_hash):
+            while parents[content_hash] != content_hash:
+                parents[content_hash] = parents[parents[content_hash]]
+                content_hash = parents[content_hash]
+            return content_hash
+        for content_hash, image_hash in self.perceptual.items():
+            for _, similar in self.tree.query(image_hash, self.max_distance):
+                parents[_find(similar)] = _find(content_hash)
+        groups = {}
+        for content_hash in self.perceptual:
+            groups.setdefault(_find(content_hash), []).append(content_hash)
+        clusters = [sorted(min(self.by_content[content_hash]) for content_hash in group)
+                    for group in groups.values() if len(group) > 1]
+        return sorted(clusters, key=lambda paths: (-self.wasted(paths), paths))
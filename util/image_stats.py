@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+'Image size statistics over NumPy arrays. (requires NumPy)'
+
+import os
+from util.versions import get_version_from_root
+
+SIZE_THRESHOLDS = [4, 2, 1, 0.5]
+HISTOGRAM_EDGES = [0, 0.1, 0.25, 0.5, 1, 2, 4, float('inf')]
+PERCENTILES = [50, 90, 99]
+
+
+def version_order(name):
+    'sort version directory names by version number, unnumbered names last'
+    try:
+        number = get_version_from_root(name, 0)
+    except ValueError:
+        number = name
+    if isinstance(number, str):
+        return (1, 0, name)
+    return (0, number, name)
+
+
+class ImageStats():
+    'File sizes and pixel dimensions of the images of a hub.'
+
+    def __init__(self, paths, sizes, dimensions):
+        import numpy as np
+        self.paths = list(paths)
+        self.path_names = np.array(self.paths, dtype=str)
+        self.bytes = np.asarray(sizes, dtype=np.int64).reshape(-1)
+        dimensions = np.asarray(dimensions, dtype=np.int64).reshape(-1, 2)
+        self.width = dimensions[:, 0]
+        self.height = dimensions[:, 1]
+        self.megabytes = self.bytes / 1000000
+        self.megapixels = self.width * self.height / 1000000
+        self.groups = {}
+        for key, names in [
+                ('version', [path.split(os.sep)[0] for path in self.paths]),
+                ('directory', [os.path.dirname(path) for path in self.paths])]:
+            unique, ids = np.unique(np.array(names, dtype=str), return_inverse=True)
+            self.groups[key] = ([str(name) for name in unique], ids.reshape(-1))
+
+    def __len__(self):
+        return len(self.paths)
+
+    def count_above(self, thresholds=None):
+        'count images larger than each size threshold (MB)'
+        import numpy as np
+        thresholds = SIZE_THRESHOLDS if thresholds is None else thresholds
+        ordered = np.sort(self.megabytes)
+        above = len(ordered) - np.searchsorted(ordered, thresholds, side='right')
+        return [int(count) for count in above]
+
+    def percentiles(self, percents=None):
+        'get file size percentiles (MB)'
+        import numpy as np
+        percents = PERCENTILES if percents is None else percents
+        if len(self) == 0:
+            return [0.0] * len(percents)
+        return [float(value) for value in np.percentile(self.megabytes, percents)]
+
+    def histogram(self, edges=None):
+        'count images in each file size bin (MB), as (low, high, count) rows'
+        import numpy as np
+        edges = HISTOGRAM_EDGES if edges is None else edges
+        counts, _ = np.histogram(self.megabytes, bins=edges)
+        return [(edges[i], edges[i + 1], int(count)) for i, count in enumerate(counts)]
+
+    def group_by(self, key):
+        'get image count, total bytes, and largest file of each version or directory'
+        import numpy as np
+        names, ids = self.groups[key]
+        counts = np.bincount(ids, minlength=len(names))
+        totals = np.bincount(ids, weights=self.bytes, minlength=len(names))
+        largest = np.zeros(len(names), dtype=np.int64)
+        np.maximum.at(largest, ids, self.bytes)
+        return {name: {'count': int(counts[i]), 'bytes': int(totals[i]),
+                       'largest': int(largest[i])}
+                for i, name in enumerate(names)}
+
+    def version_growth(self):
+        'get per-version totals in version order, with the change from the last version'
+        rows = []
+        previous = None
+        groups = self.group_by('version')
+        for name in sorted(groups, key=version_order):
+            row = dict(groups[name], version=name)
+            row['count_change'] = row['count'] - (previous or row)['count']
+            row['bytes_change'] = row['bytes'] - (previous or row)['bytes']
+            rows.append(row)
+            previous = row
+        return rows
+
+    def top_indices(self, values, count, ties=(), names=None):
+        'get the indices of the largest values, largest first, without a full sort'
+        import numpy as np
+        total = len(values)
+        if count <= 0 or total == 0:
+            return []
+        if count < total:
+            kth = np.argpartition(values, total - count)[total - count]
+            candidates = np.flatnonzero(values >= values[kth])
+        else:
+            candidates = np.arange(total)
+        names = self.path_names if names is None else np.array(names, dtype=str)
+        keys = [names[candidates]]
+        keys += [np.asarray(tie)[candidates] for tie in reversed(ties)]
+        keys.append(np.asarray(values)[candidates])
+        order = np.lexsort(keys)[::-1][:count]
+        return [int(i) for i in candidates[order]]
+
+    def largest_files(self, count):
+        'get the (MB, path) of the largest files'
+        return [(float(self.megabytes[i]), self.paths[i])
+                for i in self.top_indices(self.megabytes, count)]
+
+    def largest_images(self, count):
+        'get the (MP, width, height, path) of the images with the most pixels'
+        return [(float(self.megapixels[i]), int(self.width[i]), int(self.height[i]),
+                 self.paths[i])
+                for i in self.top_indices(self.megapixels, count,
+                                          [self.width, self.height])]
+
+    def largest_groups(self, key, count):
+        'get the (name, totals) of the versions or directories with the most bytes'
+        import numpy as np
+        groups = self.group_by(key)
+        names = sorted(groups)
+        totals = np.array([groups[name]['bytes'] for name in names], dtype=np.int64)
+        return [(names[i], groups[names[i]])
+                for i in self.top_indices(totals, count, names=names)]
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+'Persistent index of the links to each page and section, updated incrementally.'
+
+import io
+import os
+import sqlite3
+import hashlib
+from urllib.parse import urlsplit
+from util.check_links import ExtractedLinks, Link, get_target_path
+from util.slugger import get_file_sections
+from util.versions import HUBS
+from util.walk import get_relative_filename, is_version_name
+
+DEFAULT_INDEX_FILENAME = 'results/link_index.sqlite'
+
+SCHEMA_VERSION = 2
+TABLES = ['files', 'links', 'sections']
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS files '
+    '(hub TEXT, path TEXT, mtime_ns INTEGER, size INTEGER, hash TEXT, '
+    'PRIMARY KEY (hub, path))',
+    'CREATE TABLE IF NOT EXISTS links '
+    '(hub TEXT, target_hub TEXT, target_absolute TEXT, anchor TEXT, source TEXT, '
+    'line_number INTEGER, type TEXT, target TEXT, text TEXT)',
+    'CREATE TABLE IF NOT EXISTS sections (hub TEXT, path TEXT, anchor TEXT)',
+    'CREATE INDEX IF NOT EXISTS links_target '
+    'ON links (target_hub, target_absolute, anchor)',
+    'CREATE INDEX IF NOT EXISTS links_source ON links (hub, source)',
+    'CREATE INDEX IF NOT EXISTS sections_path ON sections (hub, path, anchor)',
+]
+
+
+def get_content_hash(data):
+    'hash file content'
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def get_lines(data):
+    'split file content into lines the way walk_through_files reads them'
+    return io.TextIOWrapper(io.BytesIO(data)).readlines()
+
+
+def get_markdown_files(hub_dir):
+    'get the hub relative paths of markdown files in version directories'
+    paths = []
+    for root, dirs, files in os.walk(hub_dir):
+        dirs.sort()
+        if root == hub_dir:
+            dirs[:] = [d for d in dirs if is_version_name(d)]
+            continue
+        local_root = os.path.relpath(root, hub_dir)
+        paths += [os.path.join(local_root, f) for f in sorted(files)
+                  if f.endswith('.md')]
+    return paths
+
+
+def get_url_target(url):
+    'get the hub and hub relative page path of a farm.bot page url, or None'
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    host = (parts.hostname or '').lower()
+    if not host.endswith('.farm.bot'):
+        return None
+    subdomain = host[:-len('.farm.bot')]
+    hub = next((h for h in HUBS if h[:3] == subdomain[:3]), subdomain)
+    path = parts.path.strip('/')
+    for extension in ['.html', '.md']:
+        path = path.removesuffix(extension)
+    names = path.split('/')
+    if len(names) < 2 or not is_version_name(names[0]) or is_version_name(names[-1]):
+        return None
+    return hub, path + '.md'
+
+
+def get_index_rows(hub, path, lines):
+    'get the link and section rows of a markdown file'
+    local_root, filename = os.path.split(path)
+    links = []
+    for line_number, parsed, full, html_line in ExtractedLinks(lines).items:
+        if parsed is None:
+            continue
+        link = Link(local_root, filename, line_number, parsed, full, html_line)
+        if link.relation == 'relative':
+            target = hub, get_target_path(local_root, link.path or filename)
+        elif link.relation == 'http':
+            target = get_url_target(link.path)
+            if target is None:
+                continue
+        else:
+            continue
+        links.append((hub, *target, link.fragment, path, line_number, link.kind,
+                      link.target, link.text))
+    sections = [(hub, path, anchor) for anchor in get_file_sections(lines)]
+    return links, sections
+
+
+class LinkIndex():
+    'Links by target file and anchor, kept up to date per changed file.'
+
+    def __init__(self, filename=None):
+        self.filename = filename or get_relative_filename(DEFAULT_INDEX_FILENAME)
+        if self.filename != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.filename)),
+                        exist_ok=True)
+        self.connection = sqlite3.connect(self.filename)
+        self.connection.row_factory = sqlite3.Row
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            for table in TABLES:
+                self.connection.execute(f'DROP TABLE IF EXISTS {table}')
+            self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def remove_file(self, hub, path):
+        'remove the rows of a markdown file'
+        for table, column in [('files', 'path'), ('links', 'source'),
+                              ('sections', 'path')]:
+            self.connection.execute(
+                f'DELETE FROM {table} WHERE hub = ? AND {column} = ?', (hub, path))
+
+    def index_file(self, hub, path, lines, stat=None, content_hash=None):
+        'replace the links and sections of a markdown file'
+        self.remove_file(hub, path)
+        links, sections = get_index_rows(hub, path, lines)
+        self.connection.executemany(
+            'INSERT INTO links VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', links)
+        self.connection.executemany('INSERT INTO sections VALUES (?, ?, ?)', sections)
+        if stat is not None:
+            self.connection.execute(
+                'INSERT INTO files VALUES (?, ?, ?, ?, ?)',
+                (hub, path, stat.st_mtime_ns, stat.st_size, content_hash))
+
+    def update(self, folder, hubs):
+        'index new and changed markdown files and forget removed ones'
+        counts = {'files': 0, 'indexed': 0, 'removed': 0}
+        for hub in hubs:
+            hub_dir = os.path.join(folder, f'farmbot-{hub}')
+            known = {row['path']: row for row in self.connection.execute(
+                'SELECT * FROM files WHERE hub = ?', (hub,))}
+            paths = get_markdown_files(hub_dir) if os.path.isdir(hub_dir) else []
+            for path in paths:
+                counts['files'] += 1
+                filepath = os.path.join(hub_dir, path)
+                stat = os.stat(filepath)
+                row = known.pop(path, None)
+                if (row is not None and row['mtime_ns'] == stat.st_mtime_ns
+                        and row['size'] == stat.st_size):
+                    continue
+                with open(filepath, 'rb') as md_file:
+                    data = md_file.read()
+                content_hash = get_content_hash(data)
+                if row is not None and row['hash'] == content_hash:
+                    self.connection.execute(
+                        'UPDATE files SET mtime_ns = ?, size = ? '
+                        'WHERE hub = ? AND path = ?',
+                        (stat.st_mtime_ns, stat.st_size, hub, path))
+                    continue
+                self.index_file(hub, path, get_lines(data), stat, content_hash)
+                counts['indexed'] += 1
+            for path in known:
+                self.remove_file(hub, path)
+                counts['removed'] += 1
+        self.connection.commit()
+        return counts
+
+    def target_hub(self, target, hub=None):
+        'get the hub of a target path, which must be given when several hubs have it'
+        if hub is not None:
+            return hub
+        path = os.path.normpath(target.partition('#')[0])
+        hubs = sorted(row[0] for row in self.connection.execute(
+            'SELECT hub FROM files WHERE path = ? '
+            'UNION SELECT target_hub FROM links WHERE target_absolute = ?',
+            (path, path)))
+        if len(hubs) > 1:
+            raise ValueError(f'{path} is in more than one hub ({", ".join(hubs)})')
+        return hubs[0] if len(hubs) > 0 else None
+
+    def links_here(self, target, hub=None):
+        'get the links to a page of a hub, or to one section with path#anchor'
+        hub = self.target_hub(target, hub)
+        path, has_anchor, anchor = target.partition('#')
+        sql = ('SELECT hub, source, line_number, type, target, text '
+               'FROM links WHERE target_hub = ? AND target_absolute = ?')
+        parameters = [hub, os.path.normpath(path)]
+        if has_anchor:
+            sql += ' AND anchor = ?'
+            parameters.append(anchor)
+        sql += ' ORDER BY hub, source, line_number'
+        return [dict(row) for row in self.connection.execute(sql, parameters)]
+
+    def has_section(self, target, hub=None):
+        'check if an indexed file has the anchor of a path#anchor target'
+        hub = self.target_hub(target, hub)
+        path, _, anchor = target.partition('#')
+        return self.connection.execute(
+            'SELECT 1 FROM sections WHERE hub = ? AND path = ? AND anchor = ?',
+            (hub, os.path.normpath(path), anchor)).fetchone() is not None
+
+    def close(self):
+        'close the database connection'
+        self.connection.close()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+'Export check statistics in the OpenMetrics text format.'
+
+import os
+from util.summary import get_stats
+
+METRICS = {
+    'docs_check_results': 'Checked items by hub, version and check.',
+    'docs_check_issues': 'Issues by hub, version, check and issue type.',
+    'docs_emoji_lines_checked': 'Markdown lines scanned for emoji.',
+    'docs_emoji_lines_skipped': 'Markdown lines skipped in code blocks.',
+    'docs_images': 'Image files in content directories.',
+    'docs_image_bytes': 'Total size of image files.',
+    'docs_check_duration_seconds': 'Time spent in each check phase.',
+    'docs_check_exit_code': 'Exit code of the run.',
+}
+
+
+def escape_label(value):
+    'escape a label value'
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_sample(name, labels, value):
+    'format a metric sample line'
+    label_text = ','.join(f'{key}="{escape_label(label)}"'
+                          for key, label in labels.items())
+    if label_text:
+        label_text = f'{{{label_text}}}'
+    return f'{name}{label_text} {value}'
+
+
+def get_samples(summary):
+    'get metric samples from a summary'
+    samples = {name: [] for name in METRICS}
+    for check, hub_results in summary.results.items():
+        for hub, results in hub_results.items():
+            group = get_stats(results).group()
+            for version, count in sorted(group['versions'].items(), key=str):
+                samples['docs_check_results'].append(
+                    ({'hub': hub, 'version': version, 'check': check}, count))
+            for (version, issue), count in sorted(group['version_issues'].items(),
+                                                  key=str):
+                samples['docs_check_issues'].append(({
+                    'hub': hub, 'version': version, 'check': check, 'issue': issue,
+                }, count))
+    for hub, data in summary.arbitrary_data.items():
+        for key in ['lines_checked', 'lines_skipped']:
+            if key in data:
+                samples[f'docs_emoji_{key}'].append(({'hub': hub}, data[key]))
+        if 'images' in data:
+            samples['docs_images'].append(({'hub': hub}, data['images']['count']))
+            samples['docs_image_bytes'].append(({'hub': hub}, data['images']['bytes']))
+    for phase, seconds in summary.timings.items():
+        samples['docs_check_duration_seconds'].append(
+            ({'phase': phase}, round(seconds, 6)))
+    samples['docs_check_exit_code'].append(({}, summary.exit_code))
+    return samples
+
+
+def format_metrics(summary):
+    'get the OpenMetrics text of a summary'
+    lines = []
+    for name, samples in get_samples(summary).items():
+        if len(samples) == 0:
+            continue
+        lines.append(f'# HELP {name} {METRICS[name]}')
+        lines.append(f'# TYPE {name} gauge')
+        if name == 'docs_check_duration_seconds':
+            lines.append(f'# UNIT {name} seconds')
+        lines += [format_sample(name, labels, value) for labels, value in samples]
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(summary, filename):
+    'write metrics, replacing the file at once so scrapers never read part of it'
+    temporary_filename = f'{filename}.tmp'
+    with open(temporary_filename, 'w') as metrics_file:
+        metrics_file.write(format_metrics(summary))
+    os.replace(temporary_filename, filename)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+'Re-encode and resize large documentation images. (requires Pillow)'
+
+import os
+import json
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from util.walk import get_relative_filename
+
+DEFAULT_SETTINGS = {
+    'max_width': 1600,
+    'max_height': 1600,
+    'quality': 85,
+    'min_megabytes': 0.5,
+}
+OPTIMIZED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+DEFAULT_CACHE_DIR = 'results/image_cache'
+
+
+def get_content_hash(filepath):
+    'hash the contents of a file'
+    content_hash = hashlib.sha256()
+    with open(filepath, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(1 << 20), b''):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def get_cache_key(content_hash, settings):
+    'get the cache key of an image encoded with settings'
+    settings_text = json.dumps(
+        [settings['max_width'], settings['max_height'], settings['quality']])
+    return hashlib.sha256(f'{content_hash}{settings_text}'.encode()).hexdigest()
+
+
+def optimize_image(source_path, output_path, settings):
+    'resize and re-encode an image, returning the output size in bytes'
+    from PIL import Image, ImageOps
+    with Image.open(source_path) as image:
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((settings['max_width'], settings['max_height']))
+        save_options = {'optimize': True}
+        if image_format == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            save_options.update(quality=settings['quality'], progressive=True)
+        elif image_format == 'WEBP':
+            save_options.update(quality=settings['quality'])
+        image.save(output_path, format=image_format, **save_options)
+    return os.path.getsize(output_path)
+
+
+class ImageOptimizer():
+    'Optimize images in a process pool, caching outputs by content hash.'
+
+    def __init__(self, settings=None, cache_dir=None, jobs=None, write=False):
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        self.cache_dir = cache_dir or get_relative_filename(DEFAULT_CACHE_DIR)
+        self.jobs = jobs
+        self.write = write
+        self.index_filepath = os.path.join(self.cache_dir, 'index.json')
+        self.index = {}
+        if os.path.exists(self.index_filepath):
+            with open(self.index_filepath, 'r') as index_file:
+                self.index = json.load(index_file)
+
+    def is_candidate(self, path, size, width, height):
+        'check if an image is large enough to optimize'
+        if not path.lower().endswith(OPTIMIZED_EXTENSIONS):
+            return False
+        too_big = size >= self.settings['min_megabytes']
+        too_wide = width > self.settings['max_width']
+        too_tall = height > self.settings['max_height']
+        return too_big or too_wide or too_tall
+
+    def save_index(self):
+        'save the cache index'
+        with open(self.index_filepath, 'w') as index_file:
+            index_file.write(json.dumps(self.index, indent=2, sort_keys=True))
+
+    def optimize(self, hub_dir, images, check_time=None):
+        'optimize [path, MB, width, height] images, returning a result per image'
+        check_time = check_time or (lambda: None)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        results = []
+        jobs = {}
+        for path, size, width, height in images:
+            check_time()
+            if not self.is_candidate(path, size, width, height):
+                continue
+            source_path = os.path.join(hub_dir, path)
+            key = get_cache_key(get_content_hash(source_path), self.settings)
+            extension = os.path.splitext(path)[1].lower()
+            output_path = os.path.join(self.cache_dir, f'{key}{extension}')
+            result = {
+                'path': path,
+                'bytes': os.path.getsize(source_path),
+                'optimized_bytes': None,
+                'cached': key in self.index and os.path.exists(output_path),
+                'key': key,
+                'output': output_path,
+            }
+            if result['cached']:
+                result['optimized_bytes'] = self.index[key]['bytes']
+            else:
+                jobs[key] = (source_path, output_path, self.settings)
+            results.append(result)
+
+        optimized = {}
+        if self.jobs == 1:
+            for key, job in jobs.items():
+                check_time()
+                optimized[key] = optimize_image(*job)
+        elif len(jobs) > 0:
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                futures = {key: pool.submit(optimize_image, *job)
+                           for key, job in jobs.items()}
+                try:
+                    for key, future in futures.items():
+                        optimized[key] = future.result()
+                        check_time()
+                except BaseException:
+                    pool.shutdown(cancel_futures=True)
+                    raise
+
+        for result in results:
+            key = result['key']
+            if key in optimized:
+                result['optimized_bytes'] = optimized[key]
+                self.index[key] = {'bytes': optimized[key]}
+            result['saved'] = max(0, result['bytes'] - result['optimized_bytes'])
+            if self.write and result['saved'] > 0:
+                source_path = os.path.join(hub_dir, result['path'])
+                shutil.copyfile(result['output'], source_path)
+                written_key = get_cache_key(get_content_hash(source_path),
+                                            self.settings)
+                extension = os.path.splitext(source_path)[1].lower()
+                shutil.copyfile(result['output'], os.path.join(
+                    self.cache_dir, f'{written_key}{extension}'))
+                self.index[written_key] = {'bytes': result['optimized_bytes']}
+        self.save_index()
+        return results
+
+
+def get_page_savings(results, image_pages):
+    'total saved bytes per page that references an optimized image'
+    savings = {}
+    for result in results:
+        for page in image_pages.get(result['path']) or ['(not linked)']:
+            savings[page] = savings.get(page, 0) + result['saved']
+    return savings
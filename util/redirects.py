@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+'Redirect file index.'
+
+import os
+
+
+def parse_redirect_file(filepath):
+    'get front matter values from a redirect file'
+    data = {}
+    with open(filepath, 'r') as redirect_file:
+        for line in redirect_file:
+            for key in ['permalink', 'page_path']:
+                if line.startswith(f'{key}:'):
+                    data[key] = line.split(f'{key}:')[1].strip()
+    return data
+
+
+def get_slug(path):
+    'get slug from a page path or filename'
+    return path.rstrip('/').split('/')[-1].split('.md')[0]
+
+
+class RedirectIndex():
+    'Index of hub redirect files, keyed by slug and by page path.'
+
+    def __init__(self, hub_dir, latest_version):
+        self.hub_dir = hub_dir
+        self.latest_version = latest_version
+        self.redirect_dir = os.path.join(hub_dir, '_redirects')
+        self.by_slug = {}
+        self.by_page = {}
+        self.permalinks = {}
+        self.page_paths = {}
+        self.broken = []
+        self.load()
+
+    def page_filepath(self, page_path):
+        'get the markdown filepath of a redirect page path'
+        filepath = os.sep.join([
+            self.hub_dir, self.latest_version, page_path]) + '.md'
+        return filepath.replace('//', '/')
+
+    def load(self):
+        'parse each redirect file once'
+        if not os.path.exists(self.redirect_dir):
+            return
+        for redirect in sorted(os.listdir(self.redirect_dir)):
+            redirect_filepath = os.path.join(self.redirect_dir, redirect)
+            data = parse_redirect_file(redirect_filepath)
+            page_path = data.get('page_path')
+            filepath = None
+            if page_path is not None:
+                filepath = self.page_filepath(page_path)
+                self.page_paths[redirect] = page_path
+                self.by_page.setdefault(filepath, []).append(redirect)
+                if not os.path.exists(filepath):
+                    self.broken.append([filepath, redirect_filepath])
+            if data.get('permalink') is not None:
+                self.permalinks[redirect] = data['permalink']
+            self.by_slug[redirect] = filepath
+
+    def is_redirected(self, page_filepath):
+        'check if a page has a redirect pointing to it'
+        return page_filepath in self.by_page
+
+    def taken_by(self, page_filepath):
+        'get the page a missing redirect filename points to instead'
+        return self.by_slug.get(page_filepath.split('/')[-1])
+
+    def is_taken(self, page_filepath):
+        'check if the redirect filename for a page is used by another page'
+        return page_filepath.split('/')[-1] in self.by_slug
+
+    def missing(self, pages):
+        'get pages without a redirect'
+        return sorted(p for p in pages if not self.is_redirected(p))
+
+    def slug_graph(self):
+        'get redirect slug -> target page slug edges'
+        edges = {}
+        for redirect, page_path in self.page_paths.items():
+            slug = get_slug(redirect)
+            target_slug = get_slug(page_path)
+            target_redirect = f'{target_slug}.md'
+            if target_slug == slug or target_redirect not in self.page_paths:
+                continue
+            if self.by_slug[target_redirect] == self.by_slug[redirect]:
+                continue
+            edges[slug] = target_slug
+        return edges
+
+    def chains_and_cycles(self):
+        'find redirect slug chains and cycles'
+        edges = self.slug_graph()
+        chains = []
+        cycles = []
+        seen_cycles = set()
+        targets = set(edges.values())
+        for start in sorted(edges):
+            path = [start]
+            visited = {start}
+            node = start
+            while node in edges:
+                node = edges[node]
+                if node in visited:
+                    cycle = path[path.index(node):]
+                    key = frozenset(cycle)
+                    if key not in seen_cycles:
+                        seen_cycles.add(key)
+                        cycles.append(cycle + [node])
+                    break
+                path.append(node)
+                visited.add(node)
+            else:
+                if start not in targets:
+                    chains.append(path)
+        return chains, cycles
+
+    def duplicate_targets(self):
+        'find pages with more than one redirect'
+        return {page: redirects for page, redirects in sorted(self.by_page.items())
+                if len(redirects) > 1}
+
+    def lookup_table(self):
+        'get permalink -> versioned page path lookup'
+        table = {}
+        for redirect, page_path in sorted(self.page_paths.items()):
+            permalink = self.permalinks.get(redirect, f'/{get_slug(redirect)}')
+            versioned = f'/{self.latest_version}/{page_path.lstrip("/")}'
+            table[permalink] = versioned
+        return table
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+'SQLite results store and query command.'
+
+import os
+import json
+import sqlite3
+import argparse
+from util.walk import get_relative_filename
+
+DEFAULT_DB_FILENAME = 'results/results.sqlite'
+
+TABLES = {
+    'links': {
+        'results_key': 'links',
+        'columns': {
+            'status': 'status',
+            'type': 'type',
+            'relation': 'link',
+            'source': 'from',
+            'line_number': 'line_number',
+            'target': 'to',
+            'target_absolute': 'to_absolute',
+            'text': 'text',
+        },
+        'indexes': ['status', 'source', 'target', 'target_absolute'],
+    },
+    'emoji': {
+        'results_key': 'emoji',
+        'columns': {
+            'status': 'status',
+            'source': 'from',
+            'line_number': 'line_number',
+            'target': 'emoji',
+        },
+        'indexes': ['status', 'source', 'target'],
+    },
+    'toc_pages': {
+        'results_key': 'toc',
+        'columns': {
+            'status': 'status',
+            'source': 'page',
+            'target': 'slug',
+            'section': 'section',
+            'toc_page_title': 'toc_page_title',
+            'md_page_title': 'md_page_title',
+        },
+        'indexes': ['status', 'source', 'target'],
+    },
+    'images': {
+        'results_key': None,
+        'columns': {
+            'source': 'path',
+            'bytes': 'bytes',
+            'width': 'width',
+            'height': 'height',
+        },
+        'indexes': ['source'],
+    },
+}
+
+RESULTS_TABLES = {table['results_key']: name
+                  for name, table in TABLES.items() if table['results_key']}
+GROUP_BY_COLUMNS = ['hub', 'version'] + [
+    column for column in TABLES['links']['columns']
+    if all(column in table['columns'] for table in TABLES.values()
+           if table['results_key'])]
+
+
+def get_version_text(version):
+    'store versions as text'
+    if version is None or version == 'docs':
+        return version
+    return str(float(str(version).strip('v')))
+
+
+class ResultsStore():
+    'Store check results in indexed SQLite tables.'
+
+    def __init__(self, filename=None):
+        self.filename = filename or get_relative_filename(DEFAULT_DB_FILENAME)
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        self.connection = sqlite3.connect(self.filename)
+        self.connection.row_factory = sqlite3.Row
+        self.create_tables()
+
+    def create_tables(self):
+        'create tables and indexes'
+        for name, table in TABLES.items():
+            columns = ', '.join(['hub TEXT', 'version TEXT']
+                                + list(table['columns']) + ['issues TEXT'])
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {name} ({columns})')
+            for column in ['hub', 'version'] + table['indexes']:
+                self.connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS {name}_{column} '
+                    f'ON {name} ({column})')
+            self.connection.execute(
+                f'CREATE INDEX IF NOT EXISTS {name}_hub_version '
+                f'ON {name} (hub, version)')
+        self.connection.commit()
+
+    def save_rows(self, name, hub, records):
+        'replace the rows of a hub in a table'
+        table = TABLES[name]
+        keys = list(table['columns'].values())
+        placeholders = ', '.join('?' * (len(keys) + 3))
+        self.connection.execute(f'DELETE FROM {name} WHERE hub = ?', (hub,))
+        self.connection.executemany(
+            f'INSERT INTO {name} VALUES ({placeholders})',
+            ([hub, get_version_text(record.get('version'))]
+             + [record.get(key) for key in keys]
+             + [json.dumps(record.get('issues', []))]
+             for record in records))
+        self.connection.commit()
+
+    def save_results(self, results_key, results):
+        'save summary results'
+        name = RESULTS_TABLES.get(results_key)
+        if name is None:
+            return
+        for hub, records in results.items():
+            self.save_rows(name, hub, records)
+
+    def query(self, sql, parameters=()):
+        'run a query and return rows as dictionaries'
+        return [dict(row) for row in self.connection.execute(sql, parameters)]
+
+    def select(self, name, columns='*', issues_only=False, **filters):
+        'select rows matching column values'
+        conditions = [f'{column} = ?' for column in filters]
+        if issues_only:
+            conditions.append("status != 'ok'")
+        sql = f'SELECT {columns} FROM {name}'
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        return self.query(sql, [get_version_text(v) if k == 'version' else v
+                                for k, v in filters.items()])
+
+    def issue_counts(self, group_by=('hub', 'version')):
+        'count issues per table and group'
+        counts = []
+        group = ', '.join(group_by)
+        for name in TABLES:
+            if name == 'images':
+                continue
+            counts += self.query(
+                f"SELECT '{name}' AS result, {group}, COUNT(*) AS issues "
+                f"FROM {name} WHERE status != 'ok' "
+                f'GROUP BY {group} ORDER BY {group}')
+        return counts
+
+    def close(self):
+        'close the database connection'
+        self.connection.close()
+
+
+def print_rows(rows):
+    'print query rows as tab-separated lines'
+    if len(rows) == 0:
+        print('(no rows)')
+        return
+    print('\t'.join(rows[0]))
+    for row in rows:
+        print('\t'.join('' if v is None else str(v) for v in row.values()))
+
+
+def group_by_option(text):
+    'parse a comma separated --by value'
+    columns = text.split(',')
+    for column in columns:
+        if column not in GROUP_BY_COLUMNS:
+            raise argparse.ArgumentTypeError(
+                f'invalid column {column!r} (choose from {", ".join(GROUP_BY_COLUMNS)})')
+    return columns
+
+
+def query_links_here(options):
+    'update the link index for changed files and get the links to a target'
+    from util.link_index import LinkIndex
+    from util.versions import HUBS
+    index = LinkIndex(options.index)
+    try:
+        if not options.no_update:
+            hubs = list(HUBS)
+            if options.hub is not None and options.hub not in hubs:
+                hubs.append(options.hub)
+            index.update(os.path.normpath(options.folder), hubs)
+        hub = index.target_hub(options.target, options.hub)
+        rows = index.links_here(options.target, hub)
+        if '#' in options.target and not index.has_section(options.target, hub):
+            print(f'(section not found: {options.target})')
+    finally:
+        index.close()
+    return rows
+
+
+def main(args=None):
+    'query stored results'
+    parser = argparse.ArgumentParser(description='Query stored check results.')
+    parser.add_argument('--db', help='results database filename')
+    commands = parser.add_subparsers(dest='command', required=True)
+    counts = commands.add_parser('counts', help='issue counts')
+    counts.add_argument('--by', default='hub,version', type=group_by_option,
+                        help='comma separated grouping columns')
+    issues = commands.add_parser('issues', help='problem rows')
+    issues.add_argument('table', choices=[t for t in TABLES if t != 'images'])
+    links_to = commands.add_parser('links-to', help='links to a target')
+    links_to.add_argument('target', help='target path (hub relative)')
+    images = commands.add_parser('images', help='image rows')
+    links_here = commands.add_parser(
+        'links-here', help='links to a page or section, from the link index')
+    links_here.add_argument('target', help='target path (hub relative), with #anchor '
+                            'for links to one section')
+    links_here.add_argument('--hub', help='hub of the target (required when the '
+                            'target path is in more than one hub)')
+    links_here.add_argument('--folder', default='.',
+                            help='folder containing the hub directories')
+    links_here.add_argument('--index', help='link index filename')
+    links_here.add_argument('--no-update', action='store_true',
+                            help='skip indexing new and changed files')
+    for command in [issues, links_to, images]:
+        command.add_argument('--hub')
+        command.add_argument('--version')
+    issues.add_argument('--type', help='link type (link, image, ...)')
+    links_to.add_argument('--status')
+    sql = commands.add_parser('sql', help='run a SQL query')
+    sql.add_argument('query')
+    options = parser.parse_args(args)
+    if options.command == 'links-here':
+        try:
+            rows = query_links_here(options)
+        except ValueError as error:
+            parser.error(f'{error}, choose one with --hub')
+        print_rows(rows)
+        return
+
+    store = ResultsStore(options.db)
+    filters = {key: getattr(options, key, None) for key in ['hub', 'version']}
+    filters = {key: value for key, value in filters.items() if value is not None}
+    if options.command == 'counts':
+        rows = store.issue_counts(options.by)
+    elif options.command == 'issues':
+        if options.type is not None and options.table == 'links':
+            filters['type'] = options.type
+        rows = store.select(options.table, issues_only=True, **filters)
+    elif options.command == 'links-to':
+        target = options.target
+        if options.status is not None:
+            filters['status'] = options.status
+        rows = store.query(
+            'SELECT * FROM links WHERE (target_absolute = ? OR target = ?)'
+            + ''.join(f' AND {key} = ?' for key in filters),
+            [target, target] + [get_version_text(v) if k == 'version' else v
+                                for k, v in filters.items()])
+    elif options.command == 'images':
+        rows = store.select('images', **filters)
+    else:
+        rows = store.query(options.query)
+    print_rows(rows)
+    store.close()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+'Record check costs and use them to balance work across workers.'
+
+import os
+import sys
+import json
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from util.walk import get_relative_filename
+
+DEFAULT_HISTORY_FILENAME = 'results/timings.json'
+SMOOTHING = 0.5
+
+
+def get_toc_key(hub):
+    'get the cost key of the ToC checks of a hub'
+    return f'toc:{hub}'
+
+
+class TimingHistory():
+    'Smoothed processing time of files and hub level checks from earlier runs.'
+
+    def __init__(self, filename=None):
+        self.filename = filename or get_relative_filename(DEFAULT_HISTORY_FILENAME)
+        self.costs = {}
+        if os.path.exists(self.filename):
+            with open(self.filename, 'r') as history_file:
+                self.costs = json.load(history_file)
+
+    def update(self, costs):
+        'blend new costs into the history'
+        for key, seconds in costs.items():
+            previous = self.costs.get(key)
+            if previous is not None:
+                seconds = SMOOTHING * seconds + (1 - SMOOTHING) * previous
+            self.costs[key] = round(seconds, 6)
+
+    def save(self):
+        'save the history'
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        with open(self.filename, 'w') as history_file:
+            history_file.write(json.dumps(self.costs, indent=2, sort_keys=True))
+
+    def estimate(self, sizes):
+        'estimate the cost of each item, from history or from its size in bytes'
+        rates = sorted(self.costs[key] / size for key, size in sizes.items()
+                       if key in self.costs and size > 0)
+        rate = rates[len(rates) // 2] if len(rates) > 0 else None
+        estimates = {}
+        for key, size in sizes.items():
+            if key in self.costs:
+                estimates[key] = self.costs[key]
+            elif rate is not None:
+                estimates[key] = size * rate
+            else:
+                estimates[key] = size
+        return estimates
+
+
+def save_costs(summary, filename=None):
+    'blend the costs measured in a run into the timing history'
+    if len(summary.costs) == 0:
+        return
+    history = TimingHistory(filename)
+    history.update(summary.costs)
+    history.save()
+
+
+def run_workers(args, jobs, history_filename):
+    'run checks in local shard processes, returning their exit codes'
+    script = get_relative_filename('run_all_checks.py')
+    workers = []
+    for i in range(jobs):
+        command = [sys.executable, script] + args + [
+            '--shard', f'{i + 1}/{jobs}', '--timing-history', history_filename]
+        workers.append((time.perf_counter(), subprocess.Popen(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)))
+
+    def _wait(worker):
+        _, errors = worker.communicate()
+        return time.perf_counter(), errors
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        finished = list(executor.map(_wait, [worker for _, worker in workers]))
+    exit_codes = []
+    for i, ((start, worker), (end, errors)) in enumerate(zip(workers, finished)):
+        exit_codes.append(worker.returncode)
+        print(f'worker {i + 1}/{jobs} finished in {end - start:.2f} s')
+        if worker.returncode not in (0, 1, 3):
+            print(errors, file=sys.stderr)
+    return exit_codes
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+'JSON-RPC check server for editors and hooks.'
+
+import os
+import sys
+import json
+import contextlib
+import socketserver
+from util.workspace import Workspace
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+def get_diagnostic(record):
+    'convert a problem record to an editor diagnostic'
+    return {
+        'line': record.get('line_number'),
+        'message': record['status'],
+        'target': record.get('to') or record.get('emoji') or record.get('slug'),
+        'issues': record['issues'],
+    }
+
+
+class CheckServer():
+    'Answer check requests from a warm workspace. (default directory: current)'
+
+    def __init__(self, folder=None, hubs=None):
+        self.workspace = Workspace(folder, hubs)
+        self.workspace.load()
+        self.methods = {
+            'checkFile': self.check_file,
+            'checkHub': self.check_hub,
+            'listAnchors': self.list_anchors,
+        }
+
+    def check_file(self, params):
+        'check a file, optionally using unsaved buffer text'
+        text = params.get('text')
+        if text is None:
+            checked, elapsed = self.workspace.recheck(params['path'])
+        else:
+            checked, elapsed = self.workspace.check_unsaved(
+                params['path'], text.splitlines(keepends=True))
+        return {
+            'files': {path: [get_diagnostic(r) for r in records]
+                      for path, records in checked.items()},
+            'elapsed_ms': round(elapsed * 1000, 2),
+        }
+
+    def check_hub(self, params):
+        'check all files in a hub again'
+        hub = params['hub']
+        if hub not in self.workspace.hubs:
+            raise ValueError(f'unknown hub: {hub}')
+        self.workspace.load_hub(hub)
+        files = {}
+        for path, path_hub in self.workspace.manifest.items():
+            issues = self.workspace.issues(path) if path_hub == hub else []
+            if len(issues) > 0:
+                files[path] = [get_diagnostic(r) for r in issues]
+        return {'files': files,
+                'extra_summary': self.workspace.summary.extra_summaries.get(hub)}
+
+    def list_anchors(self, params):
+        'list section anchors available for completion'
+        return {'anchors': self.workspace.anchors(params['path'],
+                                                  params.get('link'))}
+
+    def handle(self, request):
+        'handle a JSON-RPC request object'
+        if not isinstance(request, dict) or 'method' not in request:
+            return error_response(None, INVALID_REQUEST, 'invalid request')
+        request_id = request.get('id')
+        method = self.methods.get(request['method'])
+        if method is None:
+            return error_response(request_id, METHOD_NOT_FOUND,
+                                  f'method not found: {request["method"]}')
+        try:
+            result = method(request.get('params') or {})
+        except (KeyError, TypeError, ValueError) as exception:
+            return error_response(request_id, INVALID_PARAMS, repr(exception))
+        except Exception as exception:  # pylint: disable=broad-except
+            return error_response(request_id, INTERNAL_ERROR, repr(exception))
+        if 'id' not in request:
+            return None
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+    def handle_line(self, line):
+        'handle a line of JSON and return the response line'
+        try:
+            request = json.loads(line)
+        except ValueError as exception:
+            response = error_response(None, PARSE_ERROR, repr(exception))
+        else:
+            with contextlib.redirect_stdout(sys.stderr):
+                response = self.handle(request)
+        return None if response is None else json.dumps(response) + '\n'
+
+
+def error_response(request_id, code, message):
+    'build a JSON-RPC error response'
+    return {'jsonrpc': '2.0', 'id': request_id,
+            'error': {'code': code, 'message': message}}
+
+
+def serve_stdio(server, stdin=None, stdout=None):
+    'serve newline-delimited JSON-RPC requests over stdio'
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    for line in stdin:
+        if line.strip() == '':
+            continue
+        response = server.handle_line(line)
+        if response is not None:
+            stdout.write(response)
+            stdout.flush()
+
+
+def serve_socket(server, socket_path):
+    'serve newline-delimited JSON-RPC requests over a Unix socket'
+    class _Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                response = server.handle_line(line.decode())
+                if response is not None:
+                    self.wfile.write(response.encode())
+                    self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socketserver.UnixStreamServer(socket_path, _Handler) as unix_server:
+        print(f'serving checks on {socket_path}', file=sys.stderr)
+        unix_server.serve_forever()
+
+
+def serve(folder=None, hubs=None, socket_path=None):
+    'start the check server'
+    with contextlib.redirect_stdout(sys.stderr):
+        server = CheckServer(folder, hubs)
+    if socket_path is None:
+        serve_stdio(server)
+    else:
+        serve_socket(server, socket_path)
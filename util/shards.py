@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+'Split checks across CI runners and merge the shard results.'
+
+import os
+import json
+import glob
+import heapq
+import shutil
+import hashlib
+from util import versions, walk
+from util.schedule import get_toc_key
+from util.summary import ResultList, ResultStats, get_stats
+
+SHARD_FILENAME = 'shard.json'
+HUB_CHECKS = ['toc']
+DEFERRED_CHECKS = ['images']
+
+
+def get_emoji_metrics_summary(data):
+    'rebuild the emoji code block summary from merged counts'
+    from util.check_emoji import get_code_block_summary
+    return (get_code_block_summary(data)
+            + walk.get_reuse_summary(data['emoji_content_reuse']))
+
+
+def get_links_metrics_summary(data):
+    'rebuild the link target cache summary from merged counts'
+    from util.check_links import get_cache_summary
+    return (get_cache_summary(data['resolution_cache'])
+            + walk.get_reuse_summary(data['link_content_reuse']))
+
+
+METRICS_SUMMARIES = {
+    'emoji': get_emoji_metrics_summary,
+    'links': get_links_metrics_summary,
+}
+
+
+def parse_shard(text):
+    'parse "i/N" (1 <= i <= N) into a zero-based shard index and a shard count'
+    try:
+        index, count = [int(part) for part in text.split('/')]
+    except ValueError as error:
+        raise ValueError(f'invalid shard {text!r} (expected i/N)') from error
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f'invalid shard {text!r} (expected 1 <= i <= N)')
+    return index - 1, count
+
+
+def get_shard_dir(index, count, results_dir='results'):
+    'get the partial results directory of a shard'
+    return os.path.join(results_dir, f'shard-{index + 1}-of-{count}')
+
+
+def stable_hash(text):
+    'hash text the same way on every runner'
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def assign_shards(costs, count):
+    'assign files to shards, most costly first, each to the least loaded shard'
+    loads = [(0, shard) for shard in range(count)]
+    assignments = {}
+    ordered = sorted(costs.items(),
+                     key=lambda item: (-item[1], stable_hash(item[0])))
+    for path, cost in ordered:
+        load, shard = heapq.heappop(loads)
+        assignments[path] = shard
+        heapq.heappush(loads, (load + cost, shard))
+    return assignments
+
+
+class ShardFilter():
+    'Select the files and hub level checks of one shard.'
+
+    def __init__(self, folder, hubs, index, count, version_policy=None,
+                 history=None):
+        self.index = index
+        self.count = count
+        self.hubs = hubs
+        self.version_policy = version_policy or versions.VersionPolicy(folder=folder)
+        file_sizes = {}
+        for hub in hubs:
+            file_sizes[get_toc_key(hub)] = 0
+            hub_dir = f'{folder}/farmbot-{hub}'
+            include = self.version_policy.include(hub)
+            for root, dirs, files in os.walk(hub_dir):
+                if root == hub_dir:
+                    dirs[:] = [d for d in dirs
+                               if walk.is_version_name(d) and include(d)]
+                    continue
+                for filename in files:
+                    if filename.endswith('.md'):
+                        filepath = os.path.normpath(os.path.join(root, filename))
+                        file_sizes[filepath] = os.path.getsize(filepath)
+        self.costs = file_sizes if history is None else history.estimate(file_sizes)
+        self.assignments = assign_shards(self.costs, count)
+
+    def includes(self, root, filename):
+        'check if a file is checked by this shard'
+        filepath = os.path.normpath(os.path.join(root, filename))
+        return self.assignments.get(filepath, 0) == self.index
+
+    def includes_hub(self, hub):
+        'check if hub level checks (ToC, redirects) run in this shard'
+        return self.assignments[get_toc_key(hub)] == self.index
+
+    def shard_costs(self):
+        'get the estimated cost of each shard'
+        totals = [0] * self.count
+        for key, shard in self.assignments.items():
+            totals[shard] += self.costs[key]
+        return totals
+
+    def digest(self):
+        'get a hash of the assignments, the same on every shard of one run'
+        return stable_hash(json.dumps(sorted(self.assignments.items())))
+
+
+def get_new_extra_summaries(summary, lengths):
+    'get extra summary text added since extra summary lengths were recorded'
+    return {hub: string[lengths.get(hub, 0):]
+            for hub, string in summary.extra_summaries.items()
+            if len(string) > lengths.get(hub, 0)}
+
+
+def save_shard_info(summary, shard_filter, checks, deferred, extra_summaries):
+    'save what a shard ran, for merging'
+    summary.save_json(SHARD_FILENAME, {
+        'shard': shard_filter.index,
+        'count': shard_filter.count,
+        'hubs': shard_filter.hubs,
+        'checks': checks,
+        'deferred': deferred,
+        'exit_code': summary.exit_code,
+        'extra_summaries': extra_summaries,
+        'arbitrary_data': summary.arbitrary_data,
+        'timings': summary.timings,
+        'costs': summary.costs,
+        'assignments': shard_filter.digest(),
+        'stats': {check: {hub: get_stats(results).to_json()
+                          for hub, results in summary.results.get(check, {}).items()}
+                  for check in checks},
+    })
+
+
+def merge_data(merged, data):
+    'add shard data to merged data: numbers are summed and lists extended'
+    for key, value in data.items():
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = value
+        elif isinstance(value, dict):
+            merge_data(existing, value)
+        elif isinstance(value, (int, float, list, str)):
+            merged[key] = existing + value
+    return merged
+
+
+def result_order(result):
+    'sort merged results by source file and line'
+    return (result.get('from', ''), result.get('line_number', 0))
+
+
+def remove_shard_dirs(results_dir='results'):
+    'remove the partial results of earlier sharded runs'
+    pattern = os.path.join(walk.get_relative_filename(results_dir), 'shard-*-of-*')
+    for shard_dir in glob.glob(pattern):
+        shutil.rmtree(shard_dir)
+
+
+def load_shards(results_dir='results'):
+    'load the info and results of every shard of a sharded run'
+    shards = []
+    results_dir = walk.get_relative_filename(results_dir)
+    pattern = os.path.join(results_dir, 'shard-*-of-*', SHARD_FILENAME)
+    for info_filepath in sorted(glob.glob(pattern)):
+        with open(info_filepath, 'r') as info_file:
+            info = json.load(info_file)
+        info['dir'] = os.path.dirname(info_filepath)
+        info['results'] = {}
+        for check in info['checks']:
+            results_filepath = os.path.join(os.path.dirname(info_filepath),
+                                            f'{check}_results.json')
+            if os.path.exists(results_filepath):
+                with open(results_filepath, 'r') as results_file:
+                    info['results'][check] = json.load(results_file)
+        shards.append(info)
+    counts = {shard['count'] for shard in shards}
+    if len(counts) == 0:
+        raise ValueError(f'no shard results found in {results_dir}')
+    if len(counts) != 1:
+        raise ValueError(f'expected shards of one run in {results_dir}, '
+                         f'found shard counts {sorted(counts)}')
+    count = counts.pop()
+    if len({shard.get('assignments') for shard in shards}) != 1:
+        raise ValueError('shards assigned files differently; run every shard '
+                         'with the same files and timing history')
+    found = sorted(shard['shard'] for shard in shards)
+    if found != list(range(count)):
+        missing = sorted(set(range(count)) - set(found))
+        raise ValueError('missing shards: '
+                         + ', '.join(f'{i + 1}/{count}' for i in missing))
+    return shards
+
+
+def merge(summary, results_dir='results'):
+    'combine shard results into the summary, returning the deferred checks'
+    shards = load_shards(results_dir)
+    checks = shards[0]['checks']
+    for key in checks:
+        merged = {}
+        stats = {}
+        for shard in shards:
+            for hub, results in shard['results'].get(key, {}).items():
+                merged.setdefault(hub, []).extend(results)
+            for hub, data in shard.get('stats', {}).get(key, {}).items():
+                stats.setdefault(hub, ResultStats()).add_json(data)
+                merged.setdefault(hub, [])
+        for hub, results in merged.items():
+            results.sort(key=result_order)
+            merged[hub] = ResultList()
+            merged[hub].extend(results)
+            merged[hub].stats = stats.get(hub) or get_stats(results)
+        summary.add_results(key, merged)
+    for shard in shards:
+        merge_data(summary.arbitrary_data, shard['arbitrary_data'])
+        merge_data(summary.timings, shard['timings'])
+        merge_data(summary.costs, shard.get('costs', {}))
+        summary.exit_code = max(summary.exit_code, shard['exit_code'])
+        for filepath in glob.glob(os.path.join(shard['dir'], '*_redirects.json')):
+            shutil.copy(filepath, walk.get_relative_filename(results_dir))
+    for key in checks:
+        if key in METRICS_SUMMARIES:
+            for hub in summary.results[key]:
+                data = summary.arbitrary_data.get(hub, {})
+                summary.add_extra_summary(hub, METRICS_SUMMARIES[key](data))
+            continue
+        for shard in shards:
+            for hub, string in shard['extra_summaries'].get(key, {}).items():
+                summary.add_extra_summary(hub, string)
+    return shards[0]['deferred'], shards[0]['hubs']
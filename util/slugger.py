@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+'Generate GitHub compatible section anchors from markdown headers.'
+
+import re
+
+HEADER = re.compile(r' {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+FENCE = re.compile(r' {0,3}(`{3,}|~{3,})')
+INLINE_CODE = re.compile(r'(`+)(.+?)\1')
+IMAGE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+LINK = re.compile(r'\[([^\]]*)\](?:\([^)]*\)|\[[^\]]*\])')
+HTML_TAG = re.compile(r'</?[A-Za-z][^>]*>')
+EMOJI_SHORTCODE = re.compile(r':[a-z0-9_+\-]+:')
+REMOVED = re.compile(r'[^\w\- ]')
+
+
+def get_header_text(markdown):
+    'get the rendered text of inline header markdown'
+    code_spans = []
+
+    def _hold_code(match):
+        code_spans.append(match.group(2).strip())
+        return f'\x00{len(code_spans) - 1}\x00'
+    text = INLINE_CODE.sub(_hold_code, markdown)
+    text = IMAGE.sub('', text)
+    text = LINK.sub(r'\1', text)
+    text = HTML_TAG.sub('', text)
+    text = EMOJI_SHORTCODE.sub('', text)
+    for i, code in enumerate(code_spans):
+        text = text.replace(f'\x00{i}\x00', code)
+    return text
+
+
+def slug(header_text):
+    'get a section anchor from header markdown, without duplicate handling'
+    text = get_header_text(header_text.strip()).lower()
+    return REMOVED.sub('', text).replace(' ', '-')
+
+
+def get_headers(lines):
+    'get header markdown from file lines, skipping fenced code blocks'
+    fence = None
+    for line in lines:
+        fence_match = FENCE.match(line)
+        if fence_match is not None:
+            marker = fence_match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence):
+                fence = None
+            continue
+        if fence is not None or '#' not in line[:4]:
+            continue
+        header_match = HEADER.match(line.rstrip('\n'))
+        if header_match is not None:
+            yield header_match.group(2) or ''
+
+
+class Slugger():
+    'Section anchors of one file, with -1, -2, ... suffixes for duplicates.'
+
+    def __init__(self):
+        self.occurrences = {}
+
+    def slug(self, header_text):
+        'get a unique section anchor for a header in this file'
+        original = result = slug(header_text)
+        while result in self.occurrences:
+            self.occurrences[original] += 1
+            result = f'{original}-{self.occurrences[original]}'
+        self.occurrences[result] = 0
+        return result
+
+    def reset(self):
+        'forget seen anchors'
+        self.occurrences = {}
+
+
+def get_file_sections(lines):
+    'get the section anchors of a markdown file'
+    slugger = Slugger()
+    return [slugger.slug(header) for header in get_headers(lines)]
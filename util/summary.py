@@ -3,12 +3,17 @@
 'Summarization and result reporting utilities.'
 
 import os
+import sys
 import json
+import time
+import contextlib
+from io import StringIO
+from collections import Counter
 from util.check_links import POSSIBLE_ISSUES as POSSIBLE_LINK_ISSUES
 from util.check_emoji import POSSIBLE_ISSUES as POSSIBLE_EMOJI_ISSUES
 from util.check_tocs import POSSIBLE_ISSUES as POSSIBLE_TOC_ISSUES
 from util.walk import get_hub_title, get_relative_filename
-from util.versions import color
+from util.versions import color, use_color
 
 ORDERED_LINK_INFO_KEYS = ['status', 'type', 'link',
                           'from', 'line_number', 'to', 'text', 'full', 'issues']
@@ -32,38 +37,142 @@ ORDERED_LINK_ISSUE_KEYS = [
 ]
 
 
-def print_issue_counts(links, link_type=None, relation=None):
+def new_group_stats():
+    'create empty aggregate counts for a result group'
+    return {
+        'total': 0,
+        'ok': 0,
+        'no_issues': 0,
+        'issues': Counter(),
+        'extensions': Counter(),
+        'sites': set(),
+        'targets': Counter(),
+        'names': set(),
+        'versions': Counter(),
+        'version_issues': Counter(),
+    }
+
+
+class ResultStats():
+    'Aggregate counts of check results, grouped by link type and relation.'
+
+    def __init__(self):
+        self.groups = {}
+
+    def group(self, link_type=None, relation=None):
+        'get the counts of a group'
+        return self.groups.get((link_type, relation)) or new_group_stats()
+
+    def add(self, result):
+        'count a result'
+        link_type = result.get('type')
+        relation = result.get('link')
+        keys = [(None, None)]
+        if link_type is not None:
+            keys.append((link_type, relation))
+        for key in keys:
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = new_group_stats()
+            group['total'] += 1
+            group['ok'] += result['status'] == 'ok'
+            group['no_issues'] += len(result['issues']) == 0
+            group['issues'].update(result['issues'])
+            group['versions'][result.get('version')] += 1
+            group['version_issues'].update(
+                (result.get('version'), issue) for issue in result['issues'])
+            if 'emoji' in result:
+                group['names'].add(result['emoji'])
+            if key[0] == 'image':
+                group['extensions'][result['to'].split('.')[-1].lower()] += 1
+            if key[1] == 'http':
+                group['sites'].add(result['to'].split('/')[2])
+            if key[1] == 'other':
+                group['targets'][result['to']] += 1
+
+    def to_json(self):
+        'get the counts as JSON data, with counters as [key, count] pairs'
+        def _encode(value):
+            if isinstance(value, Counter):
+                return [[key, count] for key, count in value.items()]
+            if isinstance(value, set):
+                return sorted(value)
+            return value
+        return {
+            'groups': [[link_type, relation,
+                        {key: _encode(value) for key, value in group.items()}]
+                       for (link_type, relation), group in self.groups.items()],
+        }
+
+    def add_json(self, data):
+        'add counts saved with to_json'
+        def _decode(pairs):
+            return Counter({tuple(key) if isinstance(key, list) else key: count
+                            for key, count in pairs})
+        for link_type, relation, saved in data['groups']:
+            group = self.groups.get((link_type, relation))
+            if group is None:
+                group = self.groups[(link_type, relation)] = new_group_stats()
+            for key, value in saved.items():
+                if isinstance(group[key], Counter):
+                    group[key].update(_decode(value))
+                elif isinstance(group[key], set):
+                    group[key].update(value)
+                else:
+                    group[key] += value
+
+
+class StopChecks(Exception):
+    'Raised to stop checking early.'
+
+
+class ResultList(list):
+    'Check results that are always counted, but only kept if needed.'
+
+    def __init__(self, keep_ok=True, on_append=None):
+        super().__init__()
+        self.keep_ok = keep_ok
+        self.on_append = on_append
+        self.stats = ResultStats()
+
+    def append(self, result):
+        'count a result and keep it if it is a problem or all results are kept'
+        self.stats.add(result)
+        if self.keep_ok or result['status'] != 'ok':
+            super().append(result)
+        if self.on_append is not None:
+            self.on_append(result)
+
+
+def get_stats(results):
+    'get aggregate counts for results'
+    stats = getattr(results, 'stats', None)
+    if stats is None:
+        stats = ResultStats()
+        for result in results:
+            stats.add(result)
+    return stats
+
+
+def print_issue_counts(stats, link_type=None, relation=None):
     'print link issues counts'
-    if link_type is not None:
-        links = [l for l in links if l['type'] == link_type]
-    if relation is not None:
-        links = [l for l in links if l['link'] == relation]
+    group = stats.group(link_type, relation)
     extensions_string = ''
     if link_type == 'image':
-        extension_counts = {}
-        for link in links:
-            ext = link['to'].split('.')[-1].lower()
-            extension_counts[ext] = extension_counts.get(ext, 0) + 1
-        extensions_string = f'({extension_counts})'
+        extensions_string = f'({dict(group["extensions"])})'
     sources_string = ''
     if relation == 'http':
-        source_count = len({l['to'].split('/')[2] for l in links})
-        sources_string = f'({source_count} sites)'
+        sources_string = f'({len(group["sites"])} sites)'
     other_string = ''
     if relation == 'other':
         other_string = '\n'
-        other_counts = {}
-        for link in links:
-            link_to = link['to']
-            other_counts[link_to] = other_counts.get(link_to, 0) + 1
-        other_sorted = sorted(other_counts.items(), key=lambda n: n[1])[::-1]
+        other_sorted = sorted(group['targets'].items(), key=lambda n: n[1])[::-1]
         for link_to, count in other_sorted:
             other_string += f'{count:>8}: {link_to}\n'
     details_string = f'{extensions_string} {sources_string} {other_string}'
     counts = {k['label']: 0 for k in POSSIBLE_LINK_ISSUES.values()}
-    for link in links:
-        for issue in link['issues']:
-            counts[POSSIBLE_LINK_ISSUES[issue]['label']] += 1
+    for issue, count in group['issues'].items():
+        counts[POSSIBLE_LINK_ISSUES[issue]['label']] += count
     print()
     if link_type is not None:
         print(f'{link_type or ""}s ({relation or "all"}):')
@@ -71,11 +180,11 @@ def print_issue_counts(links, link_type=None, relation=None):
         issue_keys = LINK_ISSUE_KEYS_LOOKUP[link_type][relation]
     except KeyError:
         issue_keys = ORDERED_LINK_ISSUE_KEYS
-    details = details_string if len(links) > 0 else ''
-    print(f'{len(links):>6} total {details}')
+    details = details_string if group['total'] > 0 else ''
+    print(f'{group["total"]:>6} total {details}')
     print('  ----------')
     if len(issue_keys) > 0:
-        print(f'{len([l for l in links if len(l["issues"]) == 0]):>6} ok')
+        print(f'{group["no_issues"]:>6} ok')
     for issue in issue_keys:
         count = counts[POSSIBLE_LINK_ISSUES[issue]['label']]
         print(f'{count:>6} {POSSIBLE_LINK_ISSUES[issue]["label"]}')
@@ -85,10 +194,11 @@ def print_link_summary(hub_links, **kwargs):
     'print a summary of verified links'
     print('\n')
     print(' link summary '.upper().center(50, '-'))
-    print_issue_counts(hub_links)
+    stats = get_stats(hub_links)
+    print_issue_counts(stats)
     for link_type, relation_issues in LINK_ISSUE_KEYS_LOOKUP.items():
         for link_relation in relation_issues:
-            print_issue_counts(hub_links, link_type, link_relation)
+            print_issue_counts(stats, link_type, link_relation)
     print()
     max_counts = {
         'link': kwargs.get('max_link_issue_print_count'),
@@ -139,47 +249,56 @@ def print_broken_links(hub_links, max_counts, issue_filter):
         print(f'\n(only links with \'{issue_filter}\' issue displayed)')
 
 
-def print_emoji_summary(hub_emojis, **_kwargs):
+def print_not_shown(total, shown, label):
+    'print the number of issues left out of a capped listing'
+    if total > shown:
+        print(f'+ {total - shown} {label} not shown\n')
+
+
+def print_emoji_summary(hub_emojis, **kwargs):
     'print a summary of verified emoji'
     print('\n')
     print(' emoji summary '.upper().center(50, '-'))
-    unique = {e['emoji'] for e in hub_emojis}
-    print(f'{len(hub_emojis):>6} total ({len(unique)} unique)')
+    group = get_stats(hub_emojis).group()
+    unique = group['names']
+    print(f'{group["total"]:>6} total ({len(unique)} unique)')
     print(f'       {", ".join(unique)}')
     print('  ----------')
-    print(f'{len([e for e in hub_emojis if e["status"] == "ok"]):>6} ok')
+    print(f'{group["ok"]:>6} ok')
     for issue, issue_data in POSSIBLE_EMOJI_ISSUES.items():
-        count = len([e for e in hub_emojis if issue in e["issues"]])
-        print(f'{count:>6} {issue_data["label"]}')
+        print(f'{group["issues"][issue]:>6} {issue_data["label"]}')
     broken_emojis = [e for e in hub_emojis if e['status'] != 'ok']
+    max_count = kwargs.get('max_issue_print_count')
     print()
     if len(broken_emojis) > 0:
         print(color(' broken emojis '.upper().center(50, '-'), 'bold'))
-    for emoji in broken_emojis:
+    for emoji in broken_emojis[:max_count]:
         for key in ['status', 'from', 'line_number', 'emoji', 'issues']:
             value = emoji[key]
             if key == 'emoji':
                 value = color(value)
             print(f'{key:<12}: {value}')
         print()
+    print_not_shown(len(broken_emojis), len(broken_emojis[:max_count]), 'emojis')
     print('\n')
 
 
-def print_toc_page_summary(hub_pages, **_kwargs):
+def print_toc_page_summary(hub_pages, **kwargs):
     'print a summary of toc pages'
     print('\n')
     print(' ToC page summary '.upper().center(50, '-'))
-    print(f'{len(hub_pages):>6} total')
+    group = get_stats(hub_pages).group()
+    print(f'{group["total"]:>6} total')
     print('  ----------')
-    print(f'{len([p for p in hub_pages if p["status"] == "ok"]):>6} ok')
+    print(f'{group["ok"]:>6} ok')
     for issue, issue_data in POSSIBLE_TOC_ISSUES.items():
-        count = len([p for p in hub_pages if issue in p["issues"]])
-        print(f'{count:>6} {issue_data["label"]}')
+        print(f'{group["issues"][issue]:>6} {issue_data["label"]}')
     broken_toc_pages = [p for p in hub_pages if p['status'] != 'ok']
+    max_count = kwargs.get('max_issue_print_count')
     print()
     if len(broken_toc_pages) > 0:
         print(color(' broken ToC pages '.upper().center(50, '-'), 'bold'))
-    for toc_page in broken_toc_pages:
+    for toc_page in broken_toc_pages[:max_count]:
         for key in ['status', 'slug', 'page', 'toc_page_title', 'md_page_title',
                     'section', 'issues']:
             value = toc_page[key]
@@ -189,6 +308,8 @@ def print_toc_page_summary(hub_pages, **_kwargs):
                 value = color(value)
             print(f'{key:<15}: {value}')
         print()
+    print_not_shown(len(broken_toc_pages), len(broken_toc_pages[:max_count]),
+                    'ToC pages')
     print('\n')
 
 
@@ -202,55 +323,140 @@ SUMMARY_FOR = {
 class Summary():
     'gather and print results summary'
 
-    def __init__(self):
+    def __init__(self, results_db=None, issues_only=False, results_dir='results'):
+        self.results_db = results_db
+        self.issues_only = issues_only
+        self.results_dir = results_dir
         self.results = {}
         self.extra_summaries = {}
         self.arbitrary_data = {}
+        self.timings = {}
+        self.costs = {}
         self.exit_code = 0
+        self.max_issues = None
+        self.deadline = None
+        self.issue_count = 0
+        self.stopped = None
+
+    def set_limits(self, max_issues=None, time_budget=None):
+        'stop checking after a number of issues or seconds'
+        self.max_issues = max_issues
+        if time_budget is not None:
+            self.deadline = time.monotonic() + time_budget
+
+    def out_of_time(self):
+        'check if the time budget has been used'
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def stop(self, reason):
+        'stop checking'
+        self.stopped = reason
+        raise StopChecks(reason)
+
+    def check_time(self):
+        'stop checking when the time budget has been used'
+        if self.out_of_time():
+            self.stop('time budget used')
+
+    def count_issues(self, count):
+        'count issues found outside result lists, stopping when the limit is reached'
+        self.issue_count += count
+        if self.max_issues is not None and self.issue_count >= self.max_issues:
+            self.stop(f'{self.issue_count} issues found')
+
+    def count_result(self, result):
+        'stop checking when a limit is reached'
+        if result['status'] != 'ok':
+            self.count_issues(1)
+        self.check_time()
+
+    def new_results(self):
+        'create a result list for a hub'
+        limited = self.max_issues is not None or self.deadline is not None
+        return ResultList(keep_ok=not self.issues_only,
+                          on_append=self.count_result if limited else None)
 
     def add_results(self, key, data):
         'add results'
         self.results[key] = data
         self.save_results(key)
+        if self.results_db is not None:
+            self.results_db.save_results(key, data)
 
     def add_extra_summary(self, hub, string):
         'add extra summary string'
         self.extra_summaries[hub] = self.extra_summaries.get(hub, '') + string
 
+    def add_timing(self, phase, seconds):
+        'add time spent in a phase'
+        self.timings[phase] = self.timings.get(phase, 0) + seconds
+
+    def add_cost(self, key, seconds):
+        'add time spent on a file or hub level check, for scheduling'
+        self.costs[key] = self.costs.get(key, 0) + seconds
+
     def add_arbitrary_data(self, hub, key, data):
         'add arbitrary summary data'
         self.arbitrary_data[hub] = self.arbitrary_data.get(hub, {})
         self.arbitrary_data[hub][key] = data
 
+    def get_hubs(self):
+        'get hubs with results or extra summaries'
+        hubs = []
+        for hub_results in self.results.values():
+            hubs += [hub for hub, results in hub_results.items()
+                     if hub not in hubs
+                     and get_stats(results).group()['total'] > 0]
+        hubs += [hub for hub in self.extra_summaries if hub not in hubs]
+        return hubs
+
     def print(self, hubs=None, **kwargs):
+        'print summary, written to stdout at once'
+        use_color()
+        output = StringIO()
+        with contextlib.redirect_stdout(output):
+            self.print_unbuffered(hubs, **kwargs)
+        sys.stdout.write(output.getvalue())
+        sys.stdout.flush()
+
+    def print_unbuffered(self, hubs=None, **kwargs):
         'print summary'
         if hubs is None:
-            hub_results = self.results[list(self.results.keys())[0]]
-            hubs = [hub for hub, results in hub_results.items()
-                    if len(results) > 0]
+            hubs = self.get_hubs()
         for hub in hubs:
             print(color(get_hub_title(hub), 'bold'))
             print()
             print(self.extra_summaries.get(hub))
             for results_key, results_data in self.results.items():
-                SUMMARY_FOR[results_key](results_data[hub], **kwargs)
+                SUMMARY_FOR[results_key](results_data.get(hub, []), **kwargs)
         print()
+        if self.stopped is not None:
+            print(color(f'Stopped early ({self.stopped}).', 'yellow'))
         if self.exit_code:
             print(color('Issues found.'))
+        elif self.stopped is not None:
+            print(color('No issues found in the checked files.', 'yellow'))
         else:
             print(color('No issues found.', 'green'))
         print()
 
+    def save_json(self, filename, data, compact=False):
+        'save data to a file in the results directory (if there is one)'
+        if self.results_dir is None:
+            return
+        results_dir = get_relative_filename(self.results_dir)
+        os.makedirs(results_dir, exist_ok=True)
+        filepath = os.path.join(results_dir, filename)
+        with open(filepath, 'w') as results_file:
+            if compact:
+                results_file.write(json.dumps(data, separators=(',', ':')))
+            else:
+                results_file.write(json.dumps(data, indent=2))
+
     def save_results(self, results_key):
         'save results to file'
-        results_dir = get_relative_filename('results')
-        if not os.path.exists(results_dir):
-            os.mkdir(results_dir)
-
         results = self.results[results_key]
-        filename = os.path.join(results_dir, f'{results_key}_results.json')
-        with open(filename, 'w') as results_file:
-            results_file.write(json.dumps(results, indent=2))
+        self.save_json(f'{results_key}_results.json', results)
 
         issues = {}
         for hub, results in results.items():
@@ -260,6 +466,4 @@ class Summary():
                     issues[hub].append(result)
             if len(issues[hub]) > 0:
                 self.exit_code = 1
-        filename = os.path.join(results_dir, f'{results_key}_issues.json')
-        with open(filename, 'w') as results_file:
-            results_file.write(json.dumps(issues, indent=2))
+        self.save_json(f'{results_key}_issues.json', issues)
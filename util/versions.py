@@ -3,12 +3,30 @@
 'Version utilities.'
 
 import os
+import sys
 import json
 from util.walk import is_content_dir
 
 
+COLOR = {'enabled': None}
+
+
+def use_color():
+    'check if text should be colored (when output is a terminal, by default)'
+    if COLOR['enabled'] is None:
+        COLOR['enabled'] = sys.stdout.isatty() and 'NO_COLOR' not in os.environ
+    return COLOR['enabled']
+
+
+def set_color(enabled):
+    'always (True), never (False), or automatically (None) color text'
+    COLOR['enabled'] = enabled
+
+
 def color(text, text_color='red'):
     'color terminal text'
+    if not use_color():
+        return f'{text}'
     colors = {
         'red': '\033[91m',
         'yellow': '\033[93m',
@@ -19,6 +37,9 @@ def color(text, text_color='red'):
     return f'{colors[text_color]}{text}{colors["end"]}'
 
 
+CONTENT_VERSIONS = {}
+
+
 def get_version_from_root(root, index=2):
     'get doc version'
     version = root.split('/')[index]
@@ -27,23 +48,44 @@ def get_version_from_root(root, index=2):
     return float(version.strip('v'))
 
 
-def get_content_versions(hub):
-    'get version content directories'
-    hub_dir = f'farmbot-{hub}'
-    if not os.path.exists(hub_dir):
-        return []
-    sub_dirs = os.listdir(hub_dir)
-    return [get_version_from_root(p, 0) for p in sub_dirs if is_content_dir(p)]
+def split_hub_path(path):
+    'split a path into the folder containing the hub, the hub directory, and the rest'
+    parts = path.split('/')
+    for i, part in enumerate(parts):
+        if part.startswith('farmbot-'):
+            return '/'.join(parts[:i]) or '.', part, '/'.join(parts[i + 1:])
+    raise ValueError(f'no farmbot-<hub> directory in {path!r}')
 
 
-def genesis_stable_versions():
+def get_content_versions(hub, folder='.'):
+    'get version content directories'
+    key = (os.path.normpath(folder), hub)
+    if key not in CONTENT_VERSIONS:
+        hub_dir = os.path.join(folder, f'farmbot-{hub}')
+        if not os.path.exists(hub_dir):
+            CONTENT_VERSIONS[key] = {}
+        else:
+            sub_dirs = os.listdir(hub_dir)
+            CONTENT_VERSIONS[key] = {get_version_from_root(p, 0): p
+                                     for p in sub_dirs if is_content_dir(p)}
+    return list(CONTENT_VERSIONS[key])
+
+
+def get_version_name(hub, version_number, folder='.'):
+    'get the directory name of a version, e.g. v1 for 1.0'
+    get_content_versions(hub, folder)
+    name = CONTENT_VERSIONS[(os.path.normpath(folder), hub)].get(version_number)
+    return name or get_version_string(hub, version_number)
+
+
+def genesis_stable_versions(folder='.'):
     'get genesis hub stable versions'
-    return sorted([v for v in get_content_versions('genesis') if v > 1.1])
+    return sorted([v for v in get_content_versions('genesis', folder) if v > 1.1])
 
 
-def latest_stable_versions(hub):
+def latest_stable_versions(hub, folder='.'):
     'Get latest stable versions.'
-    versions = get_content_versions(hub)
+    versions = get_content_versions(hub, folder)
     max_version = [max(versions)] if len(versions) > 0 else []
     return max_version
 
@@ -85,16 +127,74 @@ HUBS_WITH_UNSTABLE_VERSIONS = [
 ]
 
 HUB_STABLE_VERSIONS = {}
-for hub_name in HUBS_WITH_UNSTABLE_VERSIONS:
-    if hub_name == 'genesis':
-        HUB_STABLE_VERSIONS[hub_name] = genesis_stable_versions()
-    else:
-        HUB_STABLE_VERSIONS[hub_name] = latest_stable_versions(hub_name)
 
-print('All versions in unlisted hubs and versions below should be error-free:')
-print(json.dumps(HUB_STABLE_VERSIONS, indent=2))
+
+def get_stable_versions(hub, folder='.'):
+    'get stable versions of a hub with unstable versions'
+    key = (os.path.normpath(folder), hub)
+    if key not in HUB_STABLE_VERSIONS:
+        if hub == 'genesis':
+            HUB_STABLE_VERSIONS[key] = genesis_stable_versions(folder)
+        else:
+            HUB_STABLE_VERSIONS[key] = latest_stable_versions(hub, folder)
+    return HUB_STABLE_VERSIONS[key]
 
 
-def stable_version_lookup():
+def stable_version_lookup(hubs=None, folder='.'):
     'get all stable versions for documentation'
-    return HUB_STABLE_VERSIONS
+    if hubs is None:
+        hubs = HUBS_WITH_UNSTABLE_VERSIONS
+    return {hub: get_stable_versions(hub, folder) for hub in hubs
+            if hub in HUBS_WITH_UNSTABLE_VERSIONS}
+
+
+FULL = 'full'
+LIGHT = 'light'
+SKIP = 'skip'
+
+
+class VersionPolicy():
+    'Check level of hub versions: full, light (no section checks), or skip.'
+
+    def __init__(self, unstable=LIGHT, only_versions=None, folder='.'):
+        self.unstable = unstable
+        self.only_versions = only_versions
+        self.folder = folder
+        self.levels = {}
+
+    def level(self, hub, version_name):
+        'get the check level of a version directory'
+        key = (hub, version_name)
+        if key not in self.levels:
+            version = get_version_from_root(version_name, 0)
+            stable = stable_version_lookup([hub], self.folder).get(hub)
+            if self.only_versions is not None and version not in self.only_versions:
+                self.levels[key] = SKIP
+            elif stable is not None and version not in stable:
+                self.levels[key] = self.unstable
+            else:
+                self.levels[key] = FULL
+        return self.levels[key]
+
+    def include(self, hub):
+        'get a filter for version directories that should be checked'
+        return lambda version_name: self.level(hub, version_name) != SKIP
+
+    def include_full(self, hub):
+        'get a filter for version directories that should be fully checked'
+        return lambda version_name: self.level(hub, version_name) == FULL
+
+    def versions_by_level(self, hub):
+        'get the sets of hub versions to check fully, lightly, or skip'
+        by_level = {FULL: set(), LIGHT: set(), SKIP: set()}
+        for version in get_content_versions(hub, self.folder):
+            version_name = get_version_name(hub, version, self.folder)
+            by_level[self.level(hub, version_name)].add(version_name)
+        return by_level
+
+
+def print_stable_versions(hubs=None, folder='.'):
+    'print stable versions of hubs with unstable versions'
+    print('All versions in unlisted hubs and versions below should be error-free:',
+          file=sys.stderr)
+    print(json.dumps(stable_version_lookup(hubs, folder), indent=2), file=sys.stderr)
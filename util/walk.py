@@ -3,6 +3,9 @@
 'Directory walking utilities.'
 
 import os
+import sys
+import time
+import hashlib
 
 
 def get_local_root(folder, root):
@@ -48,7 +51,7 @@ def print_dir(local_root, verbose=False):
     'print a directory name with indentation'
     if not verbose:
         if is_version_name(local_root):
-            print(local_root, end=' ', flush=True)
+            print(local_root, end=' ', flush=sys.stdout.isatty())
         return
     indent = get_indent(local_root)
     if is_version_name(local_root):
@@ -57,26 +60,72 @@ def print_dir(local_root, verbose=False):
         print(f'{indent}{local_root}')
 
 
-def walk_through_files(folder, directory, parse_lines, verbose=False, quiet=False):
-    'use parse_lines on the lines of each markdown file in a directory'
-    for root, _dirs, files in sorted(os.walk(directory)):
-        local_root = get_local_root(folder, root)
-        if not is_content_dir(local_root):
+def walk_through_files(folder, directory, parse_lines, verbose=False, quiet=False,
+                       include_version=None, include_file=None, summary=None):
+    'use parse_lines on the lines of each markdown file, recording its cost in summary'
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        if root == directory:
+            dirs[:] = [d for d in dirs if is_version_name(d)
+                       and (include_version is None or include_version(d))]
             continue
+        local_root = get_local_root(folder, root)
         indent = get_indent(local_root)
         if not quiet:
             print_dir(local_root, verbose)
-        files = [f for f in files if f.endswith('.md')]
+        files = [f for f in files if f.endswith('.md')
+                 and (include_file is None or include_file(root, f))]
         for filename in files:
             if not quiet and verbose:
                 print(f'{indent * 2}{filename}')
-            with open(os.path.join(root, filename), 'r') as md_file:
+            filepath = os.path.join(root, filename)
+            start = time.perf_counter()
+            with open(filepath, 'r') as md_file:
                 lines = md_file.readlines()
                 parse_lines(root, filename, lines)
+            if summary is not None:
+                summary.add_cost(os.path.normpath(filepath),
+                               time.perf_counter() - start)
     if not quiet:
         print()
 
 
+class ContentCache():
+    'Results of path independent work, shared by files with identical lines.'
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.entries = {}
+        self.stats = {'files': 0, 'reused': 0}
+
+    def reset_stats(self):
+        'start counting files again'
+        self.stats = {'files': 0, 'reused': 0}
+
+    def get(self, lines, extract):
+        'get extract(lines), computed once per distinct file content'
+        key = hashlib.blake2b(''.join(lines).encode(), digest_size=16).digest()
+        self.stats['files'] += 1
+        value = self.entries.get(key)
+        if value is None:
+            if len(self.entries) >= self.max_size:
+                self.entries = {}
+            value = self.entries[key] = extract(lines)
+        else:
+            self.stats['reused'] += 1
+        return value
+
+
+def get_reuse_summary(stats):
+    'get the identical file content summary string'
+    reused = stats['reused']
+    total = stats['files']
+    metrics_string = ' identical files '.upper().center(50, '-')
+    metrics_string += f'\n    {reused}/{total} files reused results of identical content'
+    metrics_string += f' ({round(100 * reused / (total or 1), 2)}%)\n\n'
+    return metrics_string
+
+
 def get_relative_filename(filename):
     'get a file path relative to script folder'
     script_folder = os.path.dirname(os.path.realpath(__file__))
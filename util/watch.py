@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+'Watch documentation files and re-check them when they change.'
+
+import os
+import time
+from util.workspace import Workspace, format_issue
+from util.versions import color
+
+WATCHED_EXTENSIONS = ('.md', '.yml')
+
+
+def snapshot(directories):
+    'get modification times of watched files'
+    mtimes = {}
+    for directory in directories:
+        for root, _dirs, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith(WATCHED_EXTENSIONS):
+                    filepath = os.path.join(root, filename)
+                    try:
+                        mtimes[filepath] = os.stat(filepath).st_mtime_ns
+                    except FileNotFoundError:
+                        continue
+    return mtimes
+
+
+class PollingWatcher():
+    'Detect changed files by comparing modification times.'
+
+    def __init__(self, directories, interval=0.25):
+        self.directories = directories
+        self.interval = interval
+        self.mtimes = snapshot(directories)
+
+    def changes(self):
+        'wait for and return changed file paths'
+        while True:
+            time.sleep(self.interval)
+            mtimes = snapshot(self.directories)
+            changed = {path for path, mtime in mtimes.items()
+                       if self.mtimes.get(path) != mtime}
+            changed |= set(self.mtimes) - set(mtimes)
+            self.mtimes = mtimes
+            if len(changed) > 0:
+                return sorted(changed)
+
+
+class InotifyWatcher():
+    'Detect changed files with inotify events. (requires inotify_simple)'
+
+    def __init__(self, directories):
+        from inotify_simple import INotify, flags
+        self.flags = flags
+        self.inotify = INotify()
+        self.mask = (flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM
+                     | flags.CREATE | flags.DELETE)
+        self.watched = {}
+        for directory in directories:
+            for root, _dirs, _files in os.walk(directory):
+                self.add_watch(root)
+
+    def add_watch(self, directory):
+        'watch a directory for changes'
+        watch_descriptor = self.inotify.add_watch(directory, self.mask)
+        self.watched[watch_descriptor] = directory
+
+    def changes(self):
+        'wait for and return changed file paths'
+        while True:
+            changed = set()
+            for event in self.inotify.read(timeout=1000, read_delay=20):
+                directory = self.watched.get(event.wd)
+                if directory is None:
+                    continue
+                path = os.path.join(directory, event.name)
+                if event.mask & self.flags.ISDIR:
+                    if event.mask & (self.flags.CREATE | self.flags.MOVED_TO):
+                        self.add_watch(path)
+                    continue
+                if path.endswith(WATCHED_EXTENSIONS):
+                    changed.add(path)
+            if len(changed) > 0:
+                return sorted(changed)
+
+
+def get_watcher(directories):
+    'use inotify events when available, otherwise poll'
+    try:
+        return InotifyWatcher(directories)
+    except (ImportError, OSError):
+        return PollingWatcher(directories)
+
+
+def print_checked(checked, elapsed):
+    'print issues for re-checked files'
+    for filepath, issues in checked.items():
+        icon = color('X') if len(issues) > 0 else color('|', 'green')
+        print(f'{icon} {filepath} ({len(issues)} issues, {elapsed * 1000:.1f} ms)')
+        for issue in issues:
+            print(f'    {format_issue(issue)}')
+
+
+def watch(folder=None, hubs=None):
+    'check files again whenever they are saved'
+    start = time.perf_counter()
+    workspace = Workspace(folder, hubs)
+    workspace.load()
+    watcher = get_watcher(workspace.hub_dirs())
+    file_count = len(workspace.manifest)
+    issue_count = sum(len(workspace.issues(path)) for path in workspace.manifest)
+    print(f'watching {file_count} files ({issue_count} issues) '
+          f'with {type(watcher).__name__} '
+          f'(loaded in {time.perf_counter() - start:.2f} s)')
+    while True:
+        for path in watcher.changes():
+            checked, elapsed = workspace.recheck(path)
+            print_checked(checked, elapsed)
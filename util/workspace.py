@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+'In-memory documentation workspace for incremental checks.'
+
+import os
+import time
+from util import versions, walk
+from util.check_links import LinkChecker, get_link_relation
+from util.check_emoji import EmojiChecker
+from util.check_tocs import TocChecker
+from util.summary import Summary
+
+
+def get_title_line(lines):
+    'get front matter title line'
+    return lines[1] if len(lines) > 1 else ''
+
+
+def format_issue(record):
+    'format a problem record as a single line'
+    line_number = record.get('line_number')
+    location = record.get('from') or record.get('page')
+    if line_number is not None:
+        location += f':{line_number + 1}'
+    target = record.get('to') or record.get('emoji') or record.get('slug')
+    return f'{location}: {record["status"]} ({target})'
+
+
+class Workspace():
+    'Hold hub indexes in memory and re-check single files. (default directory: current)'
+
+    def __init__(self, folder=None, hubs=None):
+        self.folder = folder or '.'
+        self.hubs = hubs or versions.HUBS
+        self.summary = Summary()
+        self.link_checker = LinkChecker(self.summary, self.folder)
+        self.emoji_checker = EmojiChecker(self.summary, self.folder)
+        self.toc_checker = TocChecker(self.summary, self.folder)
+        self.toc_checker.quiet = True
+        self.manifest = {}
+        self.titles = {}
+        self.file_results = {}
+        self.link_targets = {}
+        self.dependents = {}
+
+    def hub_dir(self, hub):
+        'get hub directory'
+        return f'{self.folder}/farmbot-{hub}'
+
+    def hub_dirs(self):
+        'get existing hub directories'
+        return [self.hub_dir(hub) for hub in self.hubs
+                if os.path.exists(self.hub_dir(hub))]
+
+    def normalize(self, path):
+        'get a path in the same form the directory walk provides'
+        return os.path.join(self.folder, os.path.relpath(path, self.folder))
+
+    def get_hub(self, path):
+        'get the hub a path belongs to'
+        hub_dir = os.path.relpath(path, self.folder).split(os.sep)[0]
+        hub = versions.get_hub_from_dir(hub_dir)
+        return hub if hub in self.hubs else None
+
+    def is_content_file(self, path):
+        'check if a path is a markdown file in a version directory'
+        parts = os.path.relpath(path, self.folder).split(os.sep)
+        return (path.endswith('.md') and len(parts) > 2
+                and walk.is_content_dir(parts[1]))
+
+    def set_hub(self, hub):
+        'point checkers at a hub'
+        for checker in [self.link_checker, self.emoji_checker]:
+            checker.current_hub = hub
+            checker.current_hub_path = self.hub_dir(hub)
+
+    def load(self):
+        'index and check all hub files'
+        for hub in self.hubs:
+            self.load_hub(hub)
+
+    def load_hub(self, hub):
+        'index and check all files in a hub'
+        for filepath in [p for p, h in self.manifest.items() if h == hub]:
+            self.manifest.pop(filepath)
+            self.file_results.pop(filepath, None)
+            self._update_dependents(filepath, [])
+        if not self.link_checker.start_hub(hub):
+            return False
+        self.emoji_checker.start_hub(hub)
+        self.link_checker.index_sections()
+        walk.walk_through_files(
+            self.folder, self.hub_dir(hub), self._check_loaded_file, quiet=True,
+            include_version=self.link_checker.version_policy.include(hub))
+        self.summary.extra_summaries[hub] = ''
+        self.toc_checker.check_hub(hub)
+        return True
+
+    def _check_loaded_file(self, root, filename, lines):
+        filepath = os.path.join(root, filename)
+        self.manifest[filepath] = self.get_hub(filepath)
+        self.titles[filepath] = get_title_line(lines)
+        self.check_lines(filepath, lines)
+
+    def check_lines(self, filepath, lines):
+        'check the lines of a single markdown file'
+        hub = self.get_hub(filepath)
+        self.set_hub(hub)
+        root, filename = os.path.split(filepath)
+        self.link_checker.links[hub] = []
+        self.link_checker.check_file(root, filename, lines)
+        self.emoji_checker.emojis[hub] = []
+        self.emoji_checker.check_file(root, filename, lines)
+        links = self.link_checker.links[hub]
+        self.file_results[filepath] = {
+            'links': links,
+            'emoji': self.emoji_checker.emojis[hub],
+        }
+        self._update_dependents(filepath, links)
+        return self.issues(filepath)
+
+    def _update_dependents(self, filepath, links):
+        for target in self.link_targets.get(filepath, set()):
+            self.dependents.get(target, set()).discard(filepath)
+        root, filename = os.path.split(filepath)
+        targets = set()
+        for link in links:
+            if get_link_relation(link['to']) != 'relative':
+                continue
+            relative_path = link['to'].split('#')[0] or filename
+            targets.add(os.path.realpath(os.sep.join([root, relative_path])))
+        self.link_targets[filepath] = targets
+        for target in targets:
+            self.dependents.setdefault(target, set()).add(filepath)
+
+    def issues(self, filepath):
+        'get problem records for a file'
+        results = self.file_results.get(filepath, {})
+        problems = [r for key in ['links', 'emoji'] for r in results.get(key, [])
+                    if r['status'] != 'ok']
+        hub = self.get_hub(filepath)
+        problems += [p for p in self.toc_checker.pages.get(hub, [])
+                     if p['page'] == filepath and p['status'] != 'ok']
+        return problems
+
+    def anchors(self, path, link=None):
+        'get section anchors of a markdown file or of a link target'
+        filepath = self.normalize(path)
+        if link is not None:
+            root, filename = os.path.split(filepath)
+            filepath = os.sep.join([root, link.split('#')[0] or filename])
+        hub = self.get_hub(filepath)
+        hub_index = self.link_checker.section_index.get(hub, {})
+        return hub_index.get(os.path.realpath(filepath), [])
+
+    def recheck_toc(self, hub):
+        'check hub tocs and redirects again'
+        self.summary.extra_summaries[hub] = ''
+        self.toc_checker.check_hub(hub)
+
+    def recheck(self, path, lines=None):
+        'check a changed file and its dependents'
+        start = time.perf_counter()
+        filepath = self.normalize(path)
+        hub = self.get_hub(filepath)
+        checked = {}
+        if hub is None:
+            return checked, time.perf_counter() - start
+        if not self.is_content_file(filepath):
+            self.recheck_toc(hub)
+            return checked, time.perf_counter() - start
+        self.set_hub(hub)
+        root, filename = os.path.split(filepath)
+        file_key = os.path.realpath(filepath)
+        section_index = self.link_checker.section_index[hub]
+        old_sections = section_index.get(file_key)
+        existed = filepath in self.manifest
+        if lines is None and os.path.exists(filepath):
+            with open(filepath, 'r') as md_file:
+                lines = md_file.readlines()
+        if lines is None:
+            self.manifest.pop(filepath, None)
+            self.file_results.pop(filepath, None)
+            self._update_dependents(filepath, [])
+            section_index.pop(file_key, None)
+            self.link_checker.clear_resolution_cache()
+            checked[filepath] = []
+        else:
+            self.manifest[filepath] = hub
+            self.link_checker.index_file(root, filename, lines)
+            checked[filepath] = self.check_lines(filepath, lines)
+        created_or_removed = existed != (lines is not None)
+        if created_or_removed or section_index.get(file_key) != old_sections:
+            for dependent in sorted(self.dependents.get(file_key, set())):
+                if dependent != filepath and os.path.exists(dependent):
+                    with open(dependent, 'r') as md_file:
+                        dependent_lines = md_file.readlines()
+                    checked[dependent] = self.check_lines(
+                        dependent, dependent_lines)
+        title = get_title_line(lines or [])
+        if created_or_removed or self.titles.get(filepath) != title:
+            if lines is None:
+                self.titles.pop(filepath, None)
+            else:
+                self.titles[filepath] = title
+            self.recheck_toc(hub)
+            checked[filepath] = self.issues(filepath)
+        return checked, time.perf_counter() - start
+
+    def check_unsaved(self, path, lines):
+        'check unsaved text of a file, then restore the state of the saved file'
+        checked, elapsed = self.recheck(path, lines)
+        self.recheck(path)
+        return checked, elapsed